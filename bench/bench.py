@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+'''
+Benchmarks of the hot paths, with the data in test/data scaled up to realistic sizes.
+The results are written as JSON, and can be compared with the results of another version, e.g.
+    python bench/bench.py -o new.json --compare old.json
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+import numpy as np
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root_dir)
+
+from qtgassol import clock
+from qtgassol.clock import SimulatedClock
+from qtgassol.pipeline import load_log
+from qtgassol.timeseries import find_anomaly_t, find_anomaly_p, rolling_filter_p, find_steps, interp_anomaly
+from qtgassol.device import Thermostat, DummyT, DummyP, FlukeThermometer, GeManometer, HuberThermostat
+from qtgassol.emulator import FlukeEmulator, GeEmulator, HuberEmulator
+from qtgassol.buffer import RingBuffer
+from qtgassol.bus import BusWriter
+
+data_dir = os.path.join(root_dir, 'test', 'data')
+
+parser = argparse.ArgumentParser(description='Benchmark the hot paths and write the results as JSON',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('-n', '--points', type=int, default=1000000,
+                    help='Number of points the data in test/data are scaled up to')
+parser.add_argument('-r', '--repeat', type=int, default=5,
+                    help='Number of times each benchmark is repeated')
+parser.add_argument('-k', '--select', type=str, default='',
+                    help='Only run the benchmarks whose names contain this string')
+parser.add_argument('-o', '--output', type=str, default='bench.json',
+                    help='Output filename for the results')
+parser.add_argument('--compare', type=str, default='',
+                    help='Results of another version to compare with')
+
+
+def scaled_data(n):
+    '''
+    The points of all files in test/data joined one after another, and repeated until there are n points
+    '''
+    times, ts, ps = [], [], []
+    t_end = 0
+    for filename in sorted(os.listdir(data_dir)):
+        time_array, t_array, p_array = load_log(os.path.join(data_dir, filename))
+        times.append(time_array - time_array[0] + t_end)
+        ts.append(t_array)
+        ps.append(p_array)
+        t_end = times[-1][-1] + 5
+    time_array, t_array, p_array = map(np.concatenate, (times, ts, ps))
+
+    repeat = int(np.ceil(n / len(time_array)))
+    span = time_array[-1] + 5
+    time_array = (time_array + span * np.arange(repeat)[:, None]).ravel()[:n] + 1.6E9
+    return time_array, np.tile(t_array, repeat)[:n], np.tile(p_array, repeat)[:n]
+
+
+def write_log(filename, time_array, t_array, p_array):
+    '''
+    Write the points in the format of MainUI
+    '''
+    stamps = np.datetime_as_string(time_array.astype('datetime64[s]'))
+    with open(filename, 'w') as f:
+        f.write('# File opened at %s\n' % datetime.now())
+        for stamp, t, p in zip(stamps, t_array, p_array):
+            f.write('%-20s %10.3f %10.2f\n' % (stamp[2:].replace('T', ' '), t, p))
+
+
+def region_average(time_array, t_array, p_array, bound):
+    '''
+    The statistics in a region as in MainUI.calc_average()
+    '''
+    idx = np.where((time_array > bound[0] - 0.001) & (time_array < bound[1] + 0.001))[0]
+    t_array = t_array[idx]
+    p_array = p_array[idx]
+    mask_t = np.ones(len(idx), bool)
+    mask_t[find_anomaly_t(t_array)] = False
+    mask_p = np.ones(len(idx), bool)
+    mask_p[find_anomaly_p(p_array)] = False
+    return np.mean(t_array[mask_t]), np.std(t_array[mask_t]), np.mean(p_array[mask_p]), np.std(p_array[mask_p])
+
+
+def bench_cases(n, tmp_dir):
+    '''
+    Yield (name, number of items per call, function to time, function to clean up or None)
+    '''
+    time_array, t_array, p_array = scaled_data(n)
+
+    filename = os.path.join(tmp_dir, 'log.txt')
+    write_log(filename, time_array, t_array, p_array)
+    yield 'parse_log', n, lambda: load_log(filename), None
+
+    bound = (time_array[n // 4], time_array[3 * n // 4])
+    yield 'region_average', n // 2, lambda: region_average(time_array, t_array, p_array, bound), None
+
+    yield 'find_anomaly_t', n, lambda: find_anomaly_t(t_array), None
+    yield 'find_anomaly_p', n, lambda: find_anomaly_p(p_array), None
+
+    def live_filter():
+        rolling = rolling_filter_p()
+        for p in p_array[:100000]:
+            rolling.check(p)
+
+    yield 'rolling_filter_p', 100000, live_filter, None
+
+    yield 'find_steps', n, lambda: find_steps(interp_anomaly(p_array, find_anomaly_p(p_array))), None
+
+    # the rolling window of the matplotlib front-ends with a large maxpt
+    def rolling_window():
+        points = RingBuffer(10000, 3)
+        for point in zip(time_array[:100000], t_array[:100000], p_array[:100000]):
+            points.append(point)
+            xs, ts, ps = points.view()
+
+    yield 'ring_buffer_window', 100000, rolling_window, None
+
+    bus = BusWriter('gassol_bench_%i' % os.getpid(), ['T', 'P'], 10000)
+
+    def publish():
+        for point in zip(time_array[:100000], t_array[:100000], p_array[:100000]):
+            bus.append(point[0], point[1:])
+
+    yield 'bus_append', 100000, publish, bus.close
+
+    # a program of 1000 ramps, evaluated once per point of a day
+    thermo = Thermostat(None)
+    thermo.preset('30, 10, 50; ' + '; '.join('10, %i' % (30 + i % 20) for i in range(999)))
+    t0 = thermo._timestamp_temp[0][0]
+    timestamps = t0 + np.linspace(0, thermo._timestamp_temp[-1][0] - t0, 17280)
+    yield 'get_preset', len(timestamps), lambda: [thermo.get_preset(t) for t in timestamps], None
+
+    case = bench_step(time_array, t_array, p_array, tmp_dir)
+    if case is not None:
+        yield case
+
+    # the read loops poll every 0.1 s, which is skipped with a simulated clock to time the overhead
+    for name, cls_emu, cls_dev, value in (('fluke', FlukeEmulator, FlukeThermometer, 30.0),
+                                          ('ge', GeEmulator, GeManometer, 962.43),
+                                          ('huber', HuberEmulator, HuberThermostat, 25.0)):
+        emu = cls_emu(value, seed=0)
+        emu.start()
+        previous = clock.set_clock(SimulatedClock())
+        dev = cls_dev(emu.port)
+        clock.set_clock(previous)
+
+        def read(dev=dev):
+            previous = clock.set_clock(SimulatedClock())
+            try:
+                for _ in range(100):
+                    dev.read()
+            finally:
+                clock.set_clock(previous)
+
+        yield 'read_%s_emulated' % name, 100, read, emu.close
+
+
+def bench_step(time_array, t_array, p_array, tmp_dir):
+    '''
+    One MainUI.step() with the data of n points in history. None if PyQt5 or pyqtgraph is not installed
+    '''
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5 import QtWidgets
+        from qtgassol.ui import MainUI
+    except ImportError:
+        return None
+
+    global _app
+    _app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    ui = MainUI(DummyT(), DummyP(), None, os.path.join(tmp_dir, 'step.txt'), 5.0)
+    for point in zip(time_array, t_array, p_array):
+        ui.data.append(point[0], point[1:])
+    ui._file = open(ui.inp_file.text(), 'w')
+
+    def step():
+        for _ in range(10):
+            ui.step()
+
+    return 'mainui_step', 10, step, ui._file.close
+
+
+def run(opt):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, n_items, func, cleanup in bench_cases(opt.points, tmp_dir):
+            if opt.select not in name:
+                if cleanup is not None:
+                    cleanup()
+                continue
+
+            durations = []
+            for _ in range(opt.repeat):
+                t0 = time.perf_counter()
+                func()
+                durations.append(time.perf_counter() - t0)
+            if cleanup is not None:
+                cleanup()
+
+            results[name] = {'n': n_items, 'repeat': opt.repeat, 'min': min(durations),
+                             'median': float(np.median(durations)), 'max': max(durations),
+                             'per_item': min(durations) / n_items}
+            print('%-24s %10i %10.4f s %12.3f us/item' % (name, n_items, min(durations),
+                                                            min(durations) / n_items * 1E6))
+    return results
+
+
+def git_version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=root_dir,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare(results, filename):
+    '''
+    Print the ratio of the min durations to the results of another version
+    '''
+    with open(filename) as f:
+        old = json.load(f)
+    print('%-24s %10s %10s %8s' % ('# Compared with ' + old['meta'].get('version', filename), 'old(s)', 'new(s)',
+                                   'ratio'))
+    for name, res in results.items():
+        if name in old['results']:
+            res_old = old['results'][name]
+            print('%-24s %10.4f %10.4f %8.2f' % (name, res_old['min'], res['min'], res['min'] / res_old['min']))
+
+
+if __name__ == '__main__':
+    opt = parser.parse_args()
+    results = run(opt)
+    meta = {'version': git_version(), 'date': datetime.now().isoformat(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'machine': platform.machine(), 'points': opt.points}
+    with open(opt.output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    if opt.compare:
+        compare(results, opt.compare)
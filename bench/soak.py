@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+'''
+Soak test: drive the acquisition for a long simulated time, e.g. a week of sampling, as fast as possible.
+RSS, the latency of each tick and the pauses of garbage collection are recorded over time,
+and the run fails if their growth exceeds the budgets, e.g.
+    python bench/soak.py --days 7 --dt 5 -o soak.json
+MainUI is driven if PyQt5 and pyqtgraph are installed, otherwise the parts of MainUI.step() without GUI.
+'''
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime
+import numpy as np
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root_dir)
+
+from qtgassol import clock
+from qtgassol.clock import SimulatedClock
+from qtgassol.channel import default_channels, ColumnStore
+from qtgassol.device import DummyT, DummyP, FlukeThermometer, GeManometer
+from qtgassol.emulator import FlukeEmulator, GeEmulator
+from qtgassol.timeseries import rolling_filter_t, rolling_filter_p, WindowedStats
+from qtgassol.pipeline import format_stamps
+
+parser = argparse.ArgumentParser(description='Drive the acquisition for a long simulated time and check the growth '
+                                             'of memory and latency',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('--days', type=float, default=7.0,
+                    help='Simulated duration in days')
+parser.add_argument('--dt', type=float, default=5.0,
+                    help='Simulated time interval between ticks (s)')
+parser.add_argument('--emulate', action='store_true',
+                    help='Read emulated devices over pseudo terminals instead of dummy devices')
+parser.add_argument('--no-gui', action='store_true',
+                    help='Drive the parts of MainUI.step() without GUI even if PyQt5 is installed')
+parser.add_argument('--window', type=int, default=0,
+                    help='Number of last points kept in memory as MainUI --window. 0 means keep all the points')
+parser.add_argument('--samples', type=int, default=200,
+                    help='Number of times RSS and latency are recorded over the run')
+parser.add_argument('--max-rss-growth', type=float, default=100.0,
+                    help='Budget of RSS growth (MB) from the end of the first tenth of the run to the end')
+parser.add_argument('--max-latency-growth', type=float, default=3.0,
+                    help='Budget of the ratio of the median tick latency of the last tenth to that of the first tenth')
+parser.add_argument('--max-latency', type=float, default=500.0,
+                    help='Budget of the 99th percentile of tick latency (ms)')
+parser.add_argument('--max-gc-pause', type=float, default=200.0,
+                    help='Budget of the longest pause of garbage collection (ms)')
+parser.add_argument('-o', '--output', type=str, default='soak.json',
+                    help='Output filename for the timeline and the result')
+
+
+def rss():
+    '''
+    Resident set size in MB
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class GcMonitor(object):
+    '''
+    Record the number of collections and the duration of every pause of garbage collection
+    '''
+
+    def __init__(self):
+        self.pauses = []
+        self._t0 = None
+        gc.callbacks.append(self._callback)
+
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._t0 = time.perf_counter()
+        elif self._t0 is not None:
+            self.pauses.append(time.perf_counter() - self._t0)
+
+    def close(self):
+        gc.callbacks.remove(self._callback)
+
+    @property
+    def collections(self):
+        return [s['collections'] for s in gc.get_stats()]
+
+
+class CoreDriver(object):
+    '''
+    The parts of MainUI.step() without GUI: reading, logging, storing and the live analysis
+    '''
+
+    def __init__(self, thermometer, manometer, output, window=None):
+        self.channels = default_channels(thermometer, manometer)
+        self.data = ColumnStore([ch.name for ch in self.channels], max_len=window)
+        self._file = open(output, 'w')
+        self._filter_t = rolling_filter_t()
+        self._filter_p = rolling_filter_p()
+        self._live_t = WindowedStats(600)
+        self._live_p = WindowedStats(600)
+
+    def step(self):
+        stamps, values = zip(*[ch.read_stamped() for ch in self.channels])
+        timestamp = sum(stamps) / len(stamps)
+        self._file.write('%-20s' % datetime.fromtimestamp(timestamp).strftime('%y-%m-%d %H:%M:%S')
+                         + ''.join(' ' + ch.format(val) for ch, val in zip(self.channels, values)) + '\n')
+        self._file.write(format_stamps(timestamp, stamps) + '\n')
+        self.data.append(timestamp, values, stamps)
+        t, p = values
+        self._live_t.update(t, timestamp)
+        self._live_p.update(p, timestamp)
+        self._filter_t.check(t)
+        self._filter_p.check(p)
+
+    def close(self):
+        self._file.close()
+
+
+class GuiDriver(object):
+    '''
+    MainUI with the events processed after every step, so that the plots are redrawn
+    '''
+
+    def __init__(self, thermometer, manometer, output, window=None):
+        from PyQt5 import QtWidgets
+        from qtgassol.ui import MainUI
+
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        self.ui = MainUI(thermometer, manometer, None, output, 5.0, external_timer=True, window=window)
+        self.ui.show()
+        self.ui.start()
+
+    def step(self):
+        self.ui.step()
+        self.app.processEvents()
+
+    def close(self):
+        self.ui.pause()
+        self.ui.close()
+
+
+def make_driver(opt, output):
+    if opt.emulate:
+        emulators = [FlukeEmulator(lambda t: 30 + np.sin(t / 3600), noise=0.002),
+                     GeEmulator(lambda t: 700 + 50 * np.sin(t / 7200), noise=0.05)]
+        for emu in emulators:
+            emu.start()
+        devices = [FlukeThermometer(emulators[0].port), GeManometer(emulators[1].port)]
+    else:
+        emulators = []
+        devices = [DummyT(), DummyP()]
+
+    driver = None
+    if not opt.no_gui:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        try:
+            driver = GuiDriver(devices[0], devices[1], output, opt.window or None)
+        except ImportError:
+            print('PyQt5 or pyqtgraph not installed, driving without GUI')
+    if driver is None:
+        driver = CoreDriver(devices[0], devices[1], output, opt.window or None)
+    return driver, emulators
+
+
+def soak(opt):
+    n_ticks = int(opt.days * 86400 / opt.dt)
+    sample_every = max(n_ticks // opt.samples, 1)
+
+    sim = SimulatedClock()
+    previous = clock.set_clock(sim)
+    timeline = []
+    latencies = np.empty(n_ticks)
+    gc_monitor = GcMonitor()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            driver, emulators = make_driver(opt, os.path.join(tmp_dir, 'soak.txt'))
+            t_start = time.perf_counter()
+            for i in range(n_ticks):
+                t0 = time.perf_counter()
+                driver.step()
+                latencies[i] = time.perf_counter() - t0
+                sim.advance(opt.dt)
+
+                if (i + 1) % sample_every == 0 or i == n_ticks - 1:
+                    recent = latencies[max(i + 1 - sample_every, 0):i + 1]
+                    timeline.append({'tick': i + 1, 'simulated_days': (i + 1) * opt.dt / 86400,
+                                     'elapsed': time.perf_counter() - t_start, 'rss_mb': rss(),
+                                     'latency_median_ms': float(np.median(recent)) * 1000,
+                                     'latency_max_ms': float(np.max(recent)) * 1000,
+                                     'gc_collections': gc_monitor.collections,
+                                     'gc_pause_max_ms': max(gc_monitor.pauses, default=0) * 1000})
+                    s = timeline[-1]
+                    print('%8.3f d %10i ticks %8.1f s %8.1f MB %8.2f ms %8.2f ms' % (
+                        s['simulated_days'], s['tick'], s['elapsed'], s['rss_mb'], s['latency_median_ms'],
+                        s['latency_max_ms']))
+            driver.close()
+            for emu in emulators:
+                emu.close()
+    finally:
+        clock.set_clock(previous)
+        gc_monitor.close()
+
+    return timeline, latencies, gc_monitor.pauses
+
+
+def check_budgets(opt, timeline, latencies, gc_pauses):
+    '''
+    Return the measured growths and the list of budgets exceeded
+    '''
+    n = len(latencies)
+    tenth = max(n // 10, 1)
+    i_warm = min(range(len(timeline)), key=lambda i: abs(timeline[i]['tick'] - tenth))
+    measured = {
+        'rss_growth_mb': timeline[-1]['rss_mb'] - timeline[i_warm]['rss_mb'],
+        'latency_growth': float(np.median(latencies[-tenth:]) / np.median(latencies[:tenth])),
+        'latency_p99_ms': float(np.percentile(latencies, 99)) * 1000,
+        'gc_pause_max_ms': max(gc_pauses, default=0) * 1000,
+    }
+    budgets = {'rss_growth_mb': opt.max_rss_growth, 'latency_growth': opt.max_latency_growth,
+               'latency_p99_ms': opt.max_latency, 'gc_pause_max_ms': opt.max_gc_pause}
+    failed = [name for name, val in measured.items() if val > budgets[name]]
+    return measured, budgets, failed
+
+
+if __name__ == '__main__':
+    opt = parser.parse_args()
+    timeline, latencies, gc_pauses = soak(opt)
+    measured, budgets, failed = check_budgets(opt, timeline, latencies, gc_pauses)
+
+    for name, val in measured.items():
+        print('%-20s %10.2f   budget %10.2f   %s' % (name, val, budgets[name], 'FAIL' if name in failed else 'ok'))
+    with open(opt.output, 'w') as f:
+        json.dump({'options': vars(opt), 'measured': measured, 'budgets': budgets, 'failed': failed,
+                   'timeline': timeline}, f, indent=2)
+    sys.exit(1 if failed else 0)
@@ -4,9 +4,11 @@ import datetime as dt
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as dates
-from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import Button, TextBox 
 
+from qtgassol.liveplot import BlitPlot
+from qtgassol.buffer import RingBuffer
+
 
 class device(object):
     '''A device'''
@@ -45,15 +47,14 @@ class gsplot(object):
         self.pres = manom('COM6')
 
         self.interval = 2000              # ms
-        self.ani = None
+        self.timer = None
         self.fout = None
 
-        self.xs, self.ts, self.ps = [], [], []
+        # the last 30 points of time, T and P
+        self.points = RingBuffer(30, 3)
         
         gs_kw = dict(width_ratios=[1], height_ratios=[1, 2])
         self.fig, (self.axt, self.axp) = plt.subplots(nrows=2, sharex=True, gridspec_kw=gs_kw)
-        self.tplot, = self.axt.plot_date([], [], 'ro-', linewidth=0.5, markersize=1.5)
-        self.pplot, = self.axp.plot_date([], [], 'bo-', linewidth=0.5, markersize=1.5)
 
         # self.fig.suptitle(outfile)
         self.fig.add_gridspec(nrows=2, ncols=1, height_ratios=[1, 2])
@@ -61,24 +62,15 @@ class gsplot(object):
 
         # axes
         tstamp = dt.datetime.now()
-        self.xlo = dates.date2num(tstamp)
-        #self.xhi = dates.date2num(tstamp + dt.timedelta(seconds=30))
-        self.xhi = self.xlo + 60.0/86400
-        self.plo, self.phi = 950.0, 1050.0
-        self.tlo, self.thi = 20.0, 30.0        
-        self.axt.set_xlim(self.xlo, self.xhi)
-        self.axt.set_ylim(self.tlo, self.thi)
-        self.axp.set_ylim(self.plo, self.phi)
-
+        xlo = dates.date2num(tstamp)
+        self.axt.set_xlim(xlo, xlo + 60.0/86400)
+        self.axt.set_ylim(20.0, 30.0)
+        self.axp.set_ylim(950.0, 1050.0)
         self.axp.xaxis.set_tick_params(rotation=45, labelsize=10)
-        self.axt.set_ylabel('T / C')
-        self.axp.set_ylabel('P / mbar')
-        self.axt.grid(b=True, which='major', linestyle='--')
-        self.axp.grid(b=True, which='major', linestyle='--')
 
-        self.tt = self.axt.text(0.8, 0.8, '         ', transform=self.axt.transAxes)
-        self.tp = self.axp.text(0.8, 0.9, '         ', transform=self.axp.transAxes)
-        
+        # lines and texts are updated with blitting
+        self.plot = BlitPlot(self.fig, self.axt, self.axp)
+
         # widgets
         topline = 0.9
         height = 0.05
@@ -115,20 +107,24 @@ class gsplot(object):
             delay = float(event)
             print('delay {0:4.1f} s'.format(delay))
             self.interval = 1000 * delay
+            if self.timer is not None:
+                self.timer.interval = self.interval
         except ValueError:
             pass
 
     def stoprun(self, event=None):
-        if self.ani is not None:
-            self.ani._stop()
-            self.ani = None
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
 
     def startrun(self, event=None):
-        if self.ani is None:
-            self.ani = FuncAnimation(self.fig, self.run, interval=self.interval, repeat=False, blit=False, save_count=0)
-            plt.show()
+        if self.timer is None:
+            # a timer of the canvas instead of FuncAnimation, which redraws the whole figure without blitting
+            self.timer = self.fig.canvas.new_timer(interval=self.interval)
+            self.timer.add_callback(self.run)
+            self.timer.start()
             
-    def run(self, frame):
+    def run(self):
         t = self.temp.measure()
         p = self.pres.measure()
 
@@ -137,36 +133,10 @@ class gsplot(object):
         if self.fout and not self.fout.closed:
             self.fout.write(readstr + '\n')
         x = dates.date2num(tstamp)
-        self.xs.append(x)
-        self.ts.append(t)
-        self.ps.append(p)
-
-        if len(self.xs) > 30:
-            self.xs.pop(0)
-            self.ts.pop(0)
-            self.ps.pop(0)
-            self.xhi = self.xs[-1] + 10.0/86400
-
-        self.xlo = self.xs[0]
-        if t < self.tlo or t > self.tlo + 2.0:
-            self.tlo = t - 2.0
-        if t > self.thi or t < self.thi - 2.0:
-            self.thi = t + 2.0
-        if p < self.plo or p > self.plo + 10.0:
-            self.plo = p - 10.0
-        if p > self.phi or p < self.phi - 10.0:
-            self.phi = p + 10.0
-        self.axt.set_xlim(self.xlo, self.xhi)
-        self.axt.set_ylim(self.tlo, self.thi)
-        self.axp.set_ylim(self.plo, self.phi)
-
-        self.tplot.set_data(self.xs, self.ts)
-        self.pplot.set_data(self.xs, self.ps)
-
-        self.tt.set_text('{0:9.3f}'.format(t))
-        self.tp.set_text('{0:9.2f}'.format(p))
-
-        return self.tplot, self.pplot
+        self.points.append((x, t, p))
+
+        xs, ts, ps = self.points.view()
+        self.plot.update(xs, ts, ps, '{0:9.3f}'.format(t), '{0:9.2f}'.format(p))
 
     def startgui(self):
         # self.ani = FuncAnimation(self.fig, self.run, interval=self.interval, repeat=False, blit=False, save_count=0, cache_frame_data=False)
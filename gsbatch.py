@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+import functools
+import multiprocessing
+from qtgassol.pipeline import analyse_file, write_summary
+
+parser = argparse.ArgumentParser(description='Find the equilibrium plateaus in log files and summarize them',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('files', type=str, nargs='+',
+                    help='Log files written by main.py or gsplot.py')
+parser.add_argument('-o', '--output', type=str, default='-',
+                    help='Output filename for the summary table. - means standard output')
+parser.add_argument('-j', '--jobs', type=int, default=None,
+                    help='Number of processes. Default is the number of CPUs')
+parser.add_argument('--window', type=int, default=20,
+                    help='Number of points a plateau should at least contain')
+parser.add_argument('--rtol', type=float, default=1E-3,
+                    help='Relative tolerance of pressure variation in a plateau')
+parser.add_argument('--atol', type=float, default=0.05,
+                    help='Absolute tolerance (mbar) of pressure variation in a plateau')
+
+if __name__ == '__main__':
+    opt = parser.parse_args()
+
+    func = functools.partial(analyse_file, window=opt.window, rtol=opt.rtol, atol=opt.atol)
+    with multiprocessing.Pool(min(opt.jobs or multiprocessing.cpu_count(), len(opt.files))) as pool:
+        results = pool.map(func, opt.files)
+
+    rows = [row for rows_file in results for row in rows_file]
+    if opt.output == '-':
+        write_summary(rows, sys.stdout)
+    else:
+        with open(opt.output, 'w') as f:
+            write_summary(rows, f)
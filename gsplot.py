@@ -14,6 +14,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
+from qtgassol.liveplot import BlitPlot
+from qtgassol.buffer import RingBuffer
+
 
 class device(object):
     '''A device'''
@@ -208,10 +211,11 @@ def main():
     fig.add_gridspec(nrows=2, ncols=1, height_ratios=[1, 2])
     fig.suptitle(fname)
     axp.xaxis.set_tick_params(rotation=30, labelsize=10)
+    plot = BlitPlot(fig, axt, axp)
+    plt.show(block=False)
 
-    xs = []
-    ts = []
-    ps = []
+    # the last maxpt points of time, T and P
+    points = RingBuffer(maxpt, 3)
     
     with open(fname, 'w', buffering=1) as f:
         print('writing to {0:s} every {1:.1f} s'.format(fname, args.delay))
@@ -246,37 +250,18 @@ def main():
                 f.write(tstamp + outstr + '\n')
 
             print(tstamp + outstr)
-            xs.append(mdates.date2num(tstart))
-            
-            if not temp.err:
-                ts.append(tval)
-            else:
-                ts.append(ts[-1])
-            if not pres.err:
-                ps.append(pval)
-            else:
-                ps.append(ps[-1])
-
-            if len(xs) > maxpt:
-                xs = xs[-maxpt:]
-                ts = ts[-maxpt:]
-                ps = ps[-maxpt:]
-                
-            axt.cla()
-            axp.cla()
-            axt.set_ylabel('T / C')
-            axp.set_ylabel('P / mbar')
-            axt.grid(b=True, which='major', linestyle='--')
-            axp.grid(b=True, which='major', linestyle='--')
-            tt = axt.text(0.85, 0.8, '         ', transform=axt.transAxes)
-            tp = axp.text(0.85, 0.9, '         ', transform=axp.transAxes)
-            tt.set_text('{0:9.3f}'.format(tval))
-            tp.set_text('{0:9.2f}'.format(pval))
-            axt.plot_date(xs, ts, 'ro-', linewidth=0.5, markersize=1.5)
-            axp.plot_date(xs, ps, 'bo-', linewidth=0.5, markersize=1.5)
-            # plt.draw()
-
-            plt.pause(delay)
+            if maxpt != points.capacity and maxpt > 0:
+                points.resize(maxpt)
+            # the last value is repeated if there is error
+            points.append((mdates.date2num(tstart),
+                           tval if not temp.err else points[1][-1],
+                           pval if not pres.err else points[2][-1]))
+            xs, ts, ps = points.view()
+
+            plot.update(xs, ts, ps, '{0:9.3f}'.format(tval), '{0:9.2f}'.format(pval))
+
+            # wait in the event loop of the window, which does not redraw it
+            fig.canvas.start_event_loop(delay)
 
     print('data saved to ' + fname)
     print('close plot window to exit')    
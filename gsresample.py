@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+import argparse
+from qtgassol.pipeline import resample_file, write_channels
+
+parser = argparse.ArgumentParser(description='Resample all channels in log files onto a common time grid. '
+                                             'Each value is placed at the time it was read, which main.py writes '
+                                             'after every row. Older files only have the time of the row for all '
+                                             'channels, so their channels cannot be aligned more finely than that.',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('files', type=str, nargs='+',
+                    help='Log files written by main.py or gsplot.py')
+parser.add_argument('--dt', type=float, default=5.0,
+                    help='Time interval of the grid (s)')
+parser.add_argument('--method', type=str, default='linear', choices=['linear', 'nearest'],
+                    help='Linear interpolation between the points around, or the nearest point')
+parser.add_argument('--max-gap', type=float, default=None,
+                    help='Grid times in gaps longer than this (s) without valid points are nan. Default is no limit')
+parser.add_argument('--suffix', type=str, default='.resampled',
+                    help='Suffix appended to the name of each log file for the output file')
+
+if __name__ == '__main__':
+    opt = parser.parse_args()
+
+    for filename in opt.files:
+        grid, channels = resample_file(filename, opt.dt, opt.method, opt.max_gap)
+        with open(filename + opt.suffix, 'w') as f:
+            write_channels(grid, channels, f)
+        print('%s: %i points written to %s' % (filename, len(grid), filename + opt.suffix))
@@ -3,74 +3,232 @@
 import sys
 import argparse
 from PyQt5 import QtWidgets
-from qtgassol.ui import MainUI
-from qtgassol.device import FlukeThermometer, GeManometer, HuberThermostat, DummyT, DummyP, DummyFile
+from qtgassol.ui import MainUI, RigGroup
+from qtgassol.sampling import AdaptiveInterval, BurstRecorder, oversample
+from qtgassol.channel import default_channels, spread_channels
+from qtgassol.metrics import Metrics, MetricsServer, TextfileExporter
+from qtgassol.rig import open_device, parse_channel, load_rigs, DetectionError
+from qtgassol.bus import BusWriter
+from qtgassol.control import PIController
+from qtgassol.checkpoint import Checkpointer
 
 parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument('-t', '--temp', type=str, default='auto',
                     help='Device for thermometer. '
                          'auto means detect the thermometer automatically. '
                          'dummy means use randomly generated temperature data. '
+                         'emulate means talk to an emulated thermometer over a pseudo terminal. '
                          'Otherwise specify the device e.g. /dev/ttyUSB0, or a file name')
 parser.add_argument('-p', '--press', type=str, default='auto',
                     help='Device for manometer. '
                          'auto means detect the manometer automatically. '
                          'dummy means use randomly generated pressure data. '
+                         'emulate means talk to an emulated manometer over a pseudo terminal. '
                          'Otherwise specify the device e.g. /dev/ttyUSB1, or a file name')
 parser.add_argument('--thermostat', type=str, default='none',
                     help='Device for thermostat. '
                          'none means disable thermostat. '
                          'auto means detect the thermostat automatically. '
+                         'emulate means talk to an emulated thermostat over a pseudo terminal. '
                          'Otherwise specify the device e.g. /dev/ttyACM0, or a file name')
+parser.add_argument('--channel', type=str, action='append', default=[],
+                    help='Extra channel to record, as name,unit,kind,device[,precision[,samples]] where kind is temp, '
+                         'press or thermostat, e.g. T2,C,temp,/dev/ttyUSB2. samples is the number of reads averaged '
+                         'for every point. Can be given several times.')
+parser.add_argument('--press-speed', type=int, default=2,
+                    help='Integration speed of the manometer set by *Q,n. 2 means 16000 cycles in 1.0 s. '
+                         'See the manual of the manometer for the other speeds.')
+parser.add_argument('--samples-t', type=int, default=1,
+                    help='Number of reads of the thermometer averaged for every point. Not with --burst.')
+parser.add_argument('--samples-p', type=int, default=1,
+                    help='Number of reads of the manometer averaged for every point. Not with --burst.')
+parser.add_argument('--spread', action='store_true',
+                    help='Log the std, min and max of the reads of every channel with more than one read per '
+                         'point, in extra columns e.g. T_std, T_min and T_max.')
+parser.add_argument('--isolate', action='store_true',
+                    help='Run each serial device in its own child process, which is restarted if the device hangs, '
+                         'so that one bad device cannot stall the others or GUI.')
+parser.add_argument('--control', action='store_true',
+                    help='Adjust the setpoint of the thermostat with a PI controller, so that T of the cell tracks '
+                         'the preset instead of the bath. Can also be enabled from GUI.')
+parser.add_argument('--kp', type=float, default=1.0,
+                    help='Proportional gain of the thermostat control (C/C).')
+parser.add_argument('--ki', type=float, default=0.001,
+                    help='Integral gain of the thermostat control (C/C/s).')
+parser.add_argument('--max-offset', type=float, default=10.0,
+                    help='Maximum difference between the setpoint of the thermostat and the preset (C) in control.')
+parser.add_argument('--rate-limit', type=float, default=2.0,
+                    help='Maximum rate of change of the setpoint of the thermostat (C/min) in control.')
+parser.add_argument('--config', type=str, default='',
+                    help='JSON file of several rigs to run in one process, '
+                         'e.g. [{"name": "cell1", "temp": "/dev/ttyUSB0", "press": "/dev/ttyUSB1", '
+                         '"thermostat": "/dev/ttyACM0", "output": "cell1.txt", "samples": {"P": 5}}, ...]. '
+                         'The devices, channel and output options are ignored if it is specified.')
 parser.add_argument('-o', '--output', type=str, default='output.txt',
                     help='Output filename. Can also be specified from GUI.')
 parser.add_argument('--dt', type=float, default=5.0,
                     help='Time interval for reading data. Can also be specified from GUI.')
+parser.add_argument('--adaptive', action='store_true',
+                    help='Choose the time interval from the activity of T and P. Can also be enabled from GUI.')
+parser.add_argument('--dt-min', type=float, default=1.0,
+                    help='Minimum time interval in adaptive mode, used when T or P is changing.')
+parser.add_argument('--dt-max', type=float, default=60.0,
+                    help='Maximum time interval in adaptive mode, approached when T and P are stable.')
+parser.add_argument('--rate-t', type=float, default=0.002,
+                    help='Rate of change of T (C/s) above which T is considered changing in adaptive mode.')
+parser.add_argument('--rate-p', type=float, default=0.05,
+                    help='Rate of change of P (mbar/s) above which P is considered changing in adaptive mode.')
+parser.add_argument('--std-t', type=float, default=0.05,
+                    help='Std of last points of T (C) above which T is considered changing in adaptive mode.')
+parser.add_argument('--std-p', type=float, default=1.0,
+                    help='Std of last points of P (mbar) above which P is considered changing in adaptive mode.')
+parser.add_argument('--burst', action='store_true',
+                    help='Read the devices continuously and write the points around pressure steps at full rate. '
+                         'Can also be enabled from GUI.')
+parser.add_argument('--burst-pre', type=float, default=10.0,
+                    help='Seconds of points before the trigger to write in burst mode.')
+parser.add_argument('--burst-post', type=float, default=30.0,
+                    help='Seconds of points after the trigger to write in burst mode.')
+parser.add_argument('--burst-step', type=float, default=5.0,
+                    help='Pressure step (mbar) between two points which triggers a burst. Can also be specified from GUI.')
+parser.add_argument('--metrics-port', type=int, default=0,
+                    help='Serve metrics for monitoring in Prometheus text format over HTTP on this port. '
+                         '0 means disabled.')
+parser.add_argument('--metrics-host', type=str, default='127.0.0.1',
+                    help='Address to bind the metrics server. Use 0.0.0.0 to allow access from other machines.')
+parser.add_argument('--metrics-textfile', type=str, default='',
+                    help='Write metrics in Prometheus text format to this file periodically. Empty means disabled.')
+parser.add_argument('--bus', type=str, default='',
+                    help='Publish the points to shared memory of this name, for analysis in other processes '
+                         'with qtgassol.bus.BusReader. With --config, the name of each rig is appended. '
+                         'Empty means disabled.')
+parser.add_argument('--bus-capacity', type=int, default=100000,
+                    help='Number of last points kept in the shared memory of --bus.')
+parser.add_argument('--checkpoint', type=str, default='',
+                    help='Keep a checkpoint of the session in files of this name with extensions npz, journal and '
+                         'json, for recovering from a crash with --restore. With --config, the name of each rig is '
+                         'appended. Empty means disabled.')
+parser.add_argument('--checkpoint-interval', type=int, default=1000,
+                    help='Number of points between syncs of the journal of the checkpoint to disk. '
+                         'Every point is flushed to the journal, which survives a crash of the program anyway.')
+parser.add_argument('--restore', action='store_true',
+                    help='Restore the points, the thermostat program and the selected region from --checkpoint.')
+parser.add_argument('--window', type=int, default=0,
+                    help='Number of last points kept for plotting and analysis in GUI, for long runs. '
+                         '0 means keep all the points. The log file has all the points anyway.')
+parser.add_argument('--anomaly-window', type=int, default=21,
+                    help='Number of points in the rolling window for detecting anomaly points as they arrive.')
 
 opt = parser.parse_args()
 
 if __name__ == '__main__':
-    if opt.temp == 'auto':
-        temp = FlukeThermometer.detect()
-        if temp is None:
-            print('ERROR: Thermometer not detected. Try again or specify the device.')
-            sys.exit(1)
-        else:
-            print('Thermometer detected: %s' % temp)
-    elif opt.temp == 'dummy':
-        temp = DummyT()
-    elif opt.temp.startswith('/dev'):
-        temp = FlukeThermometer(opt.temp)
-    else:
-        temp = DummyFile(opt.temp, -2)
+    metrics = None
+    if opt.metrics_port != 0 or opt.metrics_textfile:
+        metrics = Metrics()
+    if opt.metrics_port != 0:
+        server = MetricsServer(metrics, opt.metrics_host, opt.metrics_port)
+        server.start()
+        print('Metrics served at http://%s:%i/metrics' % server.address)
+    if opt.metrics_textfile:
+        TextfileExporter(metrics, opt.metrics_textfile).start()
 
-    if opt.press == 'auto':
-        press = GeManometer.detect()
-        if press is None:
-            print('ERROR: Manometer not detected. Try again or specify the device.')
+    if opt.config:
+        try:
+            rigs = load_rigs(opt.config, opt.isolate)
+        except (DetectionError, ValueError) as e:
+            print('ERROR: %s' % e)
             sys.exit(1)
-        else:
-            print('Manometer detected: %s' % press)
-    elif opt.press == 'dummy':
-        press = DummyP()
-    elif opt.press.startswith('/dev'):
-        press = GeManometer(opt.press)
-    else:
-        press = DummyFile(opt.press, -1)
 
-    if opt.thermostat == 'auto':
-        thermo = HuberThermostat.detect()
-        if thermo is None:
-            print('ERROR: Thermostat not detected. Try again or specify the device.')
-            sys.exit(1)
-        else:
+        app = QtWidgets.QApplication(sys.argv)
+        uis = []
+        buses = []
+        for rig in rigs:
+            print(rig)
+            bus = None
+            if opt.bus:
+                bus = BusWriter(opt.bus + '_' + rig.name, [ch.name for ch in rig.channels], opt.bus_capacity)
+                buses.append(bus)
+            checkpoint = None
+            if opt.checkpoint:
+                checkpoint = Checkpointer(opt.checkpoint + '_' + rig.name, opt.checkpoint_interval)
+            ui = MainUI(rig.thermometer, rig.manometer, rig.thermostat, rig.output, opt.dt,
+                        anomaly_window=opt.anomaly_window, metrics=metrics, name=rig.name, external_timer=True,
+                        channels=rig.channels[2:], window=opt.window or None, bus=bus,
+                        control=PIController(opt.kp, opt.ki, opt.max_offset, opt.rate_limit), checkpoint=checkpoint)
+            ui.chk_control.setChecked(opt.control)
+            if opt.restore and checkpoint is not None and checkpoint.exists:
+                try:
+                    ui.restore_session()
+                except ValueError as e:
+                    print('ERROR: %s' % e)
+                    sys.exit(1)
+            ui.show()
+            uis.append(ui)
+        group = RigGroup(rigs, uis, opt.dt)
+        ret = app.exec_()
+        for bus in buses:
+            bus.close()
+        sys.exit(ret)
+
+    try:
+        temp = open_device('temp', opt.temp, opt.isolate)
+        if opt.temp == 'auto':
+            print('Thermometer detected: %s' % temp)
+        press = open_device('press', opt.press, opt.isolate, {'speed': opt.press_speed})
+        if opt.press == 'auto':
+            print('Manometer detected: %s' % press)
+        thermo = open_device('thermostat', opt.thermostat, opt.isolate)
+        if opt.thermostat == 'auto':
             print('Thermostat detected: %s' % thermo)
-    elif opt.thermostat.startswith('/dev'):
-        thermo = HuberThermostat(opt.thermostat)
-    else:
-        thermo = None
+        opened = {('temp', opt.temp): temp, ('press', opt.press): press, ('thermostat', opt.thermostat): thermo}
+        channels = [parse_channel(spec, opened, opt.isolate) for spec in opt.channel]
+        # the burst recorder reads at full rate
+        burst = BurstRecorder(temp, press, opt.burst_pre, opt.burst_post, opt.burst_step)
+        # the channels sharing the devices of the recorder cannot be read while it is running
+        shared = burst.shared_channels(channels)
+        if len(shared) > 0:
+            if opt.burst:
+                raise ValueError('Burst mode cannot be used with channels read from the thermometer or manometer: %s'
+                                 % ' '.join(ch.name for ch in shared))
+            burst = None
+        # the burst recorder reads T and P once per point, so the samples would be ignored
+        if opt.samples_t > 1 or opt.samples_p > 1:
+            if opt.burst:
+                raise ValueError('Burst mode cannot be used with more than one sample of T or P per point')
+            burst = None
+        temp = oversample(temp, opt.samples_t)
+        press = oversample(press, opt.samples_p)
+        if opt.spread:
+            channels += spread_channels(default_channels(temp, press) + channels)
+    except (DetectionError, ValueError) as e:
+        print('ERROR: %s' % e)
+        sys.exit(1)
+
+    adaptive = AdaptiveInterval(opt.dt_min, opt.dt_max, [opt.rate_t, opt.rate_p], [opt.std_t, opt.std_p])
+
+    bus = None
+    if opt.bus:
+        bus = BusWriter(opt.bus, ['T', 'P'] + [ch.name for ch in channels], opt.bus_capacity)
+
+    checkpoint = None
+    if opt.checkpoint:
+        checkpoint = Checkpointer(opt.checkpoint, opt.checkpoint_interval)
 
     app = QtWidgets.QApplication(sys.argv)
-    ui = MainUI(temp, press, thermo, opt.output, opt.dt)
+    ui = MainUI(temp, press, thermo, opt.output, opt.dt, anomaly_window=opt.anomaly_window, adaptive=adaptive,
+                burst=burst, metrics=metrics, channels=channels, window=opt.window or None, bus=bus,
+                control=PIController(opt.kp, opt.ki, opt.max_offset, opt.rate_limit), checkpoint=checkpoint)
+    ui.chk_adaptive.setChecked(opt.adaptive)
+    ui.chk_control.setChecked(opt.control)
+    if opt.restore and checkpoint is not None and checkpoint.exists:
+        try:
+            ui.restore_session()
+        except ValueError as e:
+            print('ERROR: %s' % e)
+            sys.exit(1)
+    ui.chk_burst.setChecked(opt.burst)
     ui.show()
-    sys.exit(app.exec_())
+    ret = app.exec_()
+    if bus is not None:
+        bus.close()
+    sys.exit(ret)
@@ -0,0 +1,72 @@
+'''
+Fixed capacity buffers for the rolling windows of the front-ends
+'''
+
+import numpy as np
+
+
+class RingBuffer(object):
+    '''
+    A circular buffer of the last capacity points, each of width values, in numpy.
+    Every point is written twice, at i and i + capacity of an array of twice the capacity,
+    so that the points are always available in order as a contiguous view without copying.
+    Appending a point costs O(1) regardless of capacity.
+    '''
+
+    def __init__(self, capacity, width=1):
+        if capacity < 1:
+            raise ValueError('Capacity must be positive')
+
+        self.capacity = capacity
+        self.width = width
+        self._data = np.full((width, 2 * capacity), np.nan)
+        self._head = 0
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def append(self, values):
+        self._data[:, self._head] = values
+        self._data[:, self._head + self.capacity] = values
+        self._head = (self._head + 1) % self.capacity
+        self._n = min(self._n + 1, self.capacity)
+
+    def extend(self, array):
+        '''
+        Append the points in the columns of an array of shape (width, m). It costs O(min(m, capacity))
+        '''
+        array = np.asarray(array, dtype=float)[:, -self.capacity:]
+        m = array.shape[1]
+        idx = (self._head + np.arange(m)) % self.capacity
+        self._data[:, idx] = array
+        self._data[:, idx + self.capacity] = array
+        self._head = (self._head + m) % self.capacity
+        self._n = min(self._n + m, self.capacity)
+
+    def view(self):
+        '''
+        The points from the oldest to the newest as an array of shape (width, n).
+        Each row is contiguous. It is a view, which is valid until next append()
+        '''
+        end = self._head + self.capacity
+        return self._data[:, end - self._n:end]
+
+    def __getitem__(self, i):
+        return self.view()[i]
+
+    def clear(self):
+        self._head = 0
+        self._n = 0
+
+    def resize(self, capacity):
+        '''
+        Change the capacity and keep the last points. It costs O(capacity)
+        '''
+        last = self.view()[:, max(self._n - capacity, 0):].copy()
+        self.__init__(capacity, self.width)
+        n = last.shape[1]
+        self._data[:, :n] = last
+        self._data[:, capacity:capacity + n] = last
+        self._head = n % capacity
+        self._n = n
@@ -0,0 +1,152 @@
+'''
+Live data bus in shared memory, for analysis in other processes without reading the log file, e.g. in a notebook
+    reader = BusReader('gassol')
+    time_array, channels = reader.snapshot(1000)
+The acquisition publishes every point with BusWriter.append(), which costs a few writes to memory.
+'''
+
+import json
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+MAGIC = 0x6761736f6c627573  # b'gasolbus'
+VERSION = 1
+
+# int64 fields of the header, followed by the names of channels in JSON and the data in float64
+HEADER = ('magic', 'version', 'capacity', 'width', 'index', 'seq', 'names_len', 'reserved')
+NAMES_SIZE = 4096
+DATA_OFFSET = len(HEADER) * 8 + NAMES_SIZE
+
+
+class BusWriter(object):
+    '''
+    Publish the points of channels to a ring buffer of the last capacity points in shared memory.
+    Like RingBuffer, every point is written twice into data of twice the capacity,
+    so that the last points are always contiguous for the readers.
+    The header has the number of points written as index, and a sequence number which is odd while a point is
+    being written, so that readers can tell whether what they read is consistent.
+    -1, which means error, is published as nan
+    '''
+
+    def __init__(self, name, names, capacity=100000):
+        names_json = json.dumps(list(names)).encode()
+        if len(names_json) > NAMES_SIZE:
+            raise ValueError('Too many channels for the bus')
+
+        self.name = name
+        self.names = list(names)
+        self.capacity = capacity
+        self.width = 1 + len(self.names)
+        self._shm = shared_memory.SharedMemory(name, create=True,
+                                               size=DATA_OFFSET + self.width * 2 * capacity * 8)
+        self._header = np.ndarray(len(HEADER), np.int64, self._shm.buf)
+        self._header[:] = MAGIC, VERSION, capacity, self.width, 0, 0, len(names_json), 0
+        self._shm.buf[len(HEADER) * 8:len(HEADER) * 8 + len(names_json)] = names_json
+        self._data = np.ndarray((self.width, 2 * capacity), np.float64, self._shm.buf, DATA_OFFSET)
+        self._data[:] = np.nan
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, timestamp, values):
+        point = np.array([timestamp] + list(values), dtype=float)
+        point[point == -1] = np.nan
+
+        index = self._header[4]
+        head = index % self.capacity
+        self._header[5] += 1
+        self._data[:, head] = point
+        self._data[:, head + self.capacity] = point
+        self._header[4] = index + 1
+        self._header[5] += 1
+
+    def close(self):
+        '''
+        Remove the shared memory. Readers attached keep their mapping until they close
+        '''
+        del self._header, self._data
+        self._shm.close()
+        self._shm.unlink()
+
+
+class BusReader(object):
+    '''
+    Attach to the bus of a BusWriter by name. The arrays are read-only views of the shared memory.
+    '''
+
+    def __init__(self, name):
+        self._shm = shared_memory.SharedMemory(name)
+        # the resource tracker would remove the shared memory when this process exits, which is for the writer
+        try:
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        except Exception:
+            pass
+
+        self._header = np.ndarray(len(HEADER), np.int64, self._shm.buf)
+        self._header.flags.writeable = False
+        if self._header[0] != MAGIC or self._header[1] != VERSION:
+            self._shm.close()
+            raise ValueError('Not a bus of version %i: %s' % (VERSION, name))
+
+        self.name = name
+        self.capacity = int(self._header[2])
+        self.width = int(self._header[3])
+        names_len = int(self._header[6])
+        self.names = json.loads(bytes(self._shm.buf[len(HEADER) * 8:len(HEADER) * 8 + names_len]).decode())
+        self._data = np.ndarray((self.width, 2 * self.capacity), np.float64, self._shm.buf, DATA_OFFSET)
+        self._data.flags.writeable = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def index(self):
+        '''
+        Number of points written since the bus was created
+        '''
+        return int(self._header[4])
+
+    @property
+    def seq(self):
+        return int(self._header[5])
+
+    def view(self, n=None):
+        '''
+        Zero-copy view of the last n points (all points in the buffer if None) as an array of shape (width, n),
+        with time in the first row and channels in the order of names.
+        Return the view and the index when it is taken, see is_valid()
+        '''
+        index = self.index
+        n = min(index, self.capacity) if n is None else min(n, index, self.capacity)
+        end = index % self.capacity + self.capacity
+        return self._data[:, end - n:end], index
+
+    def is_valid(self, index, n):
+        '''
+        Whether a view of n points taken at index is not yet overwritten by the writer
+        '''
+        return self.index - index <= self.capacity - n
+
+    def snapshot(self, n=None, retry=100):
+        '''
+        Consistent copy of the last n points as (time, {name: array}), like pipeline.load_channels()
+        '''
+        for _ in range(retry):
+            seq = self.seq
+            if seq % 2 == 1:
+                continue
+            data, index = self.view(n)
+            data = data.copy()
+            if self.seq == seq:
+                return data[0], dict(zip(self.names, data[1:]))
+        raise RuntimeError('Bus %s is written too fast to take a snapshot' % self.name)
+
+    def close(self):
+        del self._header, self._data
+        self._shm.close()
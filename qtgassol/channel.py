@@ -0,0 +1,180 @@
+'''
+Channels are the quantities recorded in the log, each read from a device
+'''
+
+import time
+import numpy as np
+from . import clock
+from .buffer import RingBuffer
+
+
+class Channel(object):
+    '''
+    A quantity with its name, unit, the device to read it from and the number of decimals in the log
+    '''
+
+    def __init__(self, name, unit, device, precision=3):
+        self.name = name
+        self.unit = unit
+        self.device = device
+        self.precision = precision
+
+    def __str__(self):
+        return '<Channel %s (%s): %s>' % (self.name, self.unit, self.device)
+
+    @property
+    def label(self):
+        return '%s(%s)' % (self.name, self.unit)
+
+    def read(self):
+        return self.device.read()
+
+    def read_stamped(self):
+        '''
+        Read the value and stamp it at the midpoint of request and response,
+        which is closer to the time of measurement than the time before the request.
+        Return (timestamp, value)
+        '''
+        t0 = clock.time()
+        val = self.read()
+        return (t0 + clock.time()) / 2, val
+
+    def format(self, val):
+        return '%10.*f' % (self.precision, val)
+
+
+def default_channels(thermometer, manometer):
+    '''
+    The temperature and pressure channels every apparatus has
+    '''
+    return [Channel('T', 'C', thermometer, 3), Channel('P', 'mbar', manometer, 2)]
+
+
+class SpreadChannel(Channel):
+    '''
+    A statistic of the reads of an oversampled channel in the same point, which is std, min or max e.g. T_std,
+    taken from the device without reading it again. It must come after the channel, so that it is read after it
+    '''
+
+    # index in Oversampled.stats
+    STATS = {'std': 1, 'min': 2, 'max': 3}
+
+    def __init__(self, channel, stat='std'):
+        precision = channel.precision + 1 if stat == 'std' else channel.precision
+        super().__init__(channel.name + '_' + stat, channel.unit, channel.device, precision)
+        self.stat = stat
+
+    def read(self):
+        stats = self.device.stats
+        return -1 if stats is None else stats[self.STATS[self.stat]]
+
+    def read_stamped(self):
+        return self.device.stamp, self.read()
+
+
+def spread_channels(channels):
+    '''
+    The std, min and max of every channel read from an oversampled device, see sampling.Oversampled
+    '''
+    return [SpreadChannel(ch, stat) for ch in channels if hasattr(ch.device, 'stats') for stat in SpreadChannel.STATS]
+
+
+class ColumnStore(object):
+    '''
+    Time and the values of channels stored column by column in numpy arrays.
+    Besides the time of the point, the time each value was read is kept for every channel.
+    The arrays grow by doubling, so that appending a point costs amortized O(1).
+    If max_len is given, only the last max_len points are kept in a RingBuffer, which is the sliding window mode.
+    The columns returned are views, which are valid until next append().
+    '''
+
+    def __init__(self, names, capacity=1024, max_len=None):
+        self.names = list(names)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self.max_len = max_len
+        # rows are time, the values and the stamps of channels
+        width = 1 + 2 * len(self.names)
+        if max_len is None:
+            self._ring = None
+            self._data = np.empty((width, capacity))
+        else:
+            self._ring = RingBuffer(max_len, width)
+        self._n = 0
+
+    def __len__(self):
+        return len(self._ring) if self._ring is not None else self._n
+
+    def append(self, timestamp, values, stamps=None):
+        '''
+        Add a point. stamps are the times of values, which default to timestamp
+        '''
+        n_ch = len(self.names)
+        point = np.empty(1 + 2 * n_ch)
+        point[0] = timestamp
+        point[1:1 + n_ch] = values
+        point[1 + n_ch:] = timestamp if stamps is None else stamps
+
+        if self._ring is not None:
+            self._ring.append(point)
+            return
+
+        if self._n == self._data.shape[1]:
+            self._data = np.concatenate([self._data, np.empty(self._data.shape)], axis=1)
+        self._data[:, self._n] = point
+        self._n += 1
+
+    def extend(self, array):
+        '''
+        Add the points in the columns of an array as returned by array(), e.g. to restore a session
+        '''
+        if self._ring is not None:
+            self._ring.extend(array)
+            return
+
+        m = array.shape[1]
+        if self._n + m > self._data.shape[1]:
+            capacity = max(2 * self._data.shape[1], self._n + m)
+            self._data = np.concatenate([self._data, np.empty((self._data.shape[0], capacity - self._data.shape[1]))],
+                                        axis=1)
+        self._data[:, self._n:self._n + m] = array
+        self._n += m
+
+    def _view(self):
+        return self._ring.view() if self._ring is not None else self._data[:, :self._n]
+
+    def array(self):
+        '''
+        Time, the values and the stamps of channels as the rows of an array, which is a view
+        '''
+        return self._view()
+
+    @property
+    def time(self):
+        return self._view()[0]
+
+    def __getitem__(self, name):
+        return self._view()[1 + self._index[name]]
+
+    def stamps(self, name):
+        return self._view()[1 + len(self.names) + self._index[name]]
+
+    def row(self, i):
+        view = self._view()
+        return view[0, i], view[1:1 + len(self.names), i]
+
+
+def read_channels(channels):
+    '''
+    Read the channels one after another, each stamped at its own midpoint and timed like Profiler.
+    Return the mean of the stamps as the time of the point, the values, the stamps and the durations of the reads
+    '''
+    values = []
+    stamps = []
+    durations = []
+    for ch in channels:
+        t0 = time.perf_counter()
+        stamp, val = ch.read_stamped()
+        durations.append(time.perf_counter() - t0)
+        values.append(val)
+        stamps.append(stamp)
+    return sum(stamps) / len(stamps), values, stamps, durations
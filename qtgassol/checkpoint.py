@@ -0,0 +1,134 @@
+'''
+Checkpoints of the session of MainUI, for recovering from a crash without parsing the log file.
+A checkpoint consists of three files next to each other:
+    name.npz      snapshot of the points in a ColumnStore when the checkpoint is started or restored
+    name.journal  the points appended since the snapshot, in float64, flushed after every point
+                  and synced to disk every interval points
+    name.json     the small state of the session e.g. the thermostat program, replaced atomically when it changes
+The journal is only appended to, so that a point costs the same however long the session is.
+'''
+
+import os
+import json
+import numpy as np
+from .channel import ColumnStore
+
+MAGIC = 0x67636b70  # b'gckp'
+
+
+def _replace(filename, write):
+    '''
+    Write a file with write(f) to a temporary file, then move it in place, so that it is either old or new
+    '''
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+class Checkpointer(object):
+    '''
+    Keep the checkpoint of a ColumnStore and a state dict, which is JSON serializable.
+    update() is called after every point appended to the store.
+    count is the number of points appended in the session, which locates the points of the journal
+    when the store only keeps the last points
+    '''
+
+    def __init__(self, name, interval=1000):
+        self.name = name
+        self.interval = interval
+        self.count = 0
+        self._count_sync = 0
+        self._state = None
+        self._journal = None
+
+    @property
+    def exists(self):
+        return os.path.exists(self.name + '.npz')
+
+    def update(self, store, state=None):
+        '''
+        Record the last point of the store, and the state if it is changed.
+        store is None if no point is appended since the last update
+        '''
+        if store is not None:
+            self.count += 1
+            if self._journal is None:
+                self.snapshot(store)
+            else:
+                self._journal.write(store.array()[:, -1].tobytes())
+                self._journal.flush()
+                if self.count - self._count_sync >= self.interval:
+                    os.fsync(self._journal.fileno())
+                    self._count_sync = self.count
+
+        if state is not None:
+            string = json.dumps(state)
+            if string != self._state:
+                _replace(self.name + '.json', lambda f: f.write(string.encode()))
+                self._state = string
+
+    def snapshot(self, store):
+        '''
+        Write all points of the store and start an empty journal
+        '''
+
+        def write(f):
+            np.savez(f, names=np.array(store.names), data=store.array(), count=self.count)
+
+        _replace(self.name + '.npz', write)
+        self._count_sync = self.count
+
+        # the journal records from which point it starts, so that a journal older than the snapshot is skipped
+        if self._journal is not None:
+            self._journal.close()
+        header = np.array([MAGIC, store.array().shape[0], self.count], dtype=float)
+        _replace(self.name + '.journal', lambda f: f.write(header.tobytes()))
+        self._journal = open(self.name + '.journal', 'ab')
+
+    def restore(self, max_len=None, names=None):
+        '''
+        Return the ColumnStore and the state of the checkpoint, with max_len as for ColumnStore.
+        A point partially written to the journal is dropped.
+        ValueError is raised if names are given and the channels of the checkpoint are different.
+        The checkpoint continues from the restored points
+        '''
+        with np.load(self.name + '.npz') as npz:
+            names_saved = [str(name) for name in npz['names']]
+            data = npz['data']
+            count = int(npz['count'])
+        if names is not None and list(names) != names_saved:
+            raise ValueError('Channels of checkpoint %s are %s' % (self.name, ' '.join(names_saved)))
+        names = names_saved
+
+        store = ColumnStore(names, max(data.shape[1], 1024), max_len)
+        store.extend(data)
+
+        width = data.shape[0]
+        if os.path.exists(self.name + '.journal'):
+            with open(self.name + '.journal', 'rb') as f:
+                buf = f.read()
+            records = np.frombuffer(buf[:len(buf) // 8 * 8], dtype=float)
+            if len(records) >= 3 and records[0] == MAGIC and records[1] == width:
+                start = int(records[2])
+                records = records[3:3 + (len(records) - 3) // width * width].reshape(-1, width).T
+                records = records[:, max(count - start, 0):]
+                store.extend(records)
+                count += records.shape[1]
+
+        state = None
+        if os.path.exists(self.name + '.json'):
+            with open(self.name + '.json') as f:
+                state = json.load(f)
+            self._state = json.dumps(state)
+
+        self.count = count
+        self.snapshot(store)
+        return store, state
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
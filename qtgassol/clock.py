@@ -0,0 +1,83 @@
+'''
+The clock used by qtgassol for time stamps, schedules and waiting.
+It is the wall clock by default. A SimulatedClock can be installed with set_clock(),
+so that whole runs, e.g. a thermostat program of hours, are simulated in seconds:
+    clock.set_clock(clock.SimulatedClock())
+    ...
+    clock.sleep(3600)  # returns at once
+The module level functions time(), sleep() and now() use the installed clock.
+Durations for profiling are measured with the real clock.
+'''
+
+import threading
+import time as _time
+from datetime import datetime
+
+
+class Clock(object):
+    '''
+    The wall clock
+    '''
+
+    def time(self):
+        return _time.time()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+
+class SimulatedClock(Clock):
+    '''
+    A clock which only moves when it is advanced. sleep() advances it at once.
+    Every sleep() also yields resolution real seconds,
+    so that the threads serving the waiting code, e.g. emulators, are able to respond.
+    '''
+
+    def __init__(self, start=None, resolution=1E-3):
+        self._time = _time.time() if start is None else start
+        self.resolution = resolution
+        self._lock = threading.Lock()
+
+    def time(self):
+        with self._lock:
+            return self._time
+
+    def advance(self, seconds):
+        with self._lock:
+            self._time += max(seconds, 0)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+        _time.sleep(self.resolution)
+
+
+_clock = Clock()
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(clock):
+    '''
+    Install clock for qtgassol. Return the clock installed before
+    '''
+    global _clock
+    previous = _clock
+    _clock = clock
+    return previous
+
+
+def time():
+    return _clock.time()
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
+
+
+def now():
+    return _clock.now()
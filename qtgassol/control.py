@@ -0,0 +1,54 @@
+'''
+Closed-loop control of the thermostat, so that the temperature of the cell instead of the bath tracks the preset
+'''
+
+import numpy as np
+
+
+class PIController(object):
+    '''
+    PI control of the setpoint of a thermostat from the temperature measured in the cell.
+    The setpoint is the target plus a correction kp * error + ki * integral of error,
+    so that the cell reaches the target despite the gradient between the bath and the cell.
+    The correction is limited to +-max_offset, the setpoint to limits,
+    and the change of setpoint to rate_limit C/min so that the bath is not driven too hard.
+    Anti-windup: the error is not integrated while the setpoint is limited in the direction of the error.
+    '''
+
+    def __init__(self, kp=1.0, ki=0.001, max_offset=10.0, rate_limit=2.0, limits=(-151, 500)):
+        self.kp = kp
+        self.ki = ki
+        self.max_offset = max_offset
+        self.rate_limit = rate_limit
+        self.limits = limits
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.setpoint = None
+        self._t_last = None
+
+    def update(self, target, measured, timestamp):
+        '''
+        Return the setpoint for the target temperature, with the temperature measured at timestamp.
+        The last setpoint is kept if the measurement failed, which is -1 or nan
+        '''
+        if measured == -1 or np.isnan(measured):
+            return target if self.setpoint is None else self.setpoint
+
+        error = target - measured
+        dt = 0.0 if self._t_last is None else timestamp - self._t_last
+        integral = self.integral + error * dt
+
+        unlimited = target + self.kp * error + self.ki * integral
+        setpoint = min(max(unlimited, target - self.max_offset), target + self.max_offset)
+        setpoint = min(max(setpoint, self.limits[0]), self.limits[1])
+        if self.setpoint is not None and self.rate_limit is not None:
+            step = self.rate_limit * dt / 60
+            setpoint = min(max(setpoint, self.setpoint - step), self.setpoint + step)
+
+        if setpoint == unlimited or error * (unlimited - setpoint) < 0:
+            self.integral = integral
+        self.setpoint = setpoint
+        self._t_last = timestamp
+        return setpoint
@@ -1,108 +1,507 @@
+import re
 import time
+import threading
+import functools
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import serial
 import serial.tools.list_ports
 import numpy as np
-from datetime import datetime
+from . import clock
+
+# errors of a lost port. pyserial lets termios.error through on POSIX e.g. when a USB adapter is unplugged
+try:
+    import termios
+    IO_ERRORS = (serial.SerialException, OSError, termios.error)
+except ImportError:
+    IO_ERRORS = (serial.SerialException, OSError)
+
+
+def _usb_id(port):
+    '''
+    (vid, pid, serial number) of a USB serial port, or None if it is not USB or has no serial number
+    '''
+    for p in serial.tools.list_ports.comports():
+        if p.device == port and p.vid is not None and p.serial_number is not None:
+            return p.vid, p.pid, p.serial_number
+    return None
+
+
+def reconnecting(method):
+    '''
+    Decorator of read() and set() of serial devices.
+    An I/O error of the port, e.g. after the USB adapter is reset, closes it and returns -1 instead of raising.
+    The port is reopened at a later call, see Device.check_port()
+    '''
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.check_port():
+            return -1
+        try:
+            return method(self, *args, **kwargs)
+        except IO_ERRORS:
+            self.port_lost()
+            return -1
+
+    return wrapper
+
+
+class Codec(object):
+    '''
+    A command of a device and the format of its reply.
+    request is the bytes to write, or a format with %s for the value encoded by encode(), e.g. for set().
+    A reply is complete when it starts with prefix and ends with terminator.
+    parse() returns the value from the complete reply as bytearray, and raises ValueError if the reply is invalid.
+    Without parse, the command has no reply
+    '''
+
+    def __init__(self, request, terminator=b'\r\n', parse=None, prefix=b'', encode=None):
+        self.request = request
+        self.terminator = terminator
+        self.parse = parse
+        self.prefix = prefix
+        self.encode = encode
+
+    def is_complete(self, buf):
+        return buf.endswith(self.terminator) and buf.startswith(self.prefix)
+
+
+def regex_parser(pattern):
+    '''
+    Parser of a reply with the value as the first group of a regular expression on bytes
+    '''
+    regex = re.compile(pattern)
+
+    def parse(buf):
+        match = regex.search(buf)
+        if match is None:
+            raise ValueError('Invalid reply: %r' % bytes(buf))
+        return float(match.group(1))
+
+    return parse
+
+
+def hex_parser(start, end, scale=100, negative_above=50000):
+    '''
+    Parser of a reply with the value in 16-bit hex at buf[start:end], in units of 1/scale.
+    Values above negative_above are negative in two's complement
+    '''
+
+    def parse(buf):
+        val = int(buf[start:end], 16)
+        if val > negative_above:
+            val -= 0x10000
+        return val / scale
+
+    return parse
+
+
+def hex_encoder(scale=100):
+    '''
+    Encoder of a value in 16-bit hex in units of 1/scale, with negative values in two's complement
+    '''
+
+    def encode(val):
+        val = round(val * scale)
+        if val < 0:
+            val += 0x10000
+        return b'%04X' % val
+
+    return encode
+
+
+def _done(val):
+    future = Future()
+    future.set_result(val)
+    return future
+
+
+class CommandQueue(object):
+    '''
+    Commands to the port of a device, pipelined.
+    submit() writes the request at once and returns a Future of the value,
+    so that several requests can be outstanding without waiting for the replies one by one.
+    A thread polls the port and matches the replies to the outstanding requests in order.
+    A request without reply in time gets -1, and the bytes received so far are dropped to resynchronize.
+    The port is polled every poll seconds of real time, also with a simulated clock
+    '''
+
+    def __init__(self, device, poll=0.01):
+        self.device = device
+        self.poll = poll
+        # reentrant, because the device calls fail_all() when the port is lost in _run()
+        self._lock = threading.RLock()
+        self._pending = deque()  # (codec, future, deadline)
+        self._buf = bytearray()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        with self._lock:
+            self._fail_all()
+
+    def submit(self, codec, request=None, timeout=None):
+        '''
+        Write the request of codec. The Future is done at once for a command without reply
+        '''
+        if timeout is None:
+            timeout = self.device.read_timeout
+
+        future = Future()
+        with self._lock:
+            self.device.serial.write(codec.request if request is None else request)
+            if codec.parse is None:
+                future.set_result(0)
+            else:
+                self._pending.append((codec, future, clock.time() + timeout))
+        return future
+
+    def fail_all(self):
+        '''
+        Give -1 to all the outstanding requests, e.g. when the port is lost
+        '''
+        with self._lock:
+            self._fail_all()
+
+    def _fail_all(self):
+        while self._pending:
+            self._pending.popleft()[1].set_result(-1)
+        self._buf.clear()
+
+    def _match(self):
+        while self._pending:
+            codec, future, _ = self._pending[0]
+            start = self._buf.find(codec.prefix)
+            if start < 0:
+                return
+            end = self._buf.find(codec.terminator, start)
+            if end < 0:
+                return
+            end += len(codec.terminator)
+            reply = self._buf[start:end]
+            del self._buf[:end]
+            self._pending.popleft()
+
+            try:
+                val = codec.parse(reply)
+            except ValueError:
+                self.device.n_parse_error += 1
+                val = -1
+            future.set_result(val)
+
+        # nothing is expected, e.g. data transmitted automatically
+        self._buf.clear()
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.poll)
+            with self._lock:
+                if not self._pending or not self.device._connected:
+                    continue
+
+                try:
+                    self._buf += self.device.serial.read(100)  # read up to 100 bytes
+                except IO_ERRORS:
+                    self.device.port_lost()
+                    continue
+                self._match()
+
+                if self._pending and clock.time() > self._pending[0][2]:
+                    self.device.n_timeout += 1
+                    self._pending.popleft()[1].set_result(-1)
+                    self._buf.clear()
 
 
 class Device(object):
-    '''A device'''
+    '''
+    A device.
+    A serial device declares the Codec of reading as read_codec, and of setting as set_codec if supported.
+    read() and set() then write the request and poll the reply until it is complete or timeout,
+    or pass them to the CommandQueue of the port if it is started with start_queue()
+    '''
+
+    # options of serial.Serial
+    serial_options = {'baudrate': 9600}
+    read_codec = None
+    set_codec = None
+    # range of values accepted by set()
+    set_range = None
+    # seconds to wait for a reply
+    read_timeout = 1.0
+
+    # seconds between the attempts of reopening a lost port, doubled after every failure
+    backoff_min = 1.0
+    backoff_max = 60.0
 
     def __init__(self, port=None):
         self.port = port
+        # number of failed read() for diagnosis
+        self.n_timeout = 0
+        self.n_parse_error = 0
+        # number of times the port is lost and reopened
+        self.n_disconnect = 0
+        self.n_reconnect = 0
+        self._connected = True
+        self._backoff = 0
+        self._t_retry = 0
+        self._usb_id = None
+        self.queue = None
         if port is not None:
-            self.serial = serial.Serial(port, 9600, timeout=0)
+            self.serial = serial.Serial(port, timeout=0, **self.serial_options)
+            self._usb_id = _usb_id(port)
 
     def __str__(self):
         return ('<%s: %s>' % (self.__class__.__name__, self.port))
 
-    def read(self, **kwargs):
+    def setup(self):
         '''
-        Return -1 if there is error
+        Configure the device after the port is opened
         '''
-        raise NotImplementedError('Method not supported')
+        pass
 
-    def set(self, val, **kwargs):
+    def start_queue(self):
         '''
-        Return -1 if there is error
+        Pipeline the commands with a CommandQueue, e.g. for set_async()
         '''
-        raise NotImplementedError('Method not supported')
-
+        self.queue = CommandQueue(self)
+        self.queue.start()
 
-class FlukeThermometer(Device):
-    '''Thermometer'''
+    def close(self):
+        if self.queue is not None:
+            self.queue.stop()
+            self.queue = None
+        if getattr(self, 'serial', None) is not None:
+            self.serial.close()
 
-    def __init__(self, port):
-        super().__init__(port)
+    def port_lost(self):
+        '''
+        Close the port after an I/O error. It is reopened at the next call of check_port().
+        The requests outstanding in the command queue get -1 at once instead of waiting for the port
+        '''
+        if self.queue is not None:
+            self.queue.fail_all()
+        self.n_disconnect += 1
+        self._connected = False
+        self._backoff = 0
+        self._t_retry = clock.time()
+        try:
+            self.serial.close()
+        except IO_ERRORS:
+            pass
 
-        # set unit to C
-        self.serial.write(b'U=C\r')
-        # disable timestamp
-        self.serial.write(b'ST=OFF\r')
-        # disable data auto transmission
-        self.serial.write(b'SA=0\r')
+    def check_port(self):
+        '''
+        Return whether the port is open. A lost port is reopened if it is time to retry.
+        A USB adapter is found again by its serial number if it comes back under another name.
+        The interval between attempts grows from backoff_min to backoff_max, so that failing attempts cost little
+        '''
+        if self._connected:
+            return True
+        if clock.time() < self._t_retry:
+            return False
+
+        if self._usb_id is not None:
+            for p in serial.tools.list_ports.comports():
+                if (p.vid, p.pid, p.serial_number) == self._usb_id:
+                    self.port = p.device
+                    break
+        try:
+            self.serial = serial.Serial(self.port, timeout=0, **self.serial_options)
+        except IO_ERRORS:
+            self.serial = None
+        try:
+            if self.serial is not None:
+                self.setup()
+        except IO_ERRORS:
+            self.serial.close()
+            self.serial = None
+        if self.serial is None:
+            self._backoff = min(max(self._backoff * 2, self.backoff_min), self.backoff_max)
+            self._t_retry = clock.time() + self._backoff
+            return False
+
+        self._connected = True
+        self._backoff = 0
+        self.n_reconnect += 1
+        return True
 
-        # clean buffer. It can take a while for data been fully transmitted
-        time.sleep(1.0)
-        self.serial.reset_input_buffer()
+    def query(self, codec, request=None, timeout=None, debug=False):
+        '''
+        Write the request of codec, and return the value parsed from the reply, or -1 if there is error.
+        The reply is accumulated in place in a bytearray, and only parsed once it is complete
+        '''
+        if timeout is None:
+            timeout = self.read_timeout
+        if self.queue is not None:
+            # the queue answers by the deadline, and the wait is bounded in case it stalls
+            try:
+                return self.queue.submit(codec, request, timeout).result(2 * timeout)
+            except FutureTimeoutError:
+                self.n_timeout += 1
+                return -1
 
-    def read(self, timeout=1.0, debug=False):
         self.serial.reset_input_buffer()
-        self.serial.write(b'T\r')
+        self.serial.write(codec.request if request is None else request)
+        if codec.parse is None:
+            return 0
 
         # retrieve data from serial port
-        # b'T\r\nt:   32.728 C\r\n'
-        current_time = time.time()
-        buf = b''
+        current_time = clock.time()
+        buf = bytearray()
         while True:
-            if time.time() - current_time > timeout:
+            if clock.time() - current_time > timeout:
                 if debug:
-                    print('ERROR: timeout exceeded:', buf)
+                    print('ERROR: timeout exceeded:', bytes(buf))
+                self.n_timeout += 1
                 return -1
 
-            time.sleep(0.1)
+            clock.sleep(0.1)
 
             buf += self.serial.read(100)  # read up to 100 bytes
 
-            if buf.endswith(b'C\r\n'):
+            if codec.is_complete(buf):
                 break
 
         if debug:
-            print(buf)
+            print(bytes(buf))
 
         try:
-            val = float(buf.decode().split()[-2])
-        except:
+            return codec.parse(buf)
+        except ValueError:
+            self.n_parse_error += 1
             return -1
 
+    @reconnecting
+    def read(self, timeout=None, debug=False):
+        '''
+        Return -1 if there is error
+        '''
+        if self.read_codec is None:
+            raise NotImplementedError('Method not supported')
+        return self.query(self.read_codec, timeout=timeout, debug=debug)
+
+    @reconnecting
+    def set(self, val, timeout=None, debug=False):
+        '''
+        Set the value and return the value confirmed by the device, which is read back if the command has no reply.
+        Return -1 if there is error
+        '''
+        if self.set_codec is None:
+            raise NotImplementedError('Method not supported')
+        if self.set_range is not None and not self.set_range[0] <= val <= self.set_range[1]:
+            return -1
+
+        codec = self.set_codec
+        val = self.query(codec, codec.request % codec.encode(val), timeout=timeout, debug=debug)
+        if codec.parse is None:
+            return self.read(timeout=timeout, debug=debug)
         return val
 
-    @staticmethod
-    def detect(debug=False):
+    def set_async(self, val, timeout=None):
+        '''
+        Set the value without waiting for the device.
+        Return a Future of the value confirmed by the device as set(), which is done later with the command queue.
+        Without the command queue, the value is set before returning
+        '''
+        if self.queue is None:
+            return _done(self.set(val, timeout=timeout))
+        if self.set_codec is None:
+            raise NotImplementedError('Method not supported')
+        if self.set_range is not None and not self.set_range[0] <= val <= self.set_range[1]:
+            return _done(-1)
+        if not self.check_port():
+            return _done(-1)
+
+        codec = self.set_codec
+        try:
+            future = self.queue.submit(codec, codec.request % codec.encode(val), timeout)
+            if codec.parse is None:
+                future = self.queue.submit(self.read_codec, timeout=timeout)
+        except IO_ERRORS:
+            self.port_lost()
+            return _done(-1)
+        return future
+
+    @classmethod
+    def detect(cls, debug=False, **kwargs):
+        '''
+        Open every serial port and return the device on the first port replying to read(), or None.
+        kwargs are passed to the constructor
+        '''
         devices = [p.device for p in serial.tools.list_ports.comports()]
         for d in devices:
             if not d.startswith('/dev/tty'):
                 continue
 
             try:
-                dev = FlukeThermometer(d)
+                dev = cls(d, **kwargs)
             except:
                 continue
 
             if dev.read(debug=debug) != -1:
                 return dev
+            dev.close()
 
         return None
 
 
-class GeManometer(Device):
-    '''Pressure transducer'''
+class FlukeThermometer(Device):
+    '''Thermometer'''
+
+    # b'T\r\nt:   32.728 C\r\n'
+    read_codec = Codec(b'T\r', b'C\r\n', regex_parser(rb'(\S+)\s+C\r\n$'))
 
     def __init__(self, port):
         super().__init__(port)
+        self.setup()
+
+    def setup(self):
+        # set unit to C
+        self.serial.write(b'U=C\r')
+        # disable timestamp
+        self.serial.write(b'ST=OFF\r')
+        # disable data auto transmission
+        self.serial.write(b'SA=0\r')
+
+        # clean buffer. It can take a while for data been fully transmitted
+        clock.sleep(1.0)
+        self.serial.reset_input_buffer()
+
+
+class GeManometer(Device):
+    '''
+    Pressure transducer.
+    speed is the integration speed set by *Q,n, which trades the time of a reading for its noise.
+    See the manual of the transducer for the number of cycles of each speed
+    '''
+
+    # b'962.43 mbar\r\n'
+    read_codec = Codec(b'-*G\r', b'mbar\r\n', regex_parser(rb'(\S+)\s+mbar\r\n$'))
+    read_timeout = 2.0
+
+    def __init__(self, port, speed=2):
+        self.speed = speed
+        super().__init__(port)
+        self.setup()
 
+    def setup(self):
         # speed 2: 16000 cycles 1.0 s
-        self.serial.write(b'*Q,2\r')
+        self.serial.write(b'*Q,%i\r' % self.speed)
         # unit: mbar
         self.serial.write(b'*U,0\r')
         # data auto transmission cannot be disabled for manometer in direct mode
@@ -111,57 +510,9 @@ class GeManometer(Device):
         self.serial.write(b'-*A,9999.0\r')
 
         # clean buffer. It can take a while for data been fully transmitted
-        time.sleep(1.0)
+        clock.sleep(1.0)
         self.serial.reset_input_buffer()
 
-    def read(self, timeout=2.0, debug=False):
-        self.serial.reset_input_buffer()
-        self.serial.write(b'-*G\r')
-
-        # retrieve data from serial port
-        # b'962.43 mbar\r\n'
-        current_time = time.time()
-        buf = b''
-        while True:
-            if time.time() - current_time > timeout:
-                if debug:
-                    print('ERROR: timeout exceeded:', buf)
-                return -1
-
-            time.sleep(0.1)
-
-            buf += self.serial.read(100)  # read up to 100 bytes
-
-            if buf.endswith(b'mbar\r\n'):
-                break
-
-        if debug:
-            print(buf)
-
-        try:
-            val = float(buf.decode().split()[-2])
-        except:
-            return -1
-
-        return val
-
-    @staticmethod
-    def detect(debug=False):
-        devices = [p.device for p in serial.tools.list_ports.comports()]
-        for d in devices:
-            if not d.startswith('/dev/tty'):
-                continue
-
-            try:
-                dev = GeManometer(d)
-            except:
-                continue
-
-            if dev.read(debug=debug) != -1:
-                return dev
-
-        return None
-
 
 class Thermostat(Device):
     '''
@@ -184,7 +535,7 @@ class Thermostat(Device):
         '30, 10, 50; 2, 40; 5, 50; ....' will be similar.
         There is no limit for the number of cycles.
         '''
-        timestamp = time.time()
+        timestamp = clock.time()
         _timestamp_temp = []
         if ',' not in string:
             try:
@@ -241,7 +592,7 @@ class Thermostat(Device):
             raise Exception('Preset not exists')
 
         if timestamp is None:
-            timestamp = time.time()
+            timestamp = clock.time()
 
         if len(self._timestamp_temp) == 1:
             return self._timestamp_temp[0][1]
@@ -265,127 +616,50 @@ class Thermostat(Device):
 
 class HuberThermostat(Thermostat):
     '''
-    Huber Thermostat
+    Huber Thermostat.
+    The temperature is represented in hex format **** in 0.01 C, e.g. b'{S00****\r\n'
+    {M00**** reads the setpoint, and {M00XXXX sets it and replies the new setpoint.
+    The commands are pipelined, so that set_async() costs no round trip.
+    Huber Thermostat support temperature range from -151 to 500.
+    However, -1 is used to mean failure in this code. Be careful.
     '''
 
+    read_codec = Codec(b'{M00****\r\n', b'\r\n', hex_parser(-6, -2), prefix=b'{S00')
+    set_codec = Codec(b'{M00%s\r\n', b'\r\n', hex_parser(-6, -2), prefix=b'{S00', encode=hex_encoder())
+    set_range = (-151, 500)
+
     def __init__(self, port):
         super().__init__(port)
-
-        # clean buffer. It can take a while for data been fully transmitted
-        time.sleep(1.0)
-        self.serial.reset_input_buffer()
+        self.setup()
+        self.start_queue()
 
         self._preset = {}  # {t_start, t_end: duration, temp: duration,
 
-    def read(self, timeout=1.0, debug=False):
+    def setup(self):
+        # clean buffer. It can take a while for data been fully transmitted
+        clock.sleep(1.0)
         self.serial.reset_input_buffer()
-        self.serial.write(b'{M00****\r\n')
-
-        # retrieve data from serial port
-        # the temperature is represented in hex format ****
-        # b'{S00****\r\n'
-        current_time = time.time()
-        buf = b''
-        while True:
-            if time.time() - current_time > timeout:
-                if debug:
-                    print('ERROR: timeout exceeded:', buf)
-                return -1
-
-            time.sleep(0.1)
-
-            buf += self.serial.read(100)  # read up to 100 bytes
-
-            if buf.startswith(b'{S00') and buf.endswith(b'\r\n'):
-                break
-
-        if debug:
-            print(buf)
-
-        try:
-            str_hex = buf.decode().strip()[-4:]
-            val = int(str_hex, 16)
-            # temperature ranges from -151 to 500
-            if val > 50000:
-                val -= 65536
-            val /= 100
-        except:
-            return -1
-
-        return val
-
-    def set(self, T, timeout=1.0, debug=False):
-        '''
-        TODO
-        Huber Thermostat support temperature range from -151 to 500.
-        However, -1 is used to mean failure in this code.
-        Be careful.
-        '''
-        if T < -151 or T > 500:
-            return -1
-
-        val = T * 100
-        if val < 0:
-            val += 65536
-        cmd = '{M00%04X\r\n' % round(val)
-        self.serial.write(cmd.encode())
-
-        return self.read(timeout=timeout, debug=debug)
-
-    @staticmethod
-    def detect(debug=False):
-        devices = [p.device for p in serial.tools.list_ports.comports()]
-        for d in devices:
-            if not d.startswith('/dev/tty'):
-                continue
-
-            try:
-                dev = HuberThermostat(d)
-            except:
-                continue
-
-            if dev.read(debug=debug) != -1:
-                return dev
-
-        return None
 
 
 class JulaboThermostat(Thermostat):
     '''
-    Julabo Thermostat
-    TODO to be implemented
+    Julabo Thermostat.
+    in_sp_00 reads the setpoint e.g. b'25.00\r\n', and out_sp_00 xx.xx sets it without reply
     '''
 
+    serial_options = {'baudrate': 4800, 'bytesize': 7, 'parity': 'E', 'rtscts': True}
+    read_codec = Codec(b'in_sp_00\r', b'\r\n', regex_parser(rb'(-?[\d.]+)\s*\r\n$'))
+    set_codec = Codec(b'out_sp_00 %s\r', encode=lambda val: b'%.2f' % val)
+
     def __init__(self, port):
         super().__init__(port)
+        self.setup()
 
+    def setup(self):
         # clean buffer. It can take a while for data been fully transmitted
-        time.sleep(1.0)
+        clock.sleep(1.0)
         self.serial.reset_input_buffer()
 
-    def read(self, timeout=1.0, debug=False):
-        return -1
-
-    def set(self, val, timeout=1.0, debug=False):
-        pass
-
-    @staticmethod
-    def detect(debug=False):
-        devices = [p.device for p in serial.tools.list_ports.comports()]
-        for d in devices:
-            if not d.startswith('/dev/tty'):
-                continue
-
-            try:
-                dev = JulaboThermostat(d)
-            except:
-                continue
-
-            if dev.read(debug=debug) != -1:
-                return dev
-
-        return None
-
 
 class DummyT(Device):
     def __init__(self):
@@ -398,10 +672,10 @@ class DummyT(Device):
 class DummyP(Device):
     def __init__(self):
         super().__init__()
-        self.t0 = datetime.now().timestamp()
+        self.t0 = clock.time()
 
     def read(self):
-        delt = datetime.now().timestamp() - self.t0
+        delt = clock.time() - self.t0
         tau = 60.0
         return (1013.0 * 2.718 ** (- delt / tau) + 50.0 * np.random.random_sample() - 25.0)
 
@@ -0,0 +1,197 @@
+'''
+Emulators of the serial devices on pseudo terminals, for testing and benchmarking without hardware.
+The device classes open the port of an emulator as if it were a real serial port, e.g.
+    emu = FlukeEmulator(value=30.0, latency=0.05)
+    emu.start()
+    temp = FlukeThermometer(emu.port)
+Only works on systems with pseudo terminals, e.g. Linux
+'''
+
+import os
+import tty
+import time
+import select
+import threading
+import numpy as np
+from . import clock
+
+
+class Emulator(object):
+    '''
+    A device answering the commands written to the slave side of a pseudo terminal.
+    Commands end with CR. The response of each command is written after latency seconds of the clock.
+    Imperfections of the serial link can be added:
+    noise is the std of normal noise added to the value,
+    drop is the probability of losing each byte of response,
+    garbage is the probability of inserting random bytes into a response.
+    value is a number, or a function of time returning the value.
+    '''
+
+    def __init__(self, value=0.0, latency=0.0, noise=0.0, drop=0.0, garbage=0.0, seed=None):
+        self.value = value
+        self.latency = latency
+        self.noise = noise
+        self.drop = drop
+        self.garbage = garbage
+        self._random = np.random.RandomState(seed)
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        # statistics
+        self.n_command = 0
+        self.n_dropped = 0
+        self.n_garbage = 0
+
+        self._running = False
+        self._thread = None
+
+    def __str__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.port)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._running = False
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def measure(self):
+        '''
+        The value at this moment with noise
+        '''
+        val = self.value(clock.time()) if callable(self.value) else self.value
+        if self.noise > 0:
+            val += self._random.normal(0, self.noise)
+        return val
+
+    def respond(self, command):
+        '''
+        Return the response to a command without CR, or None if there is no response
+        '''
+        raise NotImplementedError('Method not supported')
+
+    def _corrupt(self, response):
+        if self.drop > 0:
+            keep = self._random.random_sample(len(response)) >= self.drop
+            self.n_dropped += len(response) - np.count_nonzero(keep)
+            response = bytes(b for b, k in zip(response, keep) if k)
+        if self.garbage > 0 and self._random.random_sample() < self.garbage:
+            pos = self._random.randint(len(response) + 1)
+            noise = bytes(self._random.randint(0, 256, self._random.randint(1, 8)).astype(np.uint8))
+            response = response[:pos] + noise + response[pos:]
+            self.n_garbage += 1
+        return response
+
+    def _run(self):
+        buf = b''
+        while self._running:
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                buf += os.read(self._master, 1024)
+            except OSError:
+                break
+
+            while b'\r' in buf:
+                command, buf = buf.split(b'\r', 1)
+                command = command.strip(b'\n')
+                if not command:
+                    continue
+                self.n_command += 1
+                response = self.respond(command)
+                if response is None:
+                    continue
+                # wait in small real steps, so that it also works with a simulated clock
+                due = clock.time() + self.latency
+                while self._running and clock.time() < due:
+                    time.sleep(min(due - clock.time(), 1E-3))
+                os.write(self._master, self._corrupt(response))
+
+
+class FlukeEmulator(Emulator):
+    '''
+    Fluke thermometer. T returns the echo and the temperature e.g. b'T\\r\\nt:   32.728 C\\r\\n'
+    '''
+
+    def respond(self, command):
+        if command == b'T':
+            return b'T\r\nt: %8.3f C\r\n' % self.measure()
+        return None
+
+
+class GeEmulator(Emulator):
+    '''
+    GE pressure transducer. -*G returns the pressure with unit e.g. b'962.43 mbar\\r\\n'
+    '''
+
+    def respond(self, command):
+        if command == b'-*G':
+            return b'%.2f mbar\r\n' % self.measure()
+        return None
+
+
+class HuberEmulator(Emulator):
+    '''
+    Huber thermostat. {M00**** returns the setpoint in hex e.g. b'{S000BB8\\r\\n' for 30 C,
+    and {M00XXXX sets it and returns the new setpoint.
+    value is the initial setpoint
+    '''
+
+    def respond(self, command):
+        if not command.startswith(b'{M00') or len(command) != 8:
+            return None
+
+        if command[4:] != b'****':
+            try:
+                val = int(command[4:].decode(), 16)
+            except ValueError:
+                return None
+            if val > 50000:
+                val -= 65536
+            self.value = val / 100
+
+        val = round(self.measure() * 100)
+        if val < 0:
+            val += 65536
+        return b'{S00%04X\r\n' % val
+
+
+class JulaboEmulator(Emulator):
+    '''
+    Julabo thermostat. in_sp_00 returns the setpoint e.g. b'25.00\r\n', and out_sp_00 xx.xx sets it without reply.
+    value is the initial setpoint
+    '''
+
+    def respond(self, command):
+        if command == b'in_sp_00':
+            return b'%.2f\r\n' % self.measure()
+        if command.startswith(b'out_sp_00 '):
+            try:
+                self.value = float(command[10:])
+            except ValueError:
+                pass
+        return None
@@ -0,0 +1,98 @@
+'''
+Live plot of temperature and pressure with matplotlib, for gsplot.py, gsplot_k.py and gsanim.py
+'''
+
+import numpy as np
+
+
+class BlitPlot(object):
+    '''
+    Plot T and P in two axes with time in matplotlib date numbers, updated incrementally by update().
+    The lines and texts are created once and updated with set_data and set_text.
+    They are animated artists, drawn with blitting over a cached background of the axes, grids and labels.
+    The background is only redrawn when the data get out of the axis limits,
+    which are then extended with margins so that it happens rarely, or when the figure is redrawn e.g. resized.
+    '''
+
+    def __init__(self, fig, axt, axp, margin=0.2, x_min_span=60 / 86400, t_min_span=0.05, p_min_span=1.0):
+        self.fig = fig
+        self.axt = axt
+        self.axp = axp
+        self.margin = margin
+        self.x_min_span = x_min_span
+        self.t_min_span = t_min_span
+        self.p_min_span = p_min_span
+
+        for ax, label in ((axt, 'T / C'), (axp, 'P / mbar')):
+            ax.set_ylabel(label)
+            ax.grid(True, which='major', linestyle='--')
+            ax.xaxis_date()
+
+        self.line_t, = axt.plot([], [], 'ro-', linewidth=0.5, markersize=1.5, animated=True)
+        self.line_p, = axp.plot([], [], 'bo-', linewidth=0.5, markersize=1.5, animated=True)
+        self.text_t = axt.text(0.85, 0.8, '', transform=axt.transAxes, animated=True)
+        self.text_p = axp.text(0.85, 0.9, '', transform=axp.transAxes, animated=True)
+        self.artists = [self.line_t, self.line_p, self.text_t, self.text_p]
+
+        # number of full redraws and of blitted updates, for diagnosis
+        self.n_draw = 0
+        self.n_blit = 0
+
+        self._background = None
+        fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def _fit(self, get_lim, set_lim, array, min_span, follow=False):
+        '''
+        Extend the limits if the data get out of them, or shrink them if the data take a small part of them.
+        If follow is True, there is margin only after the data, which is for time.
+        Return whether the limits are changed
+        '''
+        array = np.asarray(array, dtype=float)
+        array = array[~np.isnan(array)]
+        if len(array) == 0:
+            return False
+
+        lo, hi = array.min(), array.max()
+        span = max(hi - lo, min_span)
+        lim_lo, lim_hi = get_lim()
+        if lo >= lim_lo and hi <= lim_hi and span > (lim_hi - lim_lo) / (1 + 2 * self.margin) ** 2:
+            return False
+
+        if follow:
+            set_lim(lo, lo + span * (1 + self.margin))
+        else:
+            set_lim(lo - span * self.margin, hi + span * self.margin)
+        return True
+
+    def update(self, xs, ts, ps, str_t='', str_p=''):
+        '''
+        Update the plot with the points (xs, ts, ps) and the texts of the last values
+        '''
+        self.line_t.set_data(xs, ts)
+        self.line_p.set_data(xs, ps)
+        self.text_t.set_text(str_t)
+        self.text_p.set_text(str_p)
+
+        # the axes share x
+        changed = self._fit(self.axt.get_xlim, self.axt.set_xlim, xs, self.x_min_span, follow=True)
+        changed |= self._fit(self.axt.get_ylim, self.axt.set_ylim, ts, self.t_min_span)
+        changed |= self._fit(self.axp.get_ylim, self.axp.set_ylim, ps, self.p_min_span)
+
+        canvas = self.fig.canvas
+        if changed or self._background is None:
+            canvas.draw()
+            self.n_draw += 1
+        else:
+            canvas.restore_region(self._background)
+            self._draw_artists()
+            self.n_blit += 1
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
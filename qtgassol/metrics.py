@@ -0,0 +1,146 @@
+'''
+Export the state of acquisition for monitoring, in Prometheus text format
+'''
+
+import os
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from . import clock
+
+
+def _format_value(value):
+    '''
+    Format a value as in the text format, where nan and infinity are NaN, +Inf and -Inf
+    '''
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+class Metrics(object):
+    '''
+    Latest values of the acquisition.
+    set() only stores the value under a lock, so that it can be called in the acquisition loop.
+    '''
+
+    def __init__(self, prefix='gassol'):
+        self.prefix = prefix
+        self.start_time = clock.time()
+        self._lock = threading.Lock()
+        self._help = {}
+        self._type = {}
+        self._values = {}
+
+    def set(self, name, value, help='', type='gauge', labels=None):
+        '''
+        Set the value of a metric. labels is a dict e.g. {'device': 'T'}
+        '''
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        with self._lock:
+            if name not in self._help:
+                self._help[name] = help
+                self._type[name] = type
+            self._values[key] = value
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+
+        lines = ['# HELP %s_uptime_seconds Seconds since the start of acquisition' % self.prefix,
+                 '# TYPE %s_uptime_seconds gauge' % self.prefix,
+                 '%s_uptime_seconds %.3f' % (self.prefix, clock.time() - self.start_time)]
+        name_last = None
+        for (name, labels), value in sorted(values.items()):
+            full_name = self.prefix + '_' + name
+            if name != name_last:
+                lines.append('# HELP %s %s' % (full_name, self._help[name]))
+                lines.append('# TYPE %s %s' % (full_name, self._type[name]))
+                name_last = name
+            if labels:
+                full_name += '{%s}' % ','.join('%s="%s"' % (k, v) for k, v in labels)
+            lines.append('%s %s' % (full_name, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, filename):
+        '''
+        Write the metrics to a file atomically, e.g. for the textfile collector of node exporter
+        '''
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, filename)
+
+
+class MetricsServer(object):
+    '''
+    Serve the metrics over HTTP at /metrics in a background thread
+    '''
+
+    def __init__(self, metrics, host='127.0.0.1', port=9101):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+
+class TextfileExporter(object):
+    '''
+    Write the metrics to a file every interval seconds in a background thread
+    '''
+
+    def __init__(self, metrics, filename, interval=15.0):
+        self.metrics = metrics
+        self.filename = filename
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.metrics.write_textfile(self.filename)
+            except OSError:
+                pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.metrics.write_textfile(self.filename)
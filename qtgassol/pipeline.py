@@ -0,0 +1,199 @@
+'''
+Offline analysis of the log files written by MainUI and gsplot
+'''
+
+from datetime import datetime
+import numpy as np
+from .timeseries import find_anomaly_t, find_anomaly_p, interp_anomaly, find_steps, segment_stats, align_channels
+
+SUMMARY_COLUMNS = ['file', 'plateau', 'start', 'end', 'n',
+                   'T_ave', 'T_std', 'P_ave', 'P_std', 'n_anomaly_t', 'n_anomaly_p']
+
+
+def _parse_timestamp(date, clock):
+    # MainUI writes 2-digit years, gsplot writes 4-digit years
+    if len(date) == 8:
+        date = '20' + date
+    return date + 'T' + clock
+
+
+def format_stamps(timestamp, stamps):
+    '''
+    The comment line written by MainUI after a row of the log with the time each value was read,
+    in milliseconds after the time of the row, which is written in whole seconds. See load_channels()
+    '''
+    base = np.floor(timestamp)
+    return '%-20s' % '# Stamps(ms)' + ''.join(' %10i' % round((stamp - base) * 1000) for stamp in stamps)
+
+
+def load_channels(filename, stamps=False):
+    '''
+    Read a log file with any number of channels.
+    The names of channels are taken from the header line like "# Date Time T(C) P(mbar) T2(C)" written by MainUI.
+    A file appended by several sessions has a header for each session, and the rows are read by the header before them,
+    so that the channels of every session are found by name. Files without header have the channels T and P.
+    Return the array of time and a dict of the arrays of channels.
+    Time is in seconds since epoch of the timestamps as written in the file, without timezone conversion.
+    Comments and lines can not be parsed are skipped. Missing values are nan. The points are sorted by time.
+    If stamps is True, a dict of the times each value was read is also returned,
+    from the "# Stamps(ms)" line after each row, see format_stamps(). Rows without it have the time of the row
+    '''
+    names = ['T', 'P']
+    # the index in names of each column of the current header
+    columns = [0, 1]
+    dates = []
+    rows = []
+    offsets = {}
+    with open(filename) as f:
+        for line in f:
+            if line.startswith('#'):
+                words = line[1:].split()
+                if words[:2] == ['Date', 'Time'] and len(words) > 2:
+                    header = [w.split('(')[0] for w in words[2:]]
+                    names += [name for name in header if name not in names]
+                    columns = [names.index(name) for name in header]
+                elif words[:1] == ['Stamps(ms)'] and len(rows) > 0 and len(rows) - 1 not in offsets:
+                    try:
+                        offsets[len(rows) - 1] = [float(w) / 1000 for w in words[1:]]
+                    except ValueError:
+                        pass
+                continue
+
+            words = line.split()
+            if len(words) < 4:
+                continue
+
+            try:
+                rows.append((columns, [float(w) for w in words[2:]]))
+            except ValueError:
+                continue
+
+            dates.append(_parse_timestamp(words[0], words[1]))
+
+    time_array = np.array(dates, dtype='datetime64[ms]').astype(np.int64) / 1000
+    value_array = np.full((len(rows), len(names)), np.nan)
+    stamp_array = np.repeat(time_array[:, None], len(names), axis=1)
+    for i, (columns, row) in enumerate(rows):
+        n = min(len(columns), len(row))
+        value_array[i, columns[:n]] = row[:n]
+        if i in offsets:
+            m = min(n, len(offsets[i]))
+            stamp_array[i, columns[:m]] = time_array[i] + np.array(offsets[i][:m])
+
+    # bursts are written after the points they overlap with
+    order = np.argsort(time_array, kind='stable')
+    channels = {name: value_array[order, i] for i, name in enumerate(names)}
+    if stamps:
+        return time_array[order], channels, {name: stamp_array[order, i] for i, name in enumerate(names)}
+    return time_array[order], channels
+
+
+def load_log(filename):
+    '''
+    Read a log file.
+    Return the arrays of time, temperature and pressure. See load_channels()
+    '''
+    time_array, channels = load_channels(filename)
+    return time_array, channels['T'], channels['P']
+
+
+def format_time(timestamp):
+    '''
+    Format time returned by load_log() as ISO string e.g. 2020-12-01T14:57:14
+    '''
+    return str(np.datetime64(int(round(timestamp * 1000)), 'ms').astype('datetime64[s]'))
+
+
+def write_channels(time_array, channels, f, labels=None, localtime=False):
+    '''
+    Write the channels in the format of the log files, with a header and the time in milliseconds.
+    labels are written in the header instead of the names of channels, e.g. T(C).
+    If localtime is True, time is seconds since epoch and it is converted to local time as MainUI does.
+    Otherwise time is written as it is returned by load_channels().
+    '''
+    names = list(channels)
+    labels = labels or names
+    f.write('%-23s' % '# Date Time' + ''.join(' %10s' % label for label in labels) + '\n')
+    for i, timestamp in enumerate(time_array):
+        if localtime:
+            str_time = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        else:
+            str_time = str(np.datetime64(int(round(timestamp * 1000)), 'ms')).replace('T', ' ')
+        f.write('%-23s' % str_time + ''.join(' %10.4f' % channels[name][i] for name in names) + '\n')
+
+
+def resample_file(filename, dt, method='linear', max_gap=None):
+    '''
+    Read a log file and resample all its channels onto a common grid of interval dt.
+    Each value is placed at the time it was read if the file has it, see load_channels().
+    -1 is treated as error and skipped. See align_channels().
+    Return the grid and a dict of arrays
+    '''
+    _, channels, stamps = load_channels(filename, stamps=True)
+    channels = {name: np.where(array == -1, np.nan, array) for name, array in channels.items()}
+    for name in channels:
+        order = np.argsort(stamps[name], kind='stable')
+        stamps[name] = stamps[name][order]
+        channels[name] = channels[name][order]
+    return align_channels(stamps, channels, dt, method, max_gap)
+
+
+def analyse(time_array, t_array, p_array, window=20, rtol=1E-3, atol=0.05):
+    '''
+    Split a run into steps at the pressure jumps and find the converged pressure plateau of each step.
+    Calculate the averages on each plateau. Anomaly points are excluded from the averages.
+    Return a list of dict with keys in SUMMARY_COLUMNS except file.
+    '''
+    idx_anomaly_t = find_anomaly_t(t_array)
+    idx_anomaly_p = find_anomaly_p(p_array)
+
+    mask_t = np.ones(len(t_array), bool)
+    mask_t[idx_anomaly_t] = False
+    mask_p = np.ones(len(p_array), bool)
+    mask_p[idx_anomaly_p] = False
+
+    # anomaly points are spikes, they should not split a step
+    p_valid = interp_anomaly(p_array, idx_anomaly_p)
+
+    steps = find_steps(p_valid, window=window, rtol=rtol, atol=atol)
+    plateaus = steps[steps[:, 1] >= 0][:, 1:]
+    t_ave, t_std = segment_stats(np.where(mask_t, t_array, np.nan), plateaus)
+    p_ave, p_std = segment_stats(np.where(mask_p, p_array, np.nan), plateaus)
+
+    rows = []
+    for i, (start, end) in enumerate(plateaus):
+        rows.append({
+            'plateau': i,
+            'start': time_array[start],
+            'end': time_array[end - 1],
+            'n': end - start,
+            'T_ave': t_ave[i],
+            'T_std': t_std[i],
+            'P_ave': p_ave[i],
+            'P_std': p_std[i],
+            'n_anomaly_t': np.count_nonzero(~mask_t[start:end]),
+            'n_anomaly_p': np.count_nonzero(~mask_p[start:end]),
+        })
+
+    return rows
+
+
+def analyse_file(filename, **kwargs):
+    '''
+    Analyse one log file. The keyword arguments are passed to analyse()
+    '''
+    rows = analyse(*load_log(filename), **kwargs)
+    for row in rows:
+        row['file'] = filename
+    return rows
+
+
+def write_summary(rows, f):
+    '''
+    Write the summary table in the same whitespace separated style as the log files
+    '''
+    f.write('# ' + ' '.join(SUMMARY_COLUMNS) + '\n')
+    for row in rows:
+        f.write('%s %4i %s %s %6i %10.3f %10.4f %10.2f %10.3f %4i %4i\n' % (
+            row['file'], row['plateau'], format_time(row['start']), format_time(row['end']), row['n'],
+            row['T_ave'], row['T_std'], row['P_ave'], row['P_std'], row['n_anomaly_t'], row['n_anomaly_p']))
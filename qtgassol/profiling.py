@@ -0,0 +1,96 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+
+class LatencyHistogram(object):
+    '''
+    Durations of the last size calls, for percentiles.
+    count and maximum cover all calls
+    '''
+
+    def __init__(self, size=1000):
+        self._values = deque(maxlen=size)
+        self.count = 0
+        self.maximum = 0.0
+
+    def add(self, duration):
+        self._values.append(duration)
+        self.count += 1
+        self.maximum = max(self.maximum, duration)
+
+    def percentile(self, q):
+        if len(self._values) == 0:
+            return np.nan
+        return np.percentile(self._values, q)
+
+    @property
+    def last(self):
+        return self._values[-1] if len(self._values) > 0 else np.nan
+
+
+class Profiler(object):
+    '''
+    Time the phases of the hot path with monotonic clock, and count events like errors.
+    It can be shared by threads, e.g. the burst recorder times its reads in its own thread
+    '''
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = LatencyHistogram(self.size)
+            self.histograms[name].add(duration)
+
+    def last(self, name):
+        '''
+        The last duration of a phase, or None if it is never timed
+        '''
+        with self._lock:
+            hist = self.histograms.get(name)
+            return None if hist is None else hist.last
+
+    @contextmanager
+    def timer(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_count(self, name, n):
+        '''
+        Set a counter kept elsewhere, e.g. the errors of a device
+        '''
+        with self._lock:
+            self.counters[name] = n
+
+    def report(self):
+        '''
+        A table of the durations in milliseconds and the counters
+        '''
+        lines = ['%-24s %8s %8s %8s %8s' % ('# Phase', 'count', 'p50(ms)', 'p95(ms)', 'max(ms)')]
+        with self._lock:
+            for name, hist in self.histograms.items():
+                lines.append('%-24s %8i %8.1f %8.1f %8.1f' % (name, hist.count, hist.percentile(50) * 1000,
+                                                              hist.percentile(95) * 1000, hist.maximum * 1000))
+            if len(self.counters) > 0:
+                lines.append('%-24s %8s' % ('# Counter', 'count'))
+                for name, n in self.counters.items():
+                    lines.append('%-24s %8i' % (name, n))
+        return '\n'.join(lines)
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.report() + '\n')
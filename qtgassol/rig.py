@@ -0,0 +1,221 @@
+'''
+Device groups of apparatuses, for running several of them in one process
+'''
+
+import json
+import threading
+import functools
+from . import clock
+from .device import FlukeThermometer, GeManometer, HuberThermostat, DummyT, DummyP, DummyFile
+from .emulator import FlukeEmulator, GeEmulator, HuberEmulator
+from .channel import Channel, default_channels, spread_channels, read_channels
+from .sampling import oversample
+
+
+# the classes of serial devices opened by open_device() for each kind
+DEVICE_CLASSES = {'temp': FlukeThermometer, 'press': GeManometer, 'thermostat': HuberThermostat}
+
+
+class DetectionError(Exception):
+    pass
+
+
+def open_device(kind, spec, isolate=False, options=None):
+    '''
+    Open a device from its specification, as for the options of main.py.
+    kind is temp, press or thermostat.
+    auto means detect the device automatically, and DetectionError is raised if it is not found.
+    emulate means talk to an emulator of the device on a pseudo terminal, which is kept as attribute emulator.
+    For thermostat, none means no thermostat and None is returned.
+    If isolate is True, serial devices are opened and read in a child process, see worker.py
+    options are passed to the class of serial devices, e.g. {'speed': 1} for GeManometer
+    '''
+    options = options or {}
+    if kind == 'temp':
+        dummy, column, name = DummyT, -2, 'Thermometer'
+        emulator = lambda: FlukeEmulator(25.0, latency=0.05, noise=0.002)
+    elif kind == 'press':
+        dummy, column, name = DummyP, -1, 'Manometer'
+        emulator = lambda: GeEmulator(1013.0, latency=0.05, noise=0.05)
+    elif kind == 'thermostat':
+        dummy, column, name = None, None, 'Thermostat'
+        emulator = lambda: HuberEmulator(25.0, latency=0.05)
+    else:
+        raise ValueError('Unknown device kind: ' + kind)
+    cls = DEVICE_CLASSES[kind]
+
+    if isolate and (spec in ('auto', 'emulate') or spec.startswith('/dev')):
+        # imported here because worker imports this module
+        from .worker import open_isolated
+        return open_isolated(kind, spec, options)
+
+    if spec == 'auto':
+        dev = cls.detect(**options)
+        if dev is None:
+            raise DetectionError('%s not detected. Try again or specify the device.' % name)
+        return dev
+    elif spec.startswith('/dev'):
+        return cls(spec, **options)
+    elif spec == 'emulate':
+        emu = emulator()
+        emu.start()
+        dev = cls(emu.port, **options)
+        dev.emulator = emu
+        return dev
+    elif kind == 'thermostat':
+        return None
+    elif spec == 'dummy':
+        return dummy()
+    else:
+        return DummyFile(spec, column)
+
+
+def parse_channel(spec, opened=None, isolate=False):
+    '''
+    Open the device of an extra channel from its specification name,unit,kind,device[,precision[,samples]]
+    e.g. T2,C,temp,/dev/ttyUSB2 or Tbath,C,thermostat,/dev/ttyACM0
+    samples is the number of reads averaged for every point, see sampling.Oversampled
+    opened is a dict of the devices already opened with (kind, device) as key, which are shared instead of opened again
+    '''
+    words = spec.split(',')
+    if len(words) not in (4, 5, 6):
+        raise ValueError('Invalid channel: ' + spec)
+    name, unit, kind, device = words[:4]
+    precision = int(words[4]) if len(words) >= 5 else 3
+    samples = int(words[5]) if len(words) == 6 else 1
+    if opened is not None and (kind, device) in opened:
+        return Channel(name, unit, oversample(opened[(kind, device)], samples), precision)
+    dev = open_device(kind, device, isolate)
+    if dev is None:
+        raise DetectionError('Device for channel %s not found' % name)
+    return Channel(name, unit, oversample(dev, samples), precision)
+
+
+class Rig(object):
+    '''
+    The devices and log file of one apparatus.
+    channels are T, P and the extra channels, followed by the std, min and max of the oversampled channels
+    if spread is True
+    '''
+
+    def __init__(self, name, thermometer, manometer, thermostat=None, output='output.txt', channels=None,
+                 spread=False):
+        self.name = name
+        self.thermometer = thermometer
+        self.manometer = manometer
+        self.thermostat = thermostat
+        self.output = output
+        self.channels = default_channels(thermometer, manometer) + list(channels or [])
+        if spread:
+            self.channels += spread_channels(self.channels)
+
+    def __str__(self):
+        return '<Rig %s: %s %s %s>' % (self.name, self.thermometer, self.manometer, self.thermostat)
+
+
+def load_rigs(filename, isolate=False):
+    '''
+    Open the devices of all rigs in a JSON config file, which is a list of rigs like
+    {"name": "cell1", "temp": "/dev/ttyUSB0", "press": "/dev/ttyUSB1", "thermostat": "/dev/ttyACM0",
+     "output": "cell1.txt", "channels": ["T2,C,temp,/dev/ttyUSB2"],
+     "press_speed": 2, "samples": {"T": 1, "P": 5}, "spread": true}
+    thermostat, output, channels and the acquisition profile are optional. See parse_channel() for the extra channels.
+    press_speed is the integration speed of the manometer, samples the number of reads averaged for every point,
+    and spread whether the std, min and max of these reads are logged.
+    If isolate is True, serial devices are opened in child processes.
+    Automatic detection is not allowed because it cannot tell the rigs apart.
+    '''
+    with open(filename) as f:
+        config = json.load(f)
+
+    rigs = []
+    for i, c in enumerate(config):
+        name = c.get('name', 'rig%i' % i)
+        specs = {kind: c.get(kind, 'none' if kind == 'thermostat' else 'dummy')
+                 for kind in ('temp', 'press', 'thermostat')}
+        if 'auto' in specs.values():
+            raise DetectionError('Automatic detection is not supported for rig %s. Specify the devices.' % name)
+        options = {'press': {'speed': c['press_speed']}} if 'press_speed' in c else {}
+        opened = {(kind, spec): open_device(kind, spec, isolate, options.get(kind))
+                  for kind, spec in specs.items()}
+        samples = c.get('samples', {})
+        rigs.append(Rig(name,
+                        oversample(opened[('temp', specs['temp'])], samples.get('T', 1)),
+                        oversample(opened[('press', specs['press'])], samples.get('P', 1)),
+                        opened[('thermostat', specs['thermostat'])],
+                        c.get('output', name + '.txt'),
+                        [parse_channel(spec, opened, isolate) for spec in c.get('channels', [])],
+                        c.get('spread', False)))
+    return rigs
+
+
+def _device_groups(rig):
+    '''
+    The indices of the channels of a rig grouped by device, in the order of the first channel of each device
+    '''
+    by_device = {}
+    for i, ch in enumerate(rig.channels):
+        # the device under Oversampled, so that channels sharing it are read in one task
+        device = getattr(ch.device, 'device', ch.device)
+        by_device.setdefault(id(device), []).append(i)
+    return list(by_device.values())
+
+
+def _assemble(rig, groups, results):
+    '''
+    The reading of a rig from the results of read_channels() for the groups of channels
+    '''
+    values = [None] * len(rig.channels)
+    stamps = [None] * len(rig.channels)
+    durations = [None] * len(rig.channels)
+    for idx, (_, values_device, stamps_device, durations_device) in zip(groups, results):
+        for i, val, stamp, duration in zip(idx, values_device, stamps_device, durations_device):
+            values[i] = val
+            stamps[i] = stamp
+            durations[i] = duration
+    return sum(stamps) / len(stamps), values, stamps, durations
+
+
+def read_rigs(rigs, executor):
+    '''
+    Read the channels of all rigs concurrently with executor.
+    Every device is read in its own task, so the time costs as much as the slowest device.
+    Channels of the same device are read one after another in the task of the device.
+    Each value is stamped at the midpoint of its request and response, and the point at the mean of the stamps.
+    Return a list of (timestamp, values, stamps, durations) in the order of rigs, where durations are of the reads
+    '''
+    tasks = []
+    for rig in rigs:
+        groups = _device_groups(rig)
+        tasks.append((groups, [executor.submit(read_channels, [rig.channels[i] for i in idx]) for idx in groups]))
+    return [_assemble(rig, groups, [future.result() for future in futures])
+            for rig, (groups, futures) in zip(rigs, tasks)]
+
+
+def submit_rig(rig, executor, callback):
+    '''
+    Read the channels of a rig with executor as read_rigs() without waiting for the devices.
+    callback(reading) is called in a thread of executor when all the devices are read.
+    A device which fails with an exception gives -1 for its channels
+    '''
+    groups = _device_groups(rig)
+    results = [None] * len(groups)
+    lock = threading.Lock()
+    remaining = [len(groups)]
+
+    def done(k, future):
+        try:
+            results[k] = future.result()
+        except Exception:
+            t = clock.time()
+            n = len(groups[k])
+            results[k] = t, [-1] * n, [t] * n, [0.0] * n
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        callback(_assemble(rig, groups, results))
+
+    for k, idx in enumerate(groups):
+        future = executor.submit(read_channels, [rig.channels[i] for i in idx])
+        future.add_done_callback(functools.partial(done, k))
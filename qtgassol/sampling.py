@@ -0,0 +1,272 @@
+import threading
+from collections import deque
+import numpy as np
+from . import clock
+from .profiling import Profiler
+
+
+class Oversampled(object):
+    '''
+    A device read n times per read(), e.g. for a profile trading time of a tick for precision.
+    read() returns the mean of the valid values, or -1 if all fail.
+    The statistics of the last read are kept as stats (mean, std, min, max, number of valid values),
+    and stamp is the midpoint of the reads. Other attributes are those of the device
+    '''
+
+    def __init__(self, device, n):
+        self.device = device
+        self.n = n
+        self.stats = None
+        self.stamp = None
+
+    def __str__(self):
+        return '<Oversampled %i: %s>' % (self.n, self.device)
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def read(self, **kwargs):
+        t0 = clock.time()
+        values = np.array([self.device.read(**kwargs) for _ in range(self.n)], dtype=float)
+        self.stamp = (t0 + clock.time()) / 2
+        # -1 means error
+        values = values[values != -1]
+        if len(values) == 0:
+            self.stats = None
+            return -1
+
+        self.stats = values.mean(), values.std(), values.min(), values.max(), len(values)
+        return float(self.stats[0])
+
+
+def oversample(device, n):
+    '''
+    The device read n times per read(), or itself if n is 1
+    '''
+    return Oversampled(device, n) if n > 1 else device
+
+
+class AdaptiveInterval(object):
+    '''
+    Choose the sampling interval from the activity of the signals.
+    A signal is active if the rate of change between the last two points exceeds rate_thresholds,
+    or the std of the last window points exceeds std_thresholds.
+    The interval drops to dt_min as soon as any signal is active,
+    and grows by factor growth with every quiet point until dt_max.
+    '''
+
+    def __init__(self, dt_min, dt_max, rate_thresholds, std_thresholds, growth=1.5, window=5):
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+        self.rate_thresholds = rate_thresholds
+        self.std_thresholds = std_thresholds
+        self.growth = growth
+        self.window = window
+        self.interval = dt_min
+
+        self._histories = [deque(maxlen=window) for _ in rate_thresholds]
+
+    def is_active(self, timestamp, values):
+        '''
+        Add a point and return whether any signal is active.
+        nan or -1 means error, such values are ignored
+        '''
+        active = False
+        for i, val in enumerate(values):
+            if val == -1 or np.isnan(val):
+                continue
+
+            history = self._histories[i]
+            if len(history) > 0:
+                t_last, val_last = history[-1]
+                if timestamp > t_last and abs(val - val_last) / (timestamp - t_last) > self.rate_thresholds[i]:
+                    active = True
+
+            history.append((timestamp, val))
+            if len(history) == self.window and np.std([v for _, v in history]) > self.std_thresholds[i]:
+                active = True
+
+        return active
+
+    def update(self, timestamp, values):
+        '''
+        Add a point and return the interval until next point
+        '''
+        if self.is_active(timestamp, values):
+            self.interval = self.dt_min
+        else:
+            self.interval = min(self.interval * self.growth, self.dt_max)
+        self.interval = max(self.interval, self.dt_min)
+        return self.interval
+
+
+class BurstRecorder(object):
+    '''
+    Read the thermometer and manometer continuously in a background thread as fast as they respond.
+    The points of the last pre_trigger seconds are kept in a ring buffer.
+    When triggered, by a pressure step larger than p_step between two points or by trigger(),
+    the buffered points and the points in the following post_trigger seconds make a burst.
+    Bursts are collected with pop_bursts() as tuples of (trigger time, reason, points),
+    where points is a list of (timestamp, T, P).
+    Do not read the devices elsewhere while it is running.
+    The reads are timed with profiler.
+    '''
+
+    def __init__(self, thermometer, manometer, pre_trigger=10.0, post_trigger=30.0, p_step=5.0, profiler=None):
+        self.thermometer = thermometer
+        self.manometer = manometer
+        self.pre_trigger = pre_trigger
+        self.post_trigger = post_trigger
+        self.p_step = p_step
+        self.profiler = profiler or Profiler()
+
+        self._lock = threading.Lock()
+        self._buffer = deque()
+        self._latest = None
+        self._p_last = None
+        self._reason = None
+        self._burst = None
+        self._t_end = None
+        self._bursts = []
+        # timestamps of the points logged elsewhere
+        self._logged = set()
+
+        self._running = False
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stop reading. A burst in progress is finished with the points read so far
+        '''
+        if self._thread is None:
+            return
+
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        with self._lock:
+            if self._burst is not None:
+                self._bursts.append(self._burst)
+                self._burst = None
+            self._buffer.clear()
+            self._p_last = None
+
+    def _run(self):
+        while self._running:
+            # the point is stamped at the midpoint of both reads
+            t0 = clock.time()
+            with self.profiler.timer('read T'):
+                t = self.thermometer.read()
+            with self.profiler.timer('read P'):
+                p = self.manometer.read()
+            self.add((t0 + clock.time()) / 2, t, p)
+
+    def shared_channels(self, channels):
+        '''
+        The channels read from the thermometer or manometer of the recorder, e.g. T2 of a thermometer with two probes.
+        They cannot be read elsewhere while the recorder is running, because the requests would interleave on the port
+        '''
+        devices = [getattr(dev, 'device', dev) for dev in (self.thermometer, self.manometer)]
+        return [ch for ch in channels if any(getattr(ch.device, 'device', ch.device) is dev for dev in devices)]
+
+    def trigger(self, reason='manual'):
+        '''
+        Start a burst at next point
+        '''
+        with self._lock:
+            self._reason = reason
+
+    def add(self, timestamp, t, p):
+        with self._lock:
+            point = (timestamp, t, p)
+            self._latest = point
+
+            # -1 means error
+            if p != -1:
+                if self.p_step is not None and self._p_last is not None and abs(p - self._p_last) > self.p_step:
+                    self._reason = 'P step %.2f' % (p - self._p_last)
+                self._p_last = p
+
+            if self._burst is None:
+                self._buffer.append(point)
+                while self._buffer[0][0] < timestamp - self.pre_trigger:
+                    self._buffer.popleft()
+            else:
+                self._burst[2].append(point)
+
+            if self._reason is not None:
+                if self._burst is None:
+                    self._burst = (timestamp, self._reason, list(self._buffer))
+                    self._buffer.clear()
+                self._t_end = timestamp + self.post_trigger
+                self._reason = None
+
+            elif self._burst is not None and timestamp >= self._t_end:
+                self._bursts.append(self._burst)
+                self._burst = None
+
+    def latest(self):
+        '''
+        The last point (timestamp, T, P), or None if nothing has been read
+        '''
+        with self._lock:
+            return self._latest
+
+    def oldest(self):
+        '''
+        The timestamp of the oldest point which may still be in a burst, or None if there is none
+        '''
+        with self._lock:
+            return self._oldest()
+
+    def _oldest(self):
+        held = [points for _, _, points in self._bursts]
+        if self._burst is not None:
+            held.append(self._burst[2])
+        held.append(self._buffer)
+        for points in held:
+            if len(points) > 0:
+                return points[0][0]
+        return None
+
+    def mark_logged(self, timestamp):
+        '''
+        Record that the point at timestamp is logged elsewhere, e.g. as a normal row, so that it is not written again
+        with a burst, see is_logged(). The points which can no longer be in a burst are forgotten
+        '''
+        with self._lock:
+            oldest = self._oldest()
+            if oldest is None:
+                self._logged = set()
+            else:
+                self._logged = {x for x in self._logged if x >= oldest}
+            self._logged.add(timestamp)
+
+    def is_logged(self, timestamp):
+        with self._lock:
+            return timestamp in self._logged
+
+    @property
+    def is_bursting(self):
+        return self._burst is not None
+
+    def pop_bursts(self):
+        '''
+        Return the finished bursts and remove them from the recorder
+        '''
+        with self._lock:
+            bursts = self._bursts
+            self._bursts = []
+        return bursts
@@ -1,3 +1,5 @@
+import bisect
+from collections import deque
 import numpy as np
 
 
@@ -33,8 +35,458 @@ def detect_anomaly_p(references, point):
     return detect_anomaly(references, point)
 
 
-def detect_convergence(array):
+class RollingMedian(object):
     '''
-    Detect whether and when the time series converges
+    Median and MAD (median absolute deviation) of the last window points.
+    The points are kept in a sorted buffer, so that locating a point, the median and the MAD cost O(log w).
     '''
-    pass
+
+    def __init__(self, window=21):
+        self.window = window
+        self._values = deque()
+        self._sorted = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def update(self, value):
+        if len(self._values) == self.window:
+            old = self._values.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+
+        self._values.append(value)
+        bisect.insort(self._sorted, value)
+
+    @property
+    def median(self):
+        n = len(self._sorted)
+        if n == 0:
+            return np.nan
+        if n % 2 == 1:
+            return self._sorted[n // 2]
+        return (self._sorted[n // 2 - 1] + self._sorted[n // 2]) / 2
+
+    @property
+    def mad(self):
+        n = len(self._sorted)
+        if n == 0:
+            return np.nan
+        median = self.median
+        if n % 2 == 1:
+            return self._kth_deviation(median, n // 2)
+        return (self._kth_deviation(median, n // 2 - 1) + self._kth_deviation(median, n // 2)) / 2
+
+    def _kth_deviation(self, median, k):
+        '''
+        The k-th smallest |x - median|.
+        The deviations of points below and above the median are two sorted sequences,
+        so that the k-th smallest one can be found with a binary search on the number taken from the lower one.
+        '''
+        s = self._sorted
+        i = bisect.bisect_left(s, median)
+        n_low = i
+        n_high = len(s) - i
+
+        def low(j):
+            return median - s[i - 1 - j] if j < n_low else np.inf
+
+        def high(j):
+            return s[i + j] - median if j >= 0 else -np.inf
+
+        # take x points from the lower sequence and k + 1 - x from the higher one
+        lo, hi = max(0, k + 1 - n_high), min(k + 1, n_low)
+        while lo < hi:
+            x = (lo + hi) // 2
+            if high(k - x) > low(x):
+                lo = x + 1
+            else:
+                hi = x
+
+        x = lo
+        return max(low(x - 1) if x > 0 else -np.inf, high(k - x))
+
+
+class RollingAnomalyFilter(RollingMedian):
+    '''
+    Detect anomaly points as they arrive.
+    A point is low if it is smaller than median - threshold * sigma of the previous window points,
+    where sigma = 1.4826 * MAD, but no smaller than min_scale.
+    candidate(point, median) can be used to check only the points satisfying specific rules.
+    A low point is anomaly only if the next point is not low, otherwise it is a step change.
+    '''
+
+    def __init__(self, window=21, threshold=3.0, min_scale=0.0, min_points=5, candidate=None):
+        super().__init__(window)
+        self.threshold = threshold
+        self.min_scale = min_scale
+        self.min_points = min_points
+        self.candidate = candidate
+
+        self._limit_last = None
+
+    def check(self, point):
+        '''
+        Add a point and return whether the previous point is anomaly
+        '''
+        is_anomaly = self._limit_last is not None and point >= self._limit_last
+
+        self._limit_last = None
+        if len(self) >= self.min_points:
+            median = self.median
+            if self.candidate is None or self.candidate(point, median):
+                limit = median - self.threshold * max(1.4826 * self.mad, self.min_scale)
+                if point < limit:
+                    self._limit_last = limit
+
+        self.update(point)
+        return is_anomaly
+
+
+def rolling_filter_t(window=21, threshold=3.0, min_scale=0.001):
+    '''
+    RollingAnomalyFilter for temperature with the rule of detect_anomaly_t
+    '''
+    return RollingAnomalyFilter(window, threshold, min_scale,
+                                candidate=lambda point, median: (point * 10) % 1 <= 1E-3)
+
+
+def rolling_filter_p(window=21, threshold=3.0, min_scale=0.01):
+    '''
+    RollingAnomalyFilter for pressure with the rule of detect_anomaly_p
+    '''
+    return RollingAnomalyFilter(window, threshold, min_scale,
+                                candidate=lambda point, median: point <= median / 2)
+
+
+class RunningStats(object):
+    '''
+    Running mean and variance with Welford's algorithm. Each update costs O(1)
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    def remove(self, value):
+        '''
+        Remove a value which has been added before
+        '''
+        if self.n <= 1:
+            self.n = 0
+            self.mean = 0.0
+            self._m2 = 0.0
+            return
+
+        delta = value - self.mean
+        self.n -= 1
+        self.mean -= delta / self.n
+        self._m2 = max(self._m2 - delta * (value - self.mean), 0.0)
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    @property
+    def var(self):
+        '''
+        Population variance, the same as np.var
+        '''
+        if self.n == 0:
+            return np.nan
+        return self._m2 / self.n
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+class EWMA(object):
+    '''
+    Exponentially weighted moving average and variance.
+    alpha is the weight of the new value
+    '''
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.n = 0
+        self.mean = np.nan
+        self.var = np.nan
+
+    def update(self, value):
+        self.n += 1
+        if self.n == 1:
+            self.mean = value
+            self.var = 0.0
+            return
+
+        delta = value - self.mean
+        self.mean += self.alpha * delta
+        self.var = (1 - self.alpha) * (self.var + self.alpha * delta * delta)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+class WindowedStats(RunningStats):
+    '''
+    Running mean and variance of the values in the last span seconds.
+    Values leaving the window are removed from the statistics in amortized O(1).
+    The statistics are recalculated once the whole window has been replaced, to avoid accumulating rounding error.
+    '''
+
+    def __init__(self, span):
+        super().__init__()
+        self.span = span
+        self._window = deque()
+        self._n_removed = 0
+
+    def update(self, value, timestamp):
+        self._window.append((timestamp, value))
+        super().update(value)
+
+        while self._window[0][0] < timestamp - self.span:
+            _, old = self._window.popleft()
+            super().remove(old)
+            self._n_removed += 1
+
+        if self._n_removed > len(self._window):
+            super().reset()
+            for _, v in self._window:
+                super().update(v)
+            self._n_removed = 0
+
+    def reset(self):
+        super().reset()
+        self._window = deque()
+        self._n_removed = 0
+
+
+def _neighbour_stats(array):
+    '''
+    Mean and std of the four neighbours (i-2, i-1, i+1, i+2) of every point from 2 to n-3
+    '''
+    windows = np.lib.stride_tricks.sliding_window_view(array, 5)
+    references = windows[:, [0, 1, 3, 4]]
+    return references.mean(axis=1), references.std(axis=1)
+
+
+def find_anomaly_t(array, threshold=3.0):
+    '''
+    Vectorized version of detect_anomaly_t applied to a whole series.
+    Return the indices of anomaly points. The first and last two points are never anomaly.
+    '''
+    array = np.asarray(array, dtype=float)
+    if len(array) < 5:
+        return np.array([], dtype=int)
+
+    mean, std = _neighbour_stats(array)
+    points = array[2:-2]
+    is_anomaly = ((points * 10) % 1 <= 1E-3) & (points < mean - threshold * std)
+    return np.nonzero(is_anomaly)[0] + 2
+
+
+def find_anomaly_p(array, threshold=3.0):
+    '''
+    Vectorized version of detect_anomaly_p applied to a whole series.
+    Return the indices of anomaly points. The first and last two points are never anomaly.
+    '''
+    array = np.asarray(array, dtype=float)
+    if len(array) < 5:
+        return np.array([], dtype=int)
+
+    mean, std = _neighbour_stats(array)
+    points = array[2:-2]
+    is_anomaly = (points <= mean / 2) & (points < mean - threshold * std)
+    return np.nonzero(is_anomaly)[0] + 2
+
+
+def interp_anomaly(array, idx_anomaly):
+    '''
+    Replace the anomaly points by linear interpolation of the valid points around them
+    '''
+    array = np.asarray(array, dtype=float)
+    mask = np.ones(len(array), bool)
+    mask[idx_anomaly] = False
+    if not mask.any():
+        return array.copy()
+
+    return np.interp(np.arange(len(array)), np.nonzero(mask)[0], array[mask])
+
+
+def detect_convergence(array, window=20, rtol=1E-3, atol=0.05):
+    '''
+    Detect whether and when the time series converges.
+    The converged value is the median of the last window points.
+    Return the index from which all points stay within atol + rtol * |converged value|,
+    or -1 if less than window points converge.
+    '''
+    array = np.asarray(array, dtype=float)
+    if len(array) < window:
+        return -1
+
+    value = np.median(array[-window:])
+    outside = np.nonzero(np.abs(array - value) > atol + rtol * abs(value))[0]
+    idx = outside[-1] + 1 if len(outside) > 0 else 0
+    if len(array) - idx < window:
+        return -1
+
+    return idx
+
+
+def segment_steps(array, nsigma=8.0, jump_rtol=1E-2, merge=2):
+    '''
+    Split a run into steps separated by sharp jumps, e.g. filling or expansion of gas.
+    A difference between neighbouring points is a jump if it is larger than
+    nsigma * noise + jump_rtol * |value|. The noise is estimated from the MAD of the differences.
+    Jumps separated by no more than merge points are treated as one jump.
+    Return an integer array of shape (n, 2) with the start and end (exclusive) index of each step.
+    The points during a jump belong to no step.
+    '''
+    array = np.asarray(array, dtype=float)
+    n = len(array)
+    if n < 2:
+        return np.array([[0, n]] if n > 0 else [], dtype=int).reshape(-1, 2)
+
+    diff = np.diff(array)
+    noise = 1.4826 * np.median(np.abs(diff - np.median(diff)))
+    idx_jump = np.nonzero(np.abs(diff) > nsigma * noise + jump_rtol * np.abs(array[1:]))[0]
+    if len(idx_jump) == 0:
+        return np.array([[0, n]], dtype=int)
+
+    # diff[i] is between point i and i+1. A jump cluster from diff i to j covers points i+1 to j
+    breaks = np.nonzero(np.diff(idx_jump) > merge)[0]
+    jump_first = idx_jump[np.concatenate([[0], breaks + 1])]
+    jump_last = idx_jump[np.concatenate([breaks, [len(idx_jump) - 1]])]
+
+    starts = np.concatenate([[0], jump_last + 1])
+    ends = np.concatenate([jump_first + 1, [n]])
+    keep = ends > starts
+    return np.stack([starts[keep], ends[keep]], axis=1)
+
+
+def segment_stats(array, bounds):
+    '''
+    Calculate the mean and std of array in each segment given by bounds of shape (n, 2).
+    nan values are ignored.
+    Return two arrays of length n. The statistics of a segment without valid values are nan.
+    '''
+    array = np.asarray(array, dtype=float)
+    bounds = np.asarray(bounds, dtype=int).reshape(-1, 2)
+    lengths = bounds[:, 1] - bounds[:, 0]
+
+    # the indices of all points in segments, and which segment each of them belongs to
+    seg_index = np.repeat(np.arange(len(bounds)), lengths)
+    point_index = np.repeat(bounds[:, 0] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    values = array[point_index]
+    valid = ~np.isnan(values)
+    values = np.where(valid, values, 0.0)
+
+    count = np.bincount(seg_index, valid, minlength=len(bounds))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(seg_index, values, minlength=len(bounds)) / count
+        dev = np.where(valid, values - mean[seg_index], 0.0)
+        var = np.bincount(seg_index, dev * dev, minlength=len(bounds)) / count
+    return mean, np.sqrt(var)
+
+
+def find_steps(array, window=20, rtol=1E-3, atol=0.05, **kwargs):
+    '''
+    Split a run into steps with segment_steps() and detect the converged part of each step.
+    The keyword arguments are passed to segment_steps().
+    Return an integer array of shape (n, 3) with the start, converged and end (exclusive) index of each step.
+    The converged index is -1 if the step does not converge.
+    '''
+    bounds = segment_steps(array, **kwargs)
+    steps = np.empty((len(bounds), 3), dtype=int)
+    for i, (start, end) in enumerate(bounds):
+        idx = detect_convergence(array[start:end], window=window, rtol=rtol, atol=atol)
+        steps[i] = start, start + idx if idx >= 0 else -1, end
+    return steps
+
+
+def resample(grid, time_array, array, method='linear', max_gap=None):
+    '''
+    Resample a time series onto the times in grid, by linear interpolation or taking the nearest point.
+    time_array should be sorted. nan values are skipped.
+    Grid times outside the range of the valid points are nan.
+    If max_gap is given, grid times between two points farther apart than max_gap (linear),
+    or farther than max_gap from the nearest point (nearest), are nan.
+    '''
+    grid = np.asarray(grid, dtype=float)
+    time_array = np.asarray(time_array, dtype=float)
+    array = np.asarray(array, dtype=float)
+    valid = ~np.isnan(array)
+    time_array = time_array[valid]
+    array = array[valid]
+
+    result = np.full(len(grid), np.nan)
+    n = len(array)
+    if n == 0:
+        return result
+
+    # the points before and after each grid time
+    idx = np.searchsorted(time_array, grid, side='right')
+    left = np.clip(idx - 1, 0, n - 1)
+    right = np.clip(idx, 0, n - 1)
+    t_left = time_array[left]
+    t_right = time_array[right]
+
+    if method == 'linear':
+        span = t_right - t_left
+        frac = (grid - t_left) / np.where(span > 0, span, 1)
+        values = array[left] + frac * (array[right] - array[left])
+        gap = np.where(grid == t_left, 0, span)
+    elif method == 'nearest':
+        nearest = np.where(t_right - grid < grid - t_left, right, left)
+        values = array[nearest]
+        gap = np.abs(time_array[nearest] - grid)
+    else:
+        raise ValueError('Unknown resampling method: ' + method)
+
+    mask = (grid >= time_array[0]) & (grid <= time_array[-1])
+    if max_gap is not None:
+        mask &= gap <= max_gap
+    result[mask] = values[mask]
+    return result
+
+
+def common_grid(time_arrays, dt):
+    '''
+    A regular time grid with interval dt over the range covered by all the time series.
+    The grid times are multiples of dt, so that the grids of different runs line up
+    '''
+    time_arrays = [t for t in time_arrays if len(t) > 0]
+    if len(time_arrays) == 0:
+        return np.empty(0)
+
+    start = np.ceil(max(t[0] for t in time_arrays) / dt) * dt
+    end = min(t[-1] for t in time_arrays)
+    if end < start:
+        return np.empty(0)
+    return start + dt * np.arange(int(np.floor((end - start) / dt + 1E-9)) + 1)
+
+
+def align_channels(time_arrays, channels, dt, method='linear', max_gap=None):
+    '''
+    Resample all channels onto a common grid of interval dt. See resample().
+    channels is a dict of arrays. time_arrays is a dict of the times of each channel, or one array for all of them.
+    Channels without valid points do not limit the grid and are all nan.
+    Return the grid and a dict of the resampled arrays
+    '''
+    if not isinstance(time_arrays, dict):
+        time_arrays = {name: time_arrays for name in channels}
+
+    ranges = [np.asarray(time_arrays[name])[~np.isnan(np.asarray(array, dtype=float))]
+              for name, array in channels.items()]
+    grid = common_grid(ranges, dt)
+    return grid, {name: resample(grid, time_arrays[name], array, method, max_gap)
+                  for name, array in channels.items()}
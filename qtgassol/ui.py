@@ -1,15 +1,24 @@
 from PyQt5 import QtGui, QtCore, QtWidgets
 from datetime import datetime
-import time
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pyqtgraph as pg
-from .timeseries import detect_anomaly_t, detect_anomaly_p
+from . import clock
+from .profiling import Profiler
+from .rig import submit_rig
+from .channel import default_channels, ColumnStore
+from .timeseries import find_anomaly_t, find_anomaly_p, interp_anomaly, find_steps, rolling_filter_t, rolling_filter_p, \
+    WindowedStats, align_channels
+from .pipeline import write_channels, format_stamps
 
 
 class MainUI(QtWidgets.QMainWindow):
-    def __init__(self, thermometer, manometer, thermostat, output, interval):
+    def __init__(self, thermometer, manometer, thermostat, output, interval, anomaly_window=21, adaptive=None,
+                 burst=None, metrics=None, name=None, external_timer=False, channels=None, window=None, bus=None,
+                 control=None, checkpoint=None):
         super().__init__()
-        self.setWindowTitle('GasSol')
+        self.setWindowTitle('GasSol' if name is None else 'GasSol - %s' % name)
         self.resize(1000, 1000)
 
         # devices
@@ -17,6 +26,30 @@ class MainUI(QtWidgets.QMainWindow):
         self.manometer = manometer
         self.thermostat = thermostat
 
+        # T, P and the extra channels, which are logged and plotted in this order
+        self.channels = default_channels(thermometer, manometer) + list(channels or [])
+
+        # durations of the phases of step()
+        self.profiler = Profiler() if burst is None else burst.profiler
+
+        # Metrics for monitoring
+        self.metrics = metrics
+        # BusWriter for publishing the points to other processes
+        self.bus = bus
+
+        # name of the rig, and whether step() is called by RigGroup instead of the timer of this window
+        self.name = name
+        self.external_timer = external_timer
+
+        # AdaptiveInterval for choosing interval from the activity of T and P
+        self.adaptive = adaptive
+        # BurstRecorder for capturing the points around pressure steps at full rate
+        self.burst = burst
+        # PIController for adjusting the thermostat so that T tracks the preset
+        self.control = control
+        # Checkpointer for recovering the session after a crash
+        self.checkpoint = checkpoint
+
         # top-level widget
         self.widget = QtWidgets.QWidget()
         self.setCentralWidget(self.widget)
@@ -29,17 +62,63 @@ class MainUI(QtWidgets.QMainWindow):
         self.btn_pause.setDisabled(True)
         self.lab_interval = QtWidgets.QLabel('Interval (s)')
         self.inp_interval = QtWidgets.QLineEdit(str(interval))
+        # the interval set by the user, which is shown again when adaptive mode is disabled
+        self._interval_fixed = interval
         self.btn_interval = QtWidgets.QPushButton('Update')
+        if self.external_timer:
+            self.inp_interval.setDisabled(True)
+            self.btn_interval.setDisabled(True)
+        self.chk_adaptive = QtWidgets.QCheckBox('Adaptive interval (s)')
+        self.lab_dt_min = QtWidgets.QLabel('min')
+        self.inp_dt_min = QtWidgets.QLineEdit()
+        self.lab_dt_max = QtWidgets.QLabel('max')
+        self.inp_dt_max = QtWidgets.QLineEdit()
+        if self.adaptive is None or self.external_timer:
+            self.chk_adaptive.setDisabled(True)
+            self.inp_dt_min.setDisabled(True)
+            self.inp_dt_max.setDisabled(True)
+        else:
+            self.inp_dt_min.setText(str(self.adaptive.dt_min))
+            self.inp_dt_max.setText(str(self.adaptive.dt_max))
+        self.chk_burst = QtWidgets.QCheckBox('Burst capture')
+        self.lab_burst_step = QtWidgets.QLabel('P step (mbar)')
+        self.inp_burst_step = QtWidgets.QLineEdit()
+        self.btn_trigger = QtWidgets.QPushButton('Trigger')
+        if self.burst is None:
+            self.chk_burst.setDisabled(True)
+            self.inp_burst_step.setDisabled(True)
+            self.btn_trigger.setDisabled(True)
+        else:
+            self.inp_burst_step.setText(str(self.burst.p_step))
         self.text = QtWidgets.QTextEdit()
-        self.text.setText('%-20s %10s %10s' % ('# Date Time', 'T(C)', 'P(mPa)'))
+        self.text.setText(self._header())
+        # only the last lines are shown, the full record is in the log file
+        self.text.document().setMaximumBlockCount(1000)
+
+        self.text_profile = QtWidgets.QPlainTextEdit()
+        self.text_profile.setReadOnly(True)
+        self.text_profile.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.text_profile.setMaximumHeight(200)
+        self.btn_profile = QtWidgets.QPushButton('Dump profile')
 
         self.lab_average = QtWidgets.QLabel('Averages for temperature and pressure')
         self.text_t = QtWidgets.QLineEdit()
         self.text_p = QtWidgets.QLineEdit()
+        self.btn_plateau = QtWidgets.QPushButton('Find plateaus')
+        self.btn_export = QtWidgets.QPushButton('Export aligned')
+
+        self.lab_live = QtWidgets.QLabel('Averages for last minutes')
+        self.inp_live = QtWidgets.QLineEdit('10')
+        self.text_live_t = QtWidgets.QLineEdit()
+        self.text_live_p = QtWidgets.QLineEdit()
+        self.cmb_plateau = QtWidgets.QComboBox()
 
         self.lab_thermo = QtWidgets.QLabel('Thermostat (C)')
         self.inp_thermo = QtWidgets.QLineEdit()
         self.btn_thermo = QtWidgets.QPushButton('Update')
+        self.chk_control = QtWidgets.QCheckBox('Closed loop')
+        if self.thermostat is None or self.control is None:
+            self.chk_control.setDisabled(True)
         if self.thermostat is None:
             self.inp_thermo.setDisabled(True)
             self.btn_thermo.setDisabled(True)
@@ -48,24 +127,33 @@ class MainUI(QtWidgets.QMainWindow):
 
         # plots
         self.plt_widget = pg.GraphicsLayoutWidget()
-        self.plt_t = self.plt_widget.addPlot()
-        self.plt_t.setLabel('left', 'T / C')
-        self.plt_t.setAxisItems({'bottom': pg.DateAxisItem()})
-        self.plt_t.showGrid(x=True, y=True, alpha=0.5)
-        self.plt_widget.nextRow()
-        self.plt_p = self.plt_widget.addPlot()
-        self.plt_p.setLabel('left', 'P / mPa')
-        self.plt_p.setAxisItems({'bottom': pg.DateAxisItem()})
-        self.plt_p.setXLink(self.plt_t)  # share X axis scales
-        self.plt_p.showGrid(x=True, y=True, alpha=0.5)
-        self.curve_t = self.plt_t.plot(symbolBrush=(0, 0, 255), symbolSize=8)
-        self.curve_p = self.plt_p.plot(symbolBrush=(0, 0, 255), symbolSize=8)
+        self.plots = {}
+        self.curves = {}
+        for i, ch in enumerate(self.channels):
+            if i > 0:
+                self.plt_widget.nextRow()
+            plt = self.plt_widget.addPlot()
+            plt.setLabel('left', '%s / %s' % (ch.name, ch.unit))
+            plt.setAxisItems({'bottom': pg.DateAxisItem()})
+            if i > 0:
+                plt.setXLink(self.plots[self.channels[0].name])  # share X axis scales
+            plt.showGrid(x=True, y=True, alpha=0.5)
+            self.plots[ch.name] = plt
+            self.curves[ch.name] = plt.plot(symbolBrush=(0, 0, 255), symbolSize=8)
+        self.plt_t = self.plots['T']
+        self.plt_p = self.plots['P']
+        self.curve_t = self.curves['T']
+        self.curve_p = self.curves['P']
         self.curve_t_anomaly = self.plt_t.scatterPlot(symbolBrush=(255, 0, 0), symbolSize=16)
         self.curve_p_anomaly = self.plt_p.scatterPlot(symbolBrush=(255, 0, 0), symbolSize=16)
+        self.curve_t_live_anomaly = self.plt_t.scatterPlot(symbolBrush=(255, 165, 0), symbolSize=12)
+        self.curve_p_live_anomaly = self.plt_p.scatterPlot(symbolBrush=(255, 165, 0), symbolSize=12)
         self.curve_thermostat = self.plt_t.plot(symbolBrush=(0, 255, 0), symbolSize=8)
+        self.curve_t_burst = self.plt_t.scatterPlot(symbolBrush=(0, 200, 200), symbolSize=4)
+        self.curve_p_burst = self.plt_p.scatterPlot(symbolBrush=(0, 200, 200), symbolSize=4)
 
         # select region in plot
-        timestamp = time.time()
+        timestamp = clock.time()
         self.region = pg.LinearRegionItem([timestamp, timestamp + 30],
                                           movable=False, span=[0.0, 0.2], swapMode='block')
         self.plt_t.addItem(self.region)
@@ -94,6 +182,21 @@ class MainUI(QtWidgets.QMainWindow):
         l.addWidget(self.btn_interval)
         l_left.addLayout(l)
 
+        l = QtWidgets.QHBoxLayout()
+        l.addWidget(self.chk_adaptive)
+        l.addWidget(self.lab_dt_min)
+        l.addWidget(self.inp_dt_min)
+        l.addWidget(self.lab_dt_max)
+        l.addWidget(self.inp_dt_max)
+        l_left.addLayout(l)
+
+        l = QtWidgets.QHBoxLayout()
+        l.addWidget(self.chk_burst)
+        l.addWidget(self.lab_burst_step)
+        l.addWidget(self.inp_burst_step)
+        l.addWidget(self.btn_trigger)
+        l_left.addLayout(l)
+
         l_left.addWidget(self.text)
         self.text.setMinimumWidth(350)
 
@@ -101,17 +204,52 @@ class MainUI(QtWidgets.QMainWindow):
         l.addWidget(self.lab_thermo)
         l.addWidget(self.inp_thermo)
         l.addWidget(self.btn_thermo)
+        l.addWidget(self.chk_control)
+        l_left.addLayout(l)
+
+        l = QtWidgets.QHBoxLayout()
+        l.addWidget(self.btn_plateau)
+        l.addWidget(self.cmb_plateau, stretch=1)
+        l_left.addLayout(l)
+
+        l_left.addWidget(self.text_profile)
+        l = QtWidgets.QHBoxLayout()
+        l.addWidget(self.btn_profile)
+        l.addWidget(self.btn_export)
         l_left.addLayout(l)
 
         l_left.addWidget(self.lab_average)
         l_left.addWidget(self.text_t)
         l_left.addWidget(self.text_p)
 
+        l = QtWidgets.QHBoxLayout()
+        l.addWidget(self.lab_live)
+        l.addWidget(self.inp_live)
+        l_left.addLayout(l)
+        l_left.addWidget(self.text_live_t)
+        l_left.addWidget(self.text_live_p)
+
         # data
-        self.time_list = []
-        self.t_list = []
-        self.p_list = []
+        # with window, only the last window points are kept for plotting and analysis, and the rest is in the log
+        self.data = ColumnStore([ch.name for ch in self.channels], max_len=window)
         self._t_target_last = None
+        # Future of the setpoint confirmed by the thermostat
+        self._t_thermostat_future = None
+        self._t_thermostat = None
+        self._plateaus = []
+        # number of points logged in this process, which only grows unlike the data kept in window mode
+        self._n_logged = 0
+        self._burst_data = ColumnStore(['T', 'P'], max_len=window)
+
+        # detect anomaly points as they arrive
+        self._filter_t = rolling_filter_t(anomaly_window)
+        self._filter_p = rolling_filter_p(anomaly_window)
+        self._live_anomaly_t = ColumnStore(['T'], 64, max_len=window)
+        self._live_anomaly_p = ColumnStore(['P'], 64, max_len=window)
+
+        # averages for last minutes updated with every point
+        self._live_t = WindowedStats(600)
+        self._live_p = WindowedStats(600)
 
         # timer for update data
         self.timer = QtCore.QTimer(self)
@@ -126,65 +264,327 @@ class MainUI(QtWidgets.QMainWindow):
         self.btn_start.clicked.connect(self.start)
         self.btn_pause.clicked.connect(self.pause)
         self.btn_interval.clicked.connect(self.set_interval)
+        self.chk_adaptive.stateChanged.connect(self.set_adaptive)
+        self.chk_burst.stateChanged.connect(self.set_burst)
+        self.inp_burst_step.editingFinished.connect(self.set_burst)
+        self.btn_trigger.clicked.connect(self.trigger_burst)
+        self.btn_profile.clicked.connect(self.dump_profile)
+        self.btn_export.clicked.connect(self.export_aligned)
         self.btn_thermo.clicked.connect(self.set_temperature)
+        self.chk_control.stateChanged.connect(self.set_control)
         self.region.sigRegionChangeFinished.connect(self.calc_average)
+        self.btn_plateau.clicked.connect(self.find_plateaus)
+        self.cmb_plateau.activated.connect(self.select_plateau)
+        self.inp_live.editingFinished.connect(self.set_live_span)
 
-    def step(self):
-        timestamp = time.time()
-        t = self.thermometer.read()
-        p = self.manometer.read()
-        string = '%-20s %10.3f %10.2f' % (datetime.fromtimestamp(timestamp).strftime('%y-%m-%d %H:%M:%S'), t, p)
-        self.text.append(string)
-
-        self._file.write(string + '\n')
-
-        self.time_list.append(timestamp)
-        self.t_list.append(t)
-        self.p_list.append(p)
-        self.curve_t.setData(self.time_list, self.t_list)
-        self.curve_p.setData(self.time_list, self.p_list)
+    def _header(self):
+        return '%-20s' % '# Date Time' + ''.join(' %10s' % ch.label for ch in self.channels)
 
-        self.region.setBounds([self.time_list[0], max(timestamp, self.time_list[0] + 30)])
-        self.region.setMovable(True)
+    def step(self, reading=None):
+        '''
+        Read and log a point.
+        reading as (timestamp, values, stamps, durations) with the values of all channels, the time each value was read
+        and the durations of the reads can be given if the devices are read elsewhere
+        '''
+        with self.profiler.timer('step'):
+            self._step(reading)
+        self._update_profile()
+
+    def _step(self, reading=None):
+        # whether there is a new point, which is not the case if the burst recorder has read nothing since last step
+        fresh = True
+        if reading is not None:
+            timestamp, values, stamps, durations = reading
+            for ch, duration in zip(self.channels, durations):
+                self.profiler.add('read ' + ch.name, duration)
+        elif self.burst is not None and self.burst.is_running:
+            # T and P are read by the burst recorder.
+            # The point logged as normal row is marked before the bursts are written, so that it is not written again
+            reading = self.burst.latest()
+            fresh = reading is not None and (len(self.data) == 0 or reading[0] > self.data.time[-1])
+            if fresh:
+                self.burst.mark_logged(reading[0])
+            with self.profiler.timer('write burst'):
+                self._write_bursts()
+            if fresh:
+                timestamp, t, p = reading
+                values = [t, p]
+                stamps = [timestamp, timestamp]
+                for ch in self.channels[2:]:
+                    with self.profiler.timer('read ' + ch.name):
+                        stamp, val = ch.read_stamped()
+                    values.append(val)
+                    stamps.append(stamp)
+            else:
+                # -1 means error, so that the thermostat and the interval are updated without a measurement
+                timestamp = clock.time()
+                values = [-1] * len(self.channels)
+        else:
+            # each value is stamped at the midpoint of its request and response
+            values = []
+            stamps = []
+            for ch in self.channels:
+                with self.profiler.timer('read ' + ch.name):
+                    stamp, val = ch.read_stamped()
+                values.append(val)
+                stamps.append(stamp)
+            timestamp = sum(stamps) / len(stamps)
+        t, p = values[:2]
+
+        if fresh:
+            self._add_point(timestamp, values, stamps)
 
         # update thermostat
         if self.thermostat is not None and self.thermostat.has_preset:
-            t_target = self.thermostat.get_preset()
-            if self._t_target_last is None or abs(self._t_target_last - t_target) > 0.01:
-                self.thermostat.set(t_target)
-                self._t_target_last = t_target
+            with self.profiler.timer('thermostat'):
+                t_target = self.thermostat.get_preset()
+                # the setpoint of the bath is adjusted so that T of the cell tracks the preset
+                if self.control is not None and self.chk_control.isChecked():
+                    t_target = self.control.update(t_target, t, timestamp)
+                # the setpoint is confirmed at a later step, so that the thermostat adds no latency to a step
+                future = self._t_thermostat_future
+                if future is not None and future.done():
+                    self._t_thermostat = future.result()
+                    self._t_thermostat_future = None
+                    # sent again if failed e.g. the port is lost
+                    if self._t_thermostat == -1:
+                        self._t_target_last = None
+                if self._t_thermostat_future is None and (
+                        self._t_target_last is None or abs(self._t_target_last - t_target) > 0.01):
+                    self._t_thermostat_future = self.thermostat.set_async(t_target)
+                    self._t_target_last = t_target
+
+                t_list, temp_list = map(list, zip(*self.thermostat._timestamp_temp))
+                if t_list[-1] < timestamp + 60:
+                    t_list.append(timestamp + 60)
+                    temp_list.append(temp_list[-1])
+                self.curve_thermostat.setData(t_list, temp_list)
+
+        # sample faster when T or P is changing
+        if self.adaptive is not None and self.chk_adaptive.isChecked():
+            interval = self.adaptive.update(timestamp, [t, p])
+            self.timer.setInterval(round(interval * 1000))
+            self.inp_interval.setText('%.1f' % interval)
+
+        if self.checkpoint is not None:
+            with self.profiler.timer('checkpoint'):
+                self.checkpoint.update(self.data if fresh else None, self._session_state())
+
+        if self.metrics is not None:
+            self._update_metrics(values)
+
+    def _add_point(self, timestamp, values, stamps):
+        '''
+        Log, plot, publish and analyze a new point
+        '''
+        t, p = values[:2]
+
+        # -1 means error
+        for ch, val in zip(self.channels, values):
+            if val == -1:
+                self.profiler.count('error ' + ch.name)
+
+        with self.profiler.timer('write'):
+            string = '%-20s' % datetime.fromtimestamp(timestamp).strftime('%y-%m-%d %H:%M:%S') \
+                     + ''.join(' ' + ch.format(val) for ch, val in zip(self.channels, values))
+            self.text.append(string)
+
+            self._file.write(string + '\n')
+            # the time each value was read, which is finer than the time of the row
+            self._file.write(format_stamps(timestamp, stamps) + '\n')
+
+        self._n_logged += 1
+
+        with self.profiler.timer('plot'):
+            self.data.append(timestamp, values, stamps)
+            for ch in self.channels:
+                self.curves[ch.name].setData(self.data.time, self.data[ch.name])
+
+        if self.bus is not None:
+            self.bus.append(timestamp, values)
+
+        with self.profiler.timer('analysis'):
+            if t != -1:
+                self._live_t.update(t, timestamp)
+            if p != -1:
+                self._live_p.update(p, timestamp)
+            self.text_live_t.setText('T: %10.3f +- %10.4f' % (self._live_t.mean, self._live_t.std))
+            self.text_live_p.setText('P: %10.2f +- %10.3f' % (self._live_p.mean, self._live_p.std))
+
+            # the decision for a point is made when the next point arrives
+            if self._filter_t.check(t):
+                self._live_anomaly_t.append(self.data.time[-2], self.data['T'][-2])
+                self._plot_live_anomaly(self._live_anomaly_t, 'T', self.curve_t_live_anomaly)
+            if self._filter_p.check(p):
+                self._live_anomaly_p.append(self.data.time[-2], self.data['P'][-2])
+                self._plot_live_anomaly(self._live_anomaly_p, 'P', self.curve_p_live_anomaly)
+
+            time_first = self.data.time[0]
+            self.region.setBounds([time_first, max(timestamp, time_first + 30)])
+            self.region.setMovable(True)
+
+    def _session_state(self):
+        '''
+        The state of the session besides the points, which is kept in the checkpoint
+        '''
+        state = {'region': [float(x) for x in self.region.getRegion()], 'control': self.chk_control.isChecked()}
+        if self.thermostat is not None:
+            state['preset'] = self.thermostat._timestamp_temp
+        return state
 
-            t_list, temp_list = map(list, zip(*self.thermostat._timestamp_temp))
-            if t_list[-1] < timestamp + 60:
-                t_list.append(timestamp + 60)
-                temp_list.append(temp_list[-1])
-            self.curve_thermostat.setData(t_list, temp_list)
+    def restore_session(self):
+        '''
+        Restore the points, the thermostat program and the selected region from the checkpoint.
+        The thermostat program goes on from where it is at this time
+        '''
+        self.data, state = self.checkpoint.restore(self.data.max_len, self.data.names)
+        for ch in self.channels:
+            self.curves[ch.name].setData(self.data.time, self.data[ch.name])
+        if len(self.data) > 0:
+            time_first = self.data.time[0]
+            self.region.setBounds([time_first, max(self.data.time[-1], time_first + 30)])
+            self.region.setMovable(True)
+
+        state = state or {}
+        if 'region' in state:
+            self.region.setRegion(state['region'])
+        if self.thermostat is not None and state.get('preset'):
+            self.thermostat._timestamp_temp = [list(x) for x in state['preset']]
+        if self.control is not None:
+            self.chk_control.setChecked(state.get('control', False))
+        # the averages for last minutes include the restored points
+        self.set_live_span()
+
+        self.text.append('# Session restored from checkpoint %s with %i points' % (self.checkpoint.name,
+                                                                                  len(self.data)))
+
+    def _plot_live_anomaly(self, store, name, curve):
+        '''
+        Plot the anomaly points detected live, which are still in the data
+        '''
+        mask = store.time >= self.data.time[0]
+        curve.setData(store.time[mask], store[name][mask])
+
+    def _update_metrics(self, values):
+        rig = {} if self.name is None else {'rig': self.name}
+
+        def m_set(name, value, help, type='gauge', labels=None):
+            self.metrics.set(name, value, help, type, dict(rig, **(labels or {})))
+
+        # -1 means error
+        t, p = values[:2]
+        if t != -1:
+            m_set('temperature_celsius', t, 'Last temperature read from the thermometer')
+        if p != -1:
+            m_set('pressure_mbar', p, 'Last pressure read from the manometer')
+        for ch, val in zip(self.channels, values):
+            if val != -1:
+                m_set('channel_value', val, 'Last value of each channel', labels={'channel': ch.name, 'unit': ch.unit})
+        m_set('samples_total', self._n_logged, 'Number of points logged', 'counter')
+        m_set('sample_interval_seconds', self.timer.interval() / 1000, 'Time interval for reading data')
+        if self._t_target_last is not None:
+            m_set('thermostat_target_celsius', self._t_target_last, 'Temperature sent to the thermostat')
+        if self._t_thermostat is not None and self._t_thermostat != -1:
+            m_set('thermostat_setpoint_celsius', self._t_thermostat,
+                  'Temperature reported by the thermostat after the last update')
+
+        for name, device in self._devices():
+            duration = self.profiler.last('read ' + name)
+            if duration is not None:
+                m_set('read_latency_seconds', duration, 'Duration of the last read', labels={'device': name})
+            m_set('read_errors_total', device.n_timeout, 'Number of failed reads', 'counter',
+                  labels={'device': name, 'kind': 'timeout'})
+            m_set('read_errors_total', device.n_parse_error, 'Number of failed reads', 'counter',
+                  labels={'device': name, 'kind': 'parse'})
+            m_set('reconnects_total', device.n_reconnect, 'Number of times the port is reopened after being lost',
+                  'counter', labels={'device': name})
+            if hasattr(device, 'n_restart'):
+                m_set('worker_restarts_total', device.n_restart, 'Number of restarts of the worker process',
+                      'counter', labels={'device': name})
+
+    def _devices(self):
+        '''
+        The devices of channels and the thermostat, named by the first channel read from them
+        '''
+        devices = [(ch.name, ch.device) for ch in self.channels]
+        if self.thermostat is not None:
+            devices.append(('thermostat', self.thermostat))
+        names = {}
+        for name, device in devices:
+            names.setdefault(id(device), (name, device))
+        return list(names.values())
+
+    def _update_profile(self):
+        '''
+        Show the durations of the phases of step() and the errors of devices
+        '''
+        for name, device in self._devices():
+            self.profiler.set_count('timeout ' + name, device.n_timeout)
+            self.profiler.set_count('parse error ' + name, device.n_parse_error)
+            self.profiler.set_count('disconnect ' + name, device.n_disconnect)
+            self.profiler.set_count('reconnect ' + name, device.n_reconnect)
+            if hasattr(device, 'n_restart'):
+                self.profiler.set_count('watchdog ' + name, device.n_watchdog)
+                self.profiler.set_count('restart ' + name, device.n_restart)
+        self.text_profile.setPlainText(self.profiler.report())
+
+    def dump_profile(self):
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Dump profile', self.inp_file.text() + '.profile')
+        if filename:
+            self.profiler.dump(filename)
+
+    def aligned(self, dt, method='linear'):
+        '''
+        The data of all channels resampled from the time each value was read onto a common grid of interval dt.
+        Points missing for longer than twice the longest sampling interval are not interpolated.
+        Return the grid and a dict of arrays
+        '''
+        dt_max = self._interval_fixed if self.adaptive is None else max(self.adaptive.dt_max, dt)
+        # -1 means error
+        channels = {name: np.where(self.data[name] == -1, np.nan, self.data[name]) for name in self.data.names}
+        return align_channels({name: self.data.stamps(name) for name in self.data.names}, channels, dt, method,
+                              max_gap=2 * max(dt, dt_max))
+
+    def export_aligned(self):
+        '''
+        Write the data resampled onto a common grid with the interval set by the user
+        '''
+        dt = self._interval_fixed
+        if len(self.data) == 0 or dt <= 0:
+            return False
+
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Export aligned', self.inp_file.text() + '.aligned')
+        if not filename:
+            return False
+
+        grid, channels = self.aligned(dt)
+        with open(filename, 'w') as f:
+            write_channels(grid, channels, f, [ch.label for ch in self.channels], localtime=True)
+        return True
 
     def calc_average(self):
         '''
         calculate the average under selected region
         '''
         bound = self.region.getRegion()
-        time_array_crude = np.array(self.time_list)
+        time_array_crude = self.data.time
         idx = np.where((time_array_crude > bound[0] - 0.001) & (time_array_crude < bound[1] + 0.001))[0]
         n = len(idx)
         time_array = time_array_crude[idx]
-        t_array = np.array(self.t_list)[idx]
-        p_array = np.array(self.p_list)[idx]
+        t_array = self.data['T'][idx]
+        p_array = self.data['P'][idx]
 
-        idx_anomaly_t = [i for i in range(2, n - 2) if
-                         detect_anomaly_t(t_array[[i - 2, i - 1, i + 1, i + 2]], t_array[i])]
-        idx_anomaly_p = [i for i in range(2, n - 2) if
-                         detect_anomaly_p(p_array[[i - 2, i - 1, i + 1, i + 2]], p_array[i])]
+        idx_anomaly_t = find_anomaly_t(t_array)
+        idx_anomaly_p = find_anomaly_p(p_array)
 
         self.curve_t_anomaly.setData(time_array[idx_anomaly_t], t_array[idx_anomaly_t])
         self.curve_p_anomaly.setData(time_array[idx_anomaly_p], p_array[idx_anomaly_p])
 
-        mask = np.ones(n, np.bool)
+        mask = np.ones(n, bool)
         mask[idx_anomaly_t] = 0
         t_array_valid = t_array[mask]
 
-        mask = np.ones(n, np.bool)
+        mask = np.ones(n, bool)
         mask[idx_anomaly_p] = 0
         p_array_valid = p_array[mask]
 
@@ -202,14 +602,136 @@ class MainUI(QtWidgets.QMainWindow):
         self.text_t.setText('T: %10.3f +- %10.4f' % (t_ave, t_std))
         self.text_p.setText('P: %10.2f +- %10.3f' % (p_ave, p_std))
 
+    def find_plateaus(self):
+        '''
+        Split the data into steps at the pressure jumps, and list the converged plateau of each step.
+        The last plateau is selected
+        '''
+        if len(self.data) == 0:
+            return
+
+        time_array = self.data.time
+        p_array = self.data['P']
+        p_array = interp_anomaly(p_array, find_anomaly_p(p_array))
+        steps = find_steps(p_array)
+        self._plateaus = [(time_array[start], time_array[end - 1])
+                          for _, start, end in steps if start >= 0]
+
+        self.cmb_plateau.clear()
+        for i, (t_start, t_end) in enumerate(self._plateaus):
+            self.cmb_plateau.addItem('%i: %s - %s' % (i, datetime.fromtimestamp(t_start).strftime('%H:%M:%S'),
+                                                      datetime.fromtimestamp(t_end).strftime('%H:%M:%S')))
+        if len(self._plateaus) > 0:
+            self.cmb_plateau.setCurrentIndex(len(self._plateaus) - 1)
+            self.select_plateau(len(self._plateaus) - 1)
+
+    def select_plateau(self, index):
+        '''
+        Move the selected region to a plateau found by find_plateaus()
+        '''
+        if index < 0 or index >= len(self._plateaus):
+            return
+
+        self.region.setRegion(self._plateaus[index])
+
+    def set_burst(self):
+        '''
+        Start or stop the burst recorder, and update its pressure step for triggering
+        '''
+        if self.burst is None:
+            return False
+
+        try:
+            self.burst.p_step = float(self.inp_burst_step.text())
+        except ValueError:
+            return False
+
+        if self.chk_burst.isChecked() and self._is_running:
+            self.burst.start()
+        elif self.burst.is_running:
+            self.burst.stop()
+            self._write_bursts()
+        return True
+
+    def trigger_burst(self):
+        if self.burst is not None and self.burst.is_running:
+            self.burst.trigger()
+
+    def _write_bursts(self):
+        '''
+        Write the finished bursts to the log at full resolution.
+        The points already logged as normal rows are not written again, so a burst adds only the points in between
+        '''
+        bursts = self.burst.pop_bursts()
+        for trigger_time, reason, points in bursts:
+            string = '# Burst triggered at %s by %s' % (datetime.fromtimestamp(trigger_time), reason)
+            self.text.append(string)
+            self._file.write(string + '\n')
+            for timestamp, t, p in points:
+                self._burst_data.append(timestamp, [t, p])
+                if self.burst.is_logged(timestamp):
+                    continue
+                str_time = datetime.fromtimestamp(timestamp).strftime('%y-%m-%d %H:%M:%S.%f')[:-3]
+                self._file.write('%-20s %10.3f %10.2f\n' % (str_time, t, p))
+            self._file.write('# Burst end\n')
+
+        if len(bursts) > 0:
+            self.curve_t_burst.setData(self._burst_data.time, self._burst_data['T'])
+            self.curve_p_burst.setData(self._burst_data.time, self._burst_data['P'])
+
+    def set_live_span(self):
+        '''
+        Update the span of averages for last minutes, and recalculate them from the data
+        '''
+        try:
+            span = float(self.inp_live.text()) * 60
+        except ValueError:
+            return False
+
+        for stats, values in ((self._live_t, self.data['T']), (self._live_p, self.data['P'])):
+            stats.reset()
+            stats.span = span
+            for timestamp, val in zip(self.data.time, values):
+                if val != -1:
+                    stats.update(val, timestamp)
+        return True
+
     def set_interval(self):
         try:
             interval = float(self.inp_interval.text())
         except ValueError:
             return False
         else:
-            self.timer.setInterval(interval * 1000)
-            return True
+            self.timer.setInterval(round(interval * 1000))
+
+        if self.adaptive is None or not self.chk_adaptive.isChecked():
+            self._interval_fixed = interval
+        else:
+            try:
+                dt_min = float(self.inp_dt_min.text())
+                dt_max = float(self.inp_dt_max.text())
+            except ValueError:
+                return False
+            if dt_min <= 0 or dt_max < dt_min:
+                return False
+            self.adaptive.dt_min = dt_min
+            self.adaptive.dt_max = dt_max
+            self.adaptive.interval = min(max(interval, dt_min), dt_max)
+
+        return True
+
+    def set_adaptive(self):
+        '''
+        Keep the fixed interval when adaptive mode is enabled, and go back to it when disabled
+        '''
+        if self.chk_adaptive.isChecked():
+            try:
+                self._interval_fixed = float(self.inp_interval.text())
+            except ValueError:
+                pass
+        else:
+            self.inp_interval.setText(str(self._interval_fixed))
+        return self.set_interval()
 
     def set_temperature(self):
         if self.thermostat is None:
@@ -223,6 +745,20 @@ class MainUI(QtWidgets.QMainWindow):
         self.text.append(string)
         self._file.write(string + '\n')
 
+    def set_control(self):
+        '''
+        Start the closed loop from the current state, and go back to the preset as setpoint when it is disabled
+        '''
+        if self.control is None:
+            return
+
+        self.control.reset()
+        self._t_target_last = None
+        string = '# Closed loop control of thermostat %s' % ('enabled' if self.chk_control.isChecked() else 'disabled')
+        self.text.append(string)
+        if self._is_running:
+            self._file.write(string + '\n')
+
     def start(self):
         if self._is_running:
             return
@@ -234,11 +770,16 @@ class MainUI(QtWidgets.QMainWindow):
         except:
             return
 
-        self._file.write('# File opened at %s\n' % datetime.now())
+        self._file.write('# File opened at %s\n' % clock.now())
+        self._file.write(self._header() + '\n')
 
-        self.step()
-        self.timer.start()
         self._is_running = True
+        if self.chk_burst.isChecked():
+            self.set_burst()
+
+        if not self.external_timer:
+            self.step()
+            self.timer.start()
 
         self.btn_start.setDisabled(True)
         self.btn_pause.setDisabled(False)
@@ -252,6 +793,9 @@ class MainUI(QtWidgets.QMainWindow):
 
         self.timer.stop()
         self._is_running = False
+        if self.burst is not None and self.burst.is_running:
+            self.burst.stop()
+            self._write_bursts()
         self._file.close()
 
         self.btn_start.setDisabled(False)
@@ -263,3 +807,40 @@ class MainUI(QtWidgets.QMainWindow):
         '''
         self.pause()
         event.accept()
+
+
+class RigGroup(QtCore.QObject):
+    '''
+    Read the devices of all rigs concurrently with one timer and one thread pool,
+    and pass the readings to the windows of the rigs which are running.
+    The timer does not wait for the devices. A reading is passed to its window by a queued signal when it is complete,
+    and a rig is not read again until then, so that a hung device stalls only its own rig
+    '''
+
+    # index of the rig and its reading, emitted from the threads of the pool
+    reading_ready = QtCore.pyqtSignal(int, object)
+
+    def __init__(self, rigs, uis, interval, max_workers=None):
+        super().__init__()
+        self.rigs = rigs
+        self.uis = uis
+        self.executor = ThreadPoolExecutor(max_workers or 2 * len(rigs))
+        self._pending = [False] * len(rigs)
+        self.reading_ready.connect(self._deliver, QtCore.Qt.QueuedConnection)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(round(interval * 1000))
+        self.timer.timeout.connect(self.step)
+        self.timer.start()
+
+    def step(self):
+        for i, (rig, ui) in enumerate(zip(self.rigs, self.uis)):
+            if not ui._is_running or self._pending[i]:
+                continue
+            self._pending[i] = True
+            submit_rig(rig, self.executor, functools.partial(self.reading_ready.emit, i))
+
+    def _deliver(self, i, reading):
+        self._pending[i] = False
+        if self.uis[i]._is_running:
+            self.uis[i].step(reading)
@@ -0,0 +1,208 @@
+'''
+Devices isolated in supervised child processes, so that a hung serial port or driver cannot stall the others or GUI.
+The device is opened and read in the child process, and the requests and values are exchanged over a pipe.
+A request not answered in time kills the child process, which is started again later and reopens the port.
+'''
+
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from .device import Device, Thermostat
+from .rig import open_device, DetectionError, DEVICE_CLASSES
+
+# spawn instead of fork, because the parent may have threads of GUI, metrics and thread pools
+_context = multiprocessing.get_context('spawn')
+
+# counters of Device summed over the child processes
+COUNTERS = ('n_timeout', 'n_parse_error', 'n_disconnect', 'n_reconnect')
+
+
+def _serve(conn, kind, spec, options):
+    '''
+    The loop of the child process. Open the device, then call its methods as requested until closed.
+    The first message is ('ready', port) or ('error', message)
+    '''
+    try:
+        dev = open_device(kind, spec, options=options)
+    except Exception as e:
+        conn.send(('error', str(e)))
+        return
+
+    conn.send(('ready', dev.port))
+    while True:
+        try:
+            method, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            break
+        if method == 'close':
+            break
+
+        try:
+            val = getattr(dev, method)(*args, **kwargs)
+        except Exception:
+            val = -1
+        conn.send(('value', val, {name: getattr(dev, name) for name in COUNTERS}))
+
+    emulator = getattr(dev, 'emulator', None)
+    if emulator is not None:
+        emulator.close()
+
+
+class ProcessDevice(Device):
+    '''
+    A device opened with open_device(kind, spec, options=options) in a child process.
+    read() and set() return -1 if the child process does not answer within timeout seconds,
+    in which case it is killed. timeout is 3 times read_timeout of the device class by default. It is started again at the next request restart_interval seconds after it is killed,
+    and the requests before it has reopened the port return -1 at once instead of waiting.
+    The counters of errors are summed over all child processes.
+    The requests of several threads are sent one at a time, each waiting for its reply.
+    '''
+
+    def __init__(self, kind, spec, options=None, timeout=None, restart_interval=5.0, open_timeout=30.0):
+        super().__init__(None)
+        self.kind = kind
+        self.spec = spec
+        self.options = options
+        self.timeout = timeout if timeout is not None else 3 * DEVICE_CLASSES[kind].read_timeout
+        self.restart_interval = restart_interval
+        self.open_timeout = open_timeout
+
+        # number of child processes killed by watchdog and of restarts, for diagnosis
+        self.n_watchdog = 0
+        self.n_restart = 0
+
+        self._process = None
+        self._conn = None
+        self._ready = False
+        self._t_start = 0
+        self._t_kill = 0
+        self._counts = dict.fromkeys(COUNTERS, 0)  # of the child processes killed
+        self._lock = threading.Lock()
+        # the thread of set_async(), which waits for the child process instead of the caller
+        self._executor = ThreadPoolExecutor(1)
+
+        self._start()
+        if not self._conn.poll(open_timeout) or not self._check_ready():
+            self._kill()
+            raise DetectionError('Failed to open %s %s in worker process' % (kind, spec))
+
+    def __str__(self):
+        return '<%s: %s %s>' % (self.__class__.__name__, self.kind, self.port or self.spec)
+
+    def _start(self):
+        self._conn, child_conn = _context.Pipe()
+        self._process = _context.Process(target=_serve, args=(child_conn, self.kind, self.spec, self.options), daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._ready = False
+        self._t_start = time.monotonic()
+
+    def _kill(self):
+        if self._process is None:
+            return
+
+        self._process.terminate()
+        self._process.join(1.0)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._conn.close()
+        self._process = None
+        self._conn = None
+        self._t_kill = time.monotonic()
+        self._counts = {name: getattr(self, name) for name in COUNTERS}
+
+    def _check_ready(self):
+        '''
+        Handle the first message of the child process. Return whether the device is opened
+        '''
+        try:
+            msg = self._conn.recv()
+        except (EOFError, OSError):
+            return False
+        if msg[0] != 'ready':
+            return False
+
+        self._ready = True
+        # reopen the same port after automatic detection
+        if self.port is None and msg[1] is not None:
+            self.port = msg[1]
+            if self.spec == 'auto':
+                self.spec = msg[1]
+        return True
+
+    def _call(self, method, *args, **kwargs):
+        with self._lock:
+            if self._process is None:
+                if time.monotonic() - self._t_kill < self.restart_interval:
+                    return -1
+                self._start()
+                self.n_restart += 1
+
+            if not self._ready:
+                if not self._conn.poll(0):
+                    if time.monotonic() - self._t_start > self.open_timeout:
+                        self.n_watchdog += 1
+                        self._kill()
+                    return -1
+                if not self._check_ready():
+                    self._kill()
+                    return -1
+
+            try:
+                self._conn.send((method, args, kwargs))
+                if not self._conn.poll(self.timeout):
+                    self.n_watchdog += 1
+                    self._kill()
+                    return -1
+                _, val, counts = self._conn.recv()
+            except (EOFError, OSError):
+                self._kill()
+                return -1
+
+            for name in COUNTERS:
+                setattr(self, name, self._counts[name] + counts[name])
+            return val
+
+    def read(self, **kwargs):
+        return self._call('read', **kwargs)
+
+    def set(self, val, **kwargs):
+        return self._call('set', val, **kwargs)
+
+    def set_async(self, val, timeout=None):
+        '''
+        Set the value without waiting for the child process.
+        Return a Future of the value confirmed by the device as set(), which is done later in the thread of set_async()
+        '''
+        return self._executor.submit(self.set, val, timeout=timeout)
+
+    def close(self):
+        # the pending set_async() are answered before the child process is closed
+        self._executor.shutdown()
+        with self._lock:
+            if self._process is None:
+                return
+
+            try:
+                self._conn.send(('close', (), {}))
+            except OSError:
+                pass
+            self._process.join(1.0)
+            self._kill()
+
+
+class ProcessThermostat(ProcessDevice, Thermostat):
+    '''
+    A thermostat in a child process. The preset is kept in this process
+    '''
+    pass
+
+
+def open_isolated(kind, spec, options=None, **kwargs):
+    '''
+    Open a device in a child process. kwargs are passed to ProcessDevice
+    '''
+    cls = ProcessThermostat if kind == 'thermostat' else ProcessDevice
+    return cls(kind, spec, options, **kwargs)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from qtgassol.buffer import RingBuffer
+
+
+def test_ring_buffer():
+    ring = RingBuffer(5, 2)
+    assert ring.view().shape == (2, 0)
+    for i in range(12):
+        ring.append((i, 10 * i))
+        n = min(i + 1, 5)
+        assert len(ring) == n
+        assert list(ring[0]) == list(range(i + 1 - n, i + 1))
+        assert list(ring[1]) == [10 * j for j in range(i + 1 - n, i + 1)]
+        assert ring[0].flags['C_CONTIGUOUS']
+
+    ring.resize(3)
+    assert list(ring[0]) == [9, 10, 11]
+    ring.append((12, 120))
+    assert list(ring[0]) == [10, 11, 12]
+    ring.resize(8)
+    ring.append((13, 130))
+    assert list(ring[1]) == [100, 110, 120, 130]
+
+    ring.clear()
+    assert len(ring) == 0
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def test_ring_buffer_extend():
+    ring = RingBuffer(5, 2)
+    ring.append((0, 0))
+    ring.extend([[1, 2, 3], [10, 20, 30]])
+    assert list(ring[0]) == [0, 1, 2, 3]
+    ring.extend(np.array([np.arange(4, 12), 10 * np.arange(4, 12)]))
+    assert list(ring[0]) == [7, 8, 9, 10, 11]
+    assert list(ring[1]) == [70, 80, 90, 100, 110]
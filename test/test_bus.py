@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from qtgassol.bus import BusWriter, BusReader
+
+root_dir = os.path.join(os.path.dirname(__file__), '..')
+
+
+def test_bus():
+    name = 'gassol_test_%i' % os.getpid()
+    with BusWriter(name, ['T', 'P'], capacity=4) as writer:
+        with BusReader(name) as reader:
+            assert reader.names == ['T', 'P']
+            assert reader.view()[0].shape == (3, 0)
+
+            for i in range(6):
+                writer.append(100.0 + i, [25.0 + i, -1 if i == 5 else 1000.0])
+            assert reader.index == 6
+            assert reader.seq == 12
+
+            data, index = reader.view(3)
+            assert not data.flags.writeable
+            assert list(data[0]) == [103, 104, 105]
+            assert np.isnan(data[2, -1])
+            assert reader.is_valid(index, 3)
+            writer.append(106.0, [31.0, 1000.0])
+            assert reader.is_valid(index, 3)
+            writer.append(107.0, [32.0, 1000.0])
+            assert not reader.is_valid(index, 3)
+
+            time_array, channels = reader.snapshot()
+            assert list(time_array) == [104, 105, 106, 107]
+            assert list(channels['T']) == [29, 30, 31, 32]
+
+
+def test_bus_other_process():
+    name = 'gassol_test_%i' % os.getpid()
+    with BusWriter(name, ['T', 'P'], capacity=100) as writer:
+        writer.append(100.0, [25.0, 1000.0])
+        code = ('from qtgassol.bus import BusReader; r = BusReader(%r); t, c = r.snapshot(); '
+                'print(t[-1], c["P"][-1]); r.close()' % name)
+        out = subprocess.check_output([sys.executable, '-c', code], cwd=root_dir)
+        assert out.split() == [b'100.0', b'1000.0']
+        # the reader exiting does not remove the shared memory
+        with BusReader(name) as reader:
+            assert reader.index == 1
+
+    with pytest.raises(FileNotFoundError):
+        BusReader(name)
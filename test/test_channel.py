@@ -0,0 +1,41 @@
+import numpy as np
+from qtgassol.device import DummyT, DummyP
+from qtgassol.channel import Channel, ColumnStore, default_channels
+
+
+def test_channel():
+    channels = default_channels(DummyT(), DummyP())
+    assert [ch.label for ch in channels] == ['T(C)', 'P(mbar)']
+    assert channels[0].format(40.2614) == '    40.261'
+    assert channels[1].format(0.234) == '      0.23'
+    assert Channel('T2', 'C', DummyT(), 4).format(1) == '    1.0000'
+
+
+def test_column_store():
+    store = ColumnStore(['T', 'P'], capacity=4)
+    for i in range(10):
+        store.append(100.0 + i, [30.0 + i, 700.0 - i])
+    assert len(store) == 10
+    assert np.all(store.time == 100.0 + np.arange(10))
+    assert np.all(store['T'] == 30.0 + np.arange(10))
+    assert np.all(store['P'] == 700.0 - np.arange(10))
+    timestamp, values = store.row(-1)
+    assert timestamp == 109.0
+    assert list(values) == [39.0, 691.0]
+    assert np.all(store.stamps('P') == store.time)
+
+    store.append(110.0, [40.0, 690.0], [109.5, 110.5])
+    assert list(store.stamps('T')[-2:]) == [109.0, 109.5]
+    assert list(store.stamps('P')[-2:]) == [109.0, 110.5]
+
+
+def test_column_store_window():
+    store = ColumnStore(['T', 'P'], max_len=4)
+    for i in range(10):
+        store.append(100.0 + i, [30.0 + i, 700.0 - i])
+    assert len(store) == 4
+    assert list(store.time) == [106.0, 107.0, 108.0, 109.0]
+    assert list(store['P']) == [694.0, 693.0, 692.0, 691.0]
+    timestamp, values = store.row(0)
+    assert timestamp == 106.0
+    assert list(values) == [36.0, 694.0]
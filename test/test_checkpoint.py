@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import pytest
+from qtgassol.channel import ColumnStore
+from qtgassol.checkpoint import Checkpointer
+
+
+def test_checkpoint(tmp_path):
+    name = str(tmp_path / 'session')
+    store = ColumnStore(['T', 'P'])
+    checkpoint = Checkpointer(name, interval=4)
+    assert not checkpoint.exists
+    for i in range(10):
+        store.append(100.0 + i, [30.0 + i, 700.0 - i], [99.9 + i, 100.1 + i])
+        checkpoint.update(store, {'preset': [[100.0, 30.0], [700.0, 50.0]], 'region': [102.0, 105.0]})
+    # a crash while writing the last point to the journal
+    with open(name + '.journal', 'ab') as f:
+        f.write(np.array([110.0, 40.0]).tobytes()[:12])
+    checkpoint.close()
+
+    checkpoint = Checkpointer(name, interval=4)
+    assert checkpoint.exists
+    restored, state = checkpoint.restore()
+    assert restored.names == ['T', 'P']
+    assert np.all(restored.array() == store.array())
+    assert state == {'preset': [[100.0, 30.0], [700.0, 50.0]], 'region': [102.0, 105.0]}
+    assert checkpoint.count == 10
+
+    # go on from the restored points, keeping only the last 5
+    checkpoint = Checkpointer(name, interval=4)
+    restored, _ = checkpoint.restore(max_len=5)
+    restored.append(110.0, [40.0, 690.0])
+    checkpoint.update(restored)
+    # only the state is updated without a new point
+    checkpoint.update(None, {'region': [106.0, 108.0]})
+    checkpoint.close()
+    restored, state = Checkpointer(name).restore()
+    assert list(restored.time) == [105.0, 106.0, 107.0, 108.0, 109.0, 110.0]
+    assert state == {'region': [106.0, 108.0]}
+
+    with pytest.raises(ValueError):
+        Checkpointer(name).restore(names=['T', 'P', 'T2'])
+
+
+def test_checkpoint_old_journal(tmp_path):
+    # a crash after the snapshot of a restore is replaced but before the journal is,
+    # so the journal has points of the snapshot
+    name = str(tmp_path / 'session')
+    store = ColumnStore(['T'])
+    checkpoint = Checkpointer(name)
+    for i in range(5):
+        store.append(float(i), [float(i)])
+        checkpoint.update(store)
+    checkpoint.close()
+    with open(name + '.journal', 'rb') as f:
+        journal = f.read()
+
+    checkpoint = Checkpointer(name)
+    store, _ = checkpoint.restore()
+    for i in range(5, 7):
+        store.append(float(i), [float(i)])
+        checkpoint.update(store)
+    checkpoint.close()
+    with open(name + '.journal', 'wb') as f:
+        f.write(journal)
+
+    restored, _ = Checkpointer(name).restore()
+    assert list(restored.time) == list(range(5))
+
+
+def test_checkpoint_append_only(tmp_path):
+    # the snapshot is not rewritten in a session, so a point costs the same however many points there are
+    name = str(tmp_path / 'session')
+    store = ColumnStore(['T', 'P'])
+    checkpoint = Checkpointer(name, interval=10)
+    store.append(0.0, [30.0, 700.0])
+    checkpoint.update(store)
+    mtime = os.stat(name + '.npz').st_mtime_ns
+    for i in range(1, 100):
+        store.append(float(i), [30.0, 700.0])
+        checkpoint.update(store)
+    assert os.stat(name + '.npz').st_mtime_ns == mtime
+    assert os.path.getsize(name + '.journal') == (3 + 99 * 5) * 8
+    checkpoint.close()
+
+    restored, _ = Checkpointer(name).restore()
+    assert np.all(restored.array() == store.array())
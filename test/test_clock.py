@@ -0,0 +1,48 @@
+import time
+import pytest
+from qtgassol import clock
+from qtgassol.clock import SimulatedClock
+from qtgassol.device import FlukeThermometer, Thermostat, DummyP
+from qtgassol.emulator import FlukeEmulator
+
+
+@pytest.fixture
+def sim():
+    sim = SimulatedClock(start=1.6E9)
+    previous = clock.set_clock(sim)
+    yield sim
+    clock.set_clock(previous)
+
+
+def test_simulated_clock(sim):
+    assert clock.time() == 1.6E9
+    clock.sleep(3600)
+    assert clock.time() == 1.6E9 + 3600
+    assert clock.now().timestamp() == 1.6E9 + 3600
+
+    press = DummyP()
+    sim.advance(600)
+    assert press.read() < 30
+
+
+def test_simulated_run(sim):
+    # a thermostat program of 10 hours followed by an emulated thermometer, read every minute
+    thermo = Thermostat(None)
+    assert thermo.preset('30, 300, 50; 300, 30')
+    t_end = clock.time() + 10 * 3600
+
+    t0 = time.time()
+    with FlukeEmulator(thermo.get_preset, latency=0.05) as emu:
+        temp = FlukeThermometer(emu.port)
+        values = []
+        while clock.time() < t_end:
+            values.append(temp.read())
+            clock.sleep(60)
+
+    assert time.time() - t0 < 30
+    # the reads take time of the clock as well
+    assert 590 < len(values) <= 600
+    assert temp.n_timeout == 0
+    assert values[0] == pytest.approx(30, abs=0.1)
+    assert values[300] == pytest.approx(50, abs=0.1)
+    assert values[-1] == pytest.approx(30, abs=0.1)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from qtgassol.control import PIController
+
+
+def simulate(control, target=50.0, hours=4, dt=5.0):
+    '''
+    The bath follows the setpoint in 5 min, and the cell follows the bath in 10 min while losing heat to the room
+    '''
+    t_bath = t_cell = 30.0
+    points = []
+    for i in range(int(hours * 3600 / dt)):
+        setpoint = target if control is None else control.update(target, t_cell, i * dt)
+        t_bath += (setpoint - t_bath) / 300 * dt
+        t_cell += ((t_bath - t_cell) / 600 - (t_cell - 20.0) / 6000) * dt
+        points.append((i * dt, setpoint, t_cell))
+    return np.array(points)
+
+
+def test_pi_controller():
+    # open loop, the cell settles with an offset
+    points = simulate(None)
+    assert points[-1, 2] == pytest.approx(47.27, abs=0.01)
+
+    control = PIController(kp=1.0, ki=0.001, max_offset=5.0, rate_limit=2.0)
+    points = simulate(control)
+    assert points[-1, 2] == pytest.approx(50.0, abs=0.01)
+    assert points[-1, 1] == pytest.approx(53.0, abs=0.01)
+    assert np.abs(np.diff(points[:, 1])).max() <= 2.0 / 60 * 5.0 + 1E-9
+    assert points[:, 1].max() <= 55.0
+    assert points[:, 2].max() < 50.5
+
+    # failed reading keeps the setpoint
+    assert control.update(50.0, -1, 4 * 3600) == points[-1, 1]
+
+
+def test_anti_windup():
+    control = PIController(kp=1.0, ki=0.01, max_offset=2.0, rate_limit=None)
+    for i in range(100):
+        assert control.update(50.0, 40.0, i * 10.0) == 52.0
+    # the integral does not grow while the setpoint is limited, so it leaves the limit as soon as T is close
+    assert control.integral == 0
+    assert control.update(50.0, 49.5, 1000.0) < 52.0
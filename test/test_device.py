@@ -56,3 +56,18 @@ def test_thermo_preset():
     assert pytest.approx(thermo.get_preset(time.time() + 2 * 60)) == 34
     assert pytest.approx(thermo.get_preset(time.time() + 20 * 60)) == 40
     assert pytest.approx(thermo.get_preset(time.time() + 31 * 60), abs=0.001) == 15
+
+
+def test_codec():
+    codec = FlukeThermometer.read_codec
+    assert not codec.is_complete(bytearray(b'T\r\nt:   32.7'))
+    assert codec.is_complete(bytearray(b'T\r\nt:   32.728 C\r\n'))
+    assert codec.parse(bytearray(b'T\r\nt:   32.728 C\r\n')) == 32.728
+    with pytest.raises(ValueError):
+        codec.parse(bytearray(b'T\r\nt:   3\x812.728 C\r\n'))
+
+    codec = HuberThermostat.read_codec
+    assert not codec.is_complete(bytearray(b'\x00{S000BB8\r\n'))
+    assert codec.parse(bytearray(b'{S000BB8\r\n')) == 30.0
+    assert codec.parse(bytearray(b'{S00FBE6\r\n')) == -10.5
+    assert HuberThermostat.set_codec.encode(-10.5) == b'FBE6'
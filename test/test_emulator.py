@@ -0,0 +1,122 @@
+import time
+import pytest
+from qtgassol import clock
+from qtgassol.clock import SimulatedClock
+from qtgassol.device import FlukeThermometer, GeManometer, HuberThermostat, JulaboThermostat
+from qtgassol.emulator import FlukeEmulator, GeEmulator, HuberEmulator, JulaboEmulator
+from qtgassol.rig import open_device
+
+
+def test_emulator():
+    with FlukeEmulator(32.728, latency=0.02) as emu:
+        temp = FlukeThermometer(emu.port)
+        assert temp.read() == 32.728
+        assert emu.n_command == 4
+
+    with GeEmulator(lambda t: 962.43) as emu:
+        assert GeManometer(emu.port).read() == 962.43
+
+    with HuberEmulator(25.0) as emu:
+        thermo = HuberThermostat(emu.port)
+        assert thermo.read() == 25.0
+        assert thermo.set(-10.5) == -10.5
+        assert emu.value == -10.5
+        assert thermo.set(420.0) == 420.0
+        assert thermo.set(600.0) == -1
+
+    with JulaboEmulator(20.0) as emu:
+        thermo = JulaboThermostat(emu.port)
+        assert thermo.read() == 20.0
+        assert thermo.set(35.5) == 35.5
+        assert emu.value == 35.5
+
+
+def test_emulator_errors():
+    with FlukeEmulator(30.0, garbage=1.0, seed=0) as emu:
+        temp = FlukeThermometer(emu.port)
+        values = [temp.read() for _ in range(3)]
+        assert emu.n_garbage == 3
+        assert temp.n_parse_error + temp.n_timeout + values.count(30.0) == 3
+
+    with GeEmulator(700.0, latency=0.5) as emu:
+        press = GeManometer(emu.port)
+        assert press.read(timeout=0.2) == -1
+        assert press.n_timeout == 1
+
+
+def test_open_emulated():
+    press = open_device('press', 'emulate')
+    assert press.read() == pytest.approx(1013.0, abs=1)
+    press.emulator.close()
+
+
+def test_reconnect():
+    emu = FlukeEmulator(30.0)
+    emu.start()
+    temp = FlukeThermometer(emu.port)
+    assert temp.read() == 30.0
+
+    # the adapter is unplugged
+    emu.close()
+    assert temp.read() == -1
+    assert temp.n_disconnect == 1
+    previous = clock.set_clock(SimulatedClock())
+    try:
+        # attempts to reopen are spaced by growing intervals
+        assert temp.read() == -1
+        assert temp.read() == -1
+        assert temp._backoff == temp.backoff_min
+
+        # and comes back, here under another name
+        with FlukeEmulator(31.0) as emu:
+            temp.port = emu.port
+            clock.get_clock().advance(temp.backoff_min)
+            assert temp.read() == 31.0
+            assert temp.n_reconnect == 1
+    finally:
+        clock.set_clock(previous)
+
+
+def test_command_queue():
+    with HuberEmulator(25.0, latency=0.2) as emu:
+        thermo = HuberThermostat(emu.port)
+        t0 = time.time()
+        future = thermo.set_async(30.0)
+        assert time.time() - t0 < 0.1
+        assert not future.done()
+
+        # the read is pipelined after the set, and the replies are matched in order
+        assert thermo.read() == 30.0
+        assert future.result() == 30.0
+        assert time.time() - t0 < 0.6
+        assert thermo.set(-10.5) == -10.5
+        assert thermo.set_async(600.0).result() == -1
+        thermo.close()
+
+
+def test_command_queue_port_lost():
+    emu = HuberEmulator(25.0, latency=0.5)
+    emu.start()
+    thermo = HuberThermostat(emu.port)
+    future = thermo.set_async(30.0)
+    assert not future.done()
+
+    # the outstanding requests fail at once when the port is lost, e.g. by another thread
+    thermo.port_lost()
+    assert future.result(0.1) == -1
+    thermo.close()
+    emu.close()
+
+
+def test_command_queue_simulated_clock():
+    previous = clock.set_clock(SimulatedClock())
+    try:
+        with HuberEmulator(25.0) as emu:
+            thermo = HuberThermostat(emu.port)
+            t0 = clock.time()
+            time.sleep(0.2)
+            # polling the port does not move the simulated time
+            assert clock.time() == t0
+            thermo.close()
+    finally:
+        clock.set_clock(previous)
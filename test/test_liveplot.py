@@ -0,0 +1,27 @@
+import pytest
+import numpy as np
+
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from qtgassol.liveplot import BlitPlot
+
+
+def test_blit_plot():
+    fig, (axt, axp) = plt.subplots(2, sharex=True)
+    plot = BlitPlot(fig, axt, axp)
+    np.random.seed(0)
+    xs, ts, ps = [], [], []
+    for i in range(300):
+        xs.append(18600 + i * 5 / 86400)
+        ts.append(30 + np.random.random_sample() * 0.01)
+        ps.append(700 + np.random.random_sample())
+        xs, ts, ps = xs[-150:], ts[-150:], ps[-150:]
+        plot.update(xs, ts, ps, '%9.3f' % ts[-1], '%9.2f' % ps[-1])
+
+    # the background is only redrawn when time gets out of the axis with its margin
+    assert plot.n_draw < 30
+    assert plot.n_draw + plot.n_blit == 300
+    assert axt.get_xlim()[1] >= xs[-1]
+    assert axp.get_ylim()[0] <= min(ps) and axp.get_ylim()[1] >= max(ps)
+    plt.close(fig)
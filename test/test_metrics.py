@@ -0,0 +1,40 @@
+import urllib.request
+from qtgassol.metrics import Metrics, MetricsServer
+
+
+def test_metrics(tmp_path):
+    metrics = Metrics()
+    metrics.set('pressure_mbar', 703.72, 'Last pressure')
+    metrics.set('read_errors_total', 2, 'Failed reads', 'counter', labels={'device': 'T', 'kind': 'timeout'})
+    metrics.set('read_errors_total', 0, 'Failed reads', 'counter', labels={'device': 'P', 'kind': 'timeout'})
+    metrics.set('pressure_mbar', 703.62)
+    metrics.set('channel_value', float('nan'), 'Last value', labels={'channel': 'T2'})
+    metrics.set('channel_value', float('inf'), labels={'channel': 'T3'})
+    metrics.set('channel_value', -float('inf'), labels={'channel': 'T4'})
+
+    lines = metrics.render().splitlines()
+    assert 'gassol_pressure_mbar 703.62' in lines
+    assert '# TYPE gassol_read_errors_total counter' in lines
+    assert 'gassol_read_errors_total{device="T",kind="timeout"} 2.0' in lines
+    assert len([line for line in lines if line.startswith('# HELP gassol_read_errors_total')]) == 1
+    # special values as required by the text format
+    assert 'gassol_channel_value{channel="T2"} NaN' in lines
+    assert 'gassol_channel_value{channel="T3"} +Inf' in lines
+    assert 'gassol_channel_value{channel="T4"} -Inf' in lines
+
+    filename = str(tmp_path / 'gassol.prom')
+    metrics.write_textfile(filename)
+    assert open(filename).read().startswith('# HELP gassol_uptime_seconds')
+
+
+def test_metrics_server():
+    metrics = Metrics()
+    metrics.set('temperature_celsius', 37.985, 'Last temperature')
+    server = MetricsServer(metrics, port=0)
+    server.start()
+    try:
+        with urllib.request.urlopen('http://%s:%i/metrics' % server.address) as response:
+            body = response.read().decode()
+        assert 'gassol_temperature_celsius 37.985' in body.splitlines()
+    finally:
+        server.stop()
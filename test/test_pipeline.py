@@ -0,0 +1,102 @@
+import os
+import io
+import pytest
+import numpy as np
+from qtgassol.pipeline import load_log, load_channels, analyse_file, write_summary, format_time, resample_file, \
+    write_channels, format_stamps
+
+data_dir = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def test_load_log(tmp_path):
+    time_array, t_array, p_array = load_log(os.path.join(data_dir, 'Propane_011220.out'))
+    assert len(time_array) == len(t_array) == len(p_array) == 29505
+    assert format_time(time_array[0]) == '2020-12-01T10:59:36'
+    assert t_array[0] == 40.261
+    assert p_array[0] == 0.23
+
+    # log written by MainUI
+    filename = tmp_path / 'output.txt'
+    filename.write_text('# File opened at 2020-12-01 10:59:36\n'
+                        '20-12-01 10:59:36     40.261       0.23\n'
+                        '# Thermostat preset updated: 40\n'
+                        '20-12-01 10:59:41.5   40.262       0.24\n'
+                        '# Burst triggered at 2020-12-01 10:59:38 by manual\n'
+                        '20-12-01 10:59:38.250     40.262       0.25\n')
+    time_array, t_array, p_array = load_log(filename)
+    assert time_array[1] - time_array[0] == pytest.approx(2.25)
+    assert time_array[2] - time_array[0] == pytest.approx(5.5)
+    assert list(p_array) == [0.23, 0.25, 0.24]
+
+    # extra channels
+    filename.write_text('# Date Time                T(C)    P(mbar)      T2(C)\n'
+                        '20-12-01 10:59:36     40.261       0.23     39.100\n'
+                        '# Burst triggered at 2020-12-01 10:59:36.5 by manual\n'
+                        '20-12-01 10:59:36.500     40.262       0.25\n')
+    time_array, channels = load_channels(filename)
+    assert list(channels) == ['T', 'P', 'T2']
+    assert list(channels['P']) == [0.23, 0.25]
+    assert channels['T2'][0] == 39.1
+    assert np.isnan(channels['T2'][1])
+
+    # a session appended with other channels
+    filename.write_text('# Date Time                T(C)    P(mbar)      T2(C)\n'
+                        '20-12-01 10:59:36     40.261       0.23     39.100\n'
+                        '# File opened at 2020-12-01 11:00:00\n'
+                        '# Date Time                T(C)    P(mbar)   Tbath(C)\n'
+                        '20-12-01 11:00:01     40.262       0.24     41.000\n')
+    time_array, channels = load_channels(filename)
+    assert list(channels) == ['T', 'P', 'T2', 'Tbath']
+    assert list(channels['P']) == [0.23, 0.24]
+    assert channels['T2'][0] == 39.1
+    assert np.isnan(channels['T2'][1])
+    assert np.isnan(channels['Tbath'][0])
+    assert channels['Tbath'][1] == 41.0
+
+
+def test_analyse_file():
+    rows = analyse_file(os.path.join(data_dir, '04Dec2020_SiOSiCmim_TCB_Ar_equil_30degC.out'))
+    assert len(rows) == 1
+    assert rows[0]['P_ave'] == pytest.approx(711, abs=1)
+    assert rows[0]['T_ave'] == pytest.approx(30.3, abs=0.1)
+
+    f = io.StringIO()
+    write_summary(rows, f)
+    lines = f.getvalue().splitlines()
+    assert len(lines) == 2
+    assert len(lines[0].split()) == len(lines[1].split()) + 1
+
+
+def test_resample_file(tmp_path):
+    grid, channels = resample_file(os.path.join(data_dir, 'Propane_011220.out'), 60.0)
+    assert np.all(np.diff(grid) == 60.0)
+    assert format_time(grid[0]) == '2020-12-01T11:00:00'
+    assert channels['T'][0] == pytest.approx(40.26, abs=0.02)
+
+    filename = tmp_path / 'resampled.txt'
+    with open(filename, 'w') as f:
+        write_channels(grid, channels, f)
+    time_array, channels_read = load_channels(filename)
+    assert np.all(time_array == grid)
+    assert np.allclose(channels_read['P'], channels['P'], atol=1E-4)
+
+
+def test_stamps(tmp_path):
+    # T is read 0.2 s before P in every row, and P ramps by 1 per second
+    assert format_stamps(100.4, [100.3, 100.5]).split() == ['#', 'Stamps(ms)', '300', '500']
+    filename = tmp_path / 'output.txt'
+    filename.write_text('# Date Time                T(C)    P(mbar)\n'
+                        '20-12-01 10:00:00     40.000     10.000\n'
+                        + format_stamps(0.5, [0.4, 0.6]) + '\n'
+                        + '20-12-01 10:00:01     40.000     11.000\n'
+                        + format_stamps(1.5, [1.4, 1.6]) + '\n'
+                        + '20-12-01 10:00:02     40.000     12.000\n')
+    time_array, channels, stamps = load_channels(filename, stamps=True)
+    assert list(stamps['T'] - time_array) == pytest.approx([0.4, 0.4, 0.0])
+    assert list(stamps['P'] - time_array) == pytest.approx([0.6, 0.6, 0.0])
+
+    # P is placed at the time it was read
+    grid, channels = resample_file(filename, 0.2)
+    i = np.argmin(np.abs(grid - (time_array[0] + 1.0)))
+    assert grid[i] == pytest.approx(time_array[0] + 1.0)
+    assert channels['P'][i] == pytest.approx(10.4)
@@ -0,0 +1,57 @@
+import time
+import threading
+import pytest
+from qtgassol.profiling import LatencyHistogram, Profiler
+
+
+def test_histogram():
+    hist = LatencyHistogram(size=10)
+    for i in range(20):
+        hist.add(i)
+    assert hist.count == 20
+    assert hist.maximum == 19
+    assert hist.last == 19
+    assert hist.percentile(50) == pytest.approx(14.5)
+
+
+def test_profiler(tmp_path):
+    profiler = Profiler()
+    for i in range(3):
+        with profiler.timer('sleep'):
+            time.sleep(0.01)
+    profiler.count('error T')
+    profiler.count('error T')
+
+    assert profiler.histograms['sleep'].count == 3
+    assert profiler.histograms['sleep'].percentile(50) >= 0.01
+    assert profiler.counters['error T'] == 2
+
+    filename = tmp_path / 'profile.txt'
+    profiler.dump(filename)
+    lines = filename.read_text().splitlines()
+    assert lines[1].split()[:2] == ['sleep', '3']
+    assert lines[-1].split() == ['error', 'T', '2']
+
+
+def test_profiler_threads():
+    # a thread adds new phases while the report is made in another, as with the burst recorder
+    profiler = Profiler()
+    running = True
+
+    def run():
+        i = 0
+        while running:
+            profiler.add('read %i' % (i % 50), 0.001)
+            i += 1
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    try:
+        for _ in range(100):
+            profiler.report()
+            profiler.set_count('timeout T', 1)
+    finally:
+        running = False
+        thread.join()
+    assert profiler.last('read 0') == 0.001
+    assert profiler.last('write') is None
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import queue
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from qtgassol.device import Device, DummyT, DummyP, DummyFile
+from qtgassol.channel import Channel
+from qtgassol.rig import Rig, load_rigs, read_rigs, submit_rig, parse_channel, DetectionError
+
+data_dir = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class SlowDevice(Device):
+    def __init__(self, val, delay):
+        super().__init__()
+        self.val = val
+        self.delay = delay
+
+    def read(self):
+        time.sleep(self.delay)
+        return self.val
+
+
+def test_load_rigs(tmp_path):
+    filename = str(tmp_path / 'rigs.json')
+    with open(filename, 'w') as f:
+        json.dump([{'name': 'cell1', 'temp': 'dummy', 'press': 'dummy', 'output': 'cell1.out',
+                    'channels': ['T2,C,temp,dummy,4']},
+                   {'temp': os.path.join(data_dir, 'Propane_011220.out'),
+                    'press': os.path.join(data_dir, 'Propane_011220.out')}], f)
+
+    rigs = load_rigs(filename)
+    assert [rig.name for rig in rigs] == ['cell1', 'rig1']
+    assert isinstance(rigs[0].thermometer, DummyT)
+    assert isinstance(rigs[0].manometer, DummyP)
+    assert rigs[0].thermostat is None
+    assert [ch.name for ch in rigs[0].channels] == ['T', 'P', 'T2']
+    assert rigs[0].channels[2].device is rigs[0].thermometer
+    assert rigs[1].output == 'rig1.txt'
+    assert isinstance(rigs[1].thermometer, DummyFile)
+    assert rigs[1].thermometer.read() == 40.261
+    assert rigs[1].manometer.read() == 0.23
+
+    with pytest.raises(ValueError):
+        parse_channel('T2,C,temp')
+
+    with open(filename, 'w') as f:
+        json.dump([{'name': 'cell1', 'temp': 'auto'}], f)
+    with pytest.raises(DetectionError):
+        load_rigs(filename)
+
+
+def test_read_rigs():
+    rigs = [Rig('rig%i' % i, SlowDevice(30.0 + i, 0.2), SlowDevice(700.0 + i, 0.2)) for i in range(4)]
+    # the extra channel shares the thermometer, so it is read after T in the same task
+    rigs[0].channels.append(Channel('T2', 'C', rigs[0].thermometer))
+    with ThreadPoolExecutor(8) as executor:
+        t0 = time.time()
+        readings = read_rigs(rigs, executor)
+        assert time.time() - t0 < 0.6
+    # T is read in 0.2 s, then T2 from the same device, so T2 is stamped 0.2 s later
+    stamps = readings[0][2]
+    assert stamps[2] - stamps[0] == pytest.approx(0.2, abs=0.05)
+    assert stamps[0] - t0 == pytest.approx(0.1, abs=0.05)
+    assert readings[0][1] == [30.0, 700.0, 30.0]
+    assert [reading[1] for reading in readings[1:]] == [[30.0 + i, 700.0 + i] for i in range(1, 4)]
+    assert readings[0][3] == pytest.approx([0.2, 0.2, 0.2], abs=0.05)
+
+
+def test_submit_rig():
+    rigs = [Rig('fast', SlowDevice(30.0, 0.01), SlowDevice(700.0, 0.01)),
+            Rig('hung', SlowDevice(31.0, 1.0), SlowDevice(701.0, 0.01))]
+    readings = queue.Queue()
+    with ThreadPoolExecutor(4) as executor:
+        t0 = time.time()
+        for rig in rigs:
+            submit_rig(rig, executor, lambda reading, name=rig.name: readings.put((name, reading)))
+        # the reading of the fast rig does not wait for the hung device
+        assert time.time() - t0 < 0.1
+        name, (_, values, _, durations) = readings.get(timeout=0.5)
+        assert name == 'fast'
+        assert values == [30.0, 700.0]
+        assert readings.empty()
+        name, (_, values, _, durations) = readings.get(timeout=2)
+        assert name == 'hung'
+        assert values == [31.0, 701.0]
+        assert durations[0] == pytest.approx(1.0, abs=0.1)
+
+
+def test_oversampled_rig(tmp_path):
+    filename = str(tmp_path / 'rigs.json')
+    with open(filename, 'w') as f:
+        json.dump([{'name': 'cell1', 'temp': 'dummy', 'press': 'dummy', 'samples': {'T': 4}, 'spread': True,
+                    'channels': ['T2,C,temp,dummy,3,2']}], f)
+    rig = load_rigs(filename)[0]
+    assert [ch.name for ch in rig.channels] == ['T', 'P', 'T2', 'T_std', 'T_min', 'T_max',
+                                                'T2_std', 'T2_min', 'T2_max']
+    assert rig.channels[1].device is rig.manometer
+
+    with ThreadPoolExecutor(4) as executor:
+        _, values, stamps, _ = read_rigs([rig], executor)[0]
+    assert values[3] == pytest.approx(rig.thermometer.stats[1])
+    assert values[4:6] == [rig.thermometer.stats[2], rig.thermometer.stats[3]]
+    assert values[4] <= values[0] <= values[5]
+    assert rig.thermometer.stats[4] == 4
+    assert stamps[3] == rig.thermometer.stamp
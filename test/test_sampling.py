@@ -0,0 +1,108 @@
+from qtgassol.device import Device, DummyT, DummyP
+from qtgassol.channel import Channel
+from qtgassol.sampling import AdaptiveInterval, BurstRecorder, Oversampled, oversample
+
+
+def test_adaptive_interval():
+    adaptive = AdaptiveInterval(1.0, 60.0, [0.002, 0.05], [0.05, 1.0], growth=2.0)
+    timestamp = 0.0
+    intervals = []
+    for i in range(10):
+        intervals.append(adaptive.update(timestamp, [30.0, 700.0]))
+        timestamp += intervals[-1]
+    assert intervals == [2.0, 4.0, 8.0, 16.0, 32.0, 60.0, 60.0, 60.0, 60.0, 60.0]
+
+    # pressure jump, keeps active until it leaves the window for std
+    assert adaptive.update(timestamp, [30.0, 900.0]) == 1.0
+    for i in range(1, 4):
+        assert adaptive.update(timestamp + i, [30.0, 900.0]) == 1.0
+    # errors are ignored
+    assert adaptive.update(timestamp + 4, [-1, 900.0]) == 2.0
+
+    adaptive.dt_max = 3.0
+    assert adaptive.update(timestamp + 7, [30.0, 900.0]) == 3.0
+    assert adaptive.update(timestamp + 10, [30.0, 900.1]) == 3.0
+    assert adaptive.update(timestamp + 13, [30.0, 910.0]) == 1.0
+
+
+def test_burst_recorder():
+    burst = BurstRecorder(None, None, pre_trigger=2.0, post_trigger=3.0, p_step=5.0)
+    for i in range(10):
+        burst.add(i * 0.5, 30.0, 0.3)
+    assert not burst.is_bursting
+    assert burst.latest() == (4.5, 30.0, 0.3)
+    assert burst.oldest() == 2.5
+
+    # pressure step triggers a burst with the points of last 2 seconds
+    burst.add(5.0, 30.0, 100.0)
+    assert burst.is_bursting
+    for i in range(1, 8):
+        burst.add(5.0 + i * 0.5, 30.0, 100.0 + i)
+    assert not burst.is_bursting
+    # the finished burst is kept until popped
+    assert burst.oldest() == 3.0
+
+    bursts = burst.pop_bursts()
+    assert len(bursts) == 1
+    trigger_time, reason, points = bursts[0]
+    assert trigger_time == 5.0
+    assert reason.startswith('P step')
+    assert [point[0] for point in points] == [3.0, 3.5, 4.0, 4.5, 5.0, 5.5, 6.0, 6.5, 7.0, 7.5, 8.0]
+    assert burst.pop_bursts() == []
+    assert burst.oldest() == 8.5
+
+    # manual trigger
+    burst.add(9.0, 30.0, 107.0)
+    burst.trigger()
+    burst.add(9.5, 30.0, 107.0)
+    assert burst.is_bursting
+    assert burst.pop_bursts() == []
+
+
+def test_burst_logged():
+    # the steps of MainUI in burst mode, which log the latest point as a normal row
+    burst = BurstRecorder(None, None, pre_trigger=1.0, post_trigger=1.0, p_step=5.0)
+    burst.add(0.0, 30.0, 0.3)
+    burst.mark_logged(burst.latest()[0])
+    burst.add(0.5, 30.0, 100.0)
+    burst.add(1.0, 30.0, 100.0)
+    burst.add(1.5, 30.0, 100.0)
+    assert not burst.is_bursting
+
+    # the last point of the burst is logged before the burst is written
+    burst.mark_logged(burst.latest()[0])
+    points = burst.pop_bursts()[0][2]
+    assert [point[0] for point in points] == [0.0, 0.5, 1.0, 1.5]
+    assert [burst.is_logged(point[0]) for point in points] == [True, False, False, True]
+
+    # a step right after the burst is popped, when the recorder holds no point
+    assert burst.oldest() is None
+    burst.mark_logged(burst.latest()[0])
+    burst.add(2.0, 30.0, 100.0)
+    burst.mark_logged(burst.latest()[0])
+    assert not burst.is_logged(0.0)
+    assert burst.is_logged(2.0)
+
+
+def test_burst_shared_channels():
+    temp, press, temp2 = DummyT(), DummyP(), DummyT()
+    burst = BurstRecorder(temp, press)
+    channels = [Channel('T2', 'C', oversample(temp, 2)), Channel('T3', 'C', temp2)]
+    assert burst.shared_channels(channels) == channels[:1]
+
+
+def test_oversampled():
+    class Values(Device):
+        def __init__(self, values):
+            super().__init__()
+            self.values = iter(values)
+
+        def read(self):
+            return next(self.values)
+
+    dev = Oversampled(Values([1.0, -1, 3.0, -1, -1, -1]), 3)
+    assert dev.read() == 2.0
+    assert dev.stats == (2.0, 1.0, 1.0, 3.0, 2)
+    assert dev.n_timeout == 0
+    assert dev.read() == -1
+    assert dev.stats is None
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+from qtgassol.timeseries import detect_anomaly_t, detect_anomaly_p, find_anomaly_t, find_anomaly_p, interp_anomaly, \
+    detect_convergence, segment_steps, segment_stats, find_steps, RollingMedian, rolling_filter_p, \
+    RunningStats, EWMA, WindowedStats, resample, common_grid, align_channels
+
+
+def test_find_anomaly():
+    np.random.seed(0)
+    t_array = np.round(30 + np.random.random_sample(500) * 0.01, 3)
+    t_array[[50, 51, 300]] = [29.9, 29.8, 29.5]
+    p_array = 700 + np.random.random_sample(500)
+    p_array[[100, 200]] = [3.0, 120.0]
+
+    neighbours = [-2, -1, 1, 2]
+    idx_t = [i for i in range(2, 498) if detect_anomaly_t(t_array[[i + j for j in neighbours]], t_array[i])]
+    idx_p = [i for i in range(2, 498) if detect_anomaly_p(p_array[[i + j for j in neighbours]], p_array[i])]
+    assert list(find_anomaly_t(t_array)) == idx_t
+    assert list(find_anomaly_p(p_array)) == idx_p
+    assert 300 in idx_t
+    assert idx_p == [100, 200]
+
+    assert len(find_anomaly_t(t_array[:4])) == 0
+
+
+def test_rolling_median():
+    np.random.seed(0)
+    array = np.round(np.random.random_sample(200), 1)
+    for window in [1, 4, 7]:
+        rolling = RollingMedian(window)
+        for i, x in enumerate(array):
+            rolling.update(x)
+            references = array[max(0, i + 1 - window):i + 1]
+            median = np.median(references)
+            assert rolling.median == pytest.approx(median)
+            assert rolling.mad == pytest.approx(np.median(np.abs(references - median)))
+
+
+def test_rolling_filter():
+    np.random.seed(0)
+    p_array = 700 + np.random.random_sample(100)
+    p_array[[30, 60]] = [14.0, 120.0]
+    p_array[80:] -= 600
+
+    flt = rolling_filter_p()
+    idx = [i - 1 for i, p in enumerate(p_array) if flt.check(p)]
+    assert idx == [30, 60]
+
+
+def test_running_stats():
+    np.random.seed(0)
+    array = 1000 + np.random.random_sample(100)
+    stats = RunningStats()
+    for x in array:
+        stats.update(x)
+    assert stats.mean == pytest.approx(np.mean(array))
+    assert stats.std == pytest.approx(np.std(array))
+
+    for x in array[:50]:
+        stats.remove(x)
+    assert stats.mean == pytest.approx(np.mean(array[50:]))
+    assert stats.std == pytest.approx(np.std(array[50:]))
+
+    ewma = EWMA(alpha=0.5)
+    for x in [1.0, 3.0, 3.0]:
+        ewma.update(x)
+    assert ewma.mean == pytest.approx(2.5)
+
+
+def test_windowed_stats():
+    np.random.seed(0)
+    array = 1000 + np.random.random_sample(1000)
+    time_array = np.cumsum(np.random.random_sample(1000) * 10)
+    stats = WindowedStats(60)
+    for i, (timestamp, x) in enumerate(zip(time_array, array)):
+        stats.update(x, timestamp)
+        references = array[:i + 1][time_array[:i + 1] >= timestamp - 60]
+        assert stats.n == len(references)
+        assert stats.mean == pytest.approx(np.mean(references))
+        assert stats.std == pytest.approx(np.std(references), abs=1E-9)
+
+
+def test_interp_anomaly():
+    array = interp_anomaly([1.0, 2.0, 0.0, 4.0, 0.0], [2, 4])
+    assert list(array) == [1.0, 2.0, 3.0, 4.0, 4.0]
+
+
+def test_detect_convergence():
+    array = 500 + 100 * np.exp(-np.arange(200) / 10)
+    idx = detect_convergence(array, window=20, rtol=1E-3, atol=0.05)
+    assert idx == 53
+    assert detect_convergence(array[:50]) == -1
+    assert detect_convergence(np.full(30, 1.0)) == 0
+
+
+def test_segment_steps():
+    np.random.seed(0)
+    decay = 50 * np.exp(-np.arange(100) / 10)
+    array = np.concatenate([np.full(100, 0.3), [100, 500], 1000 + decay, [400], 500 - decay, np.full(100, 500.0)])
+    array += np.round(np.random.random_sample(len(array)) * 0.02, 2)
+
+    bounds = segment_steps(array)
+    assert bounds.tolist() == [[0, 100], [102, 202], [204, 403]]
+
+    mean, std = segment_stats(array, bounds)
+    assert mean == pytest.approx([np.mean(array[start:end]) for start, end in bounds])
+    assert std == pytest.approx([np.std(array[start:end]) for start, end in bounds])
+
+    steps = find_steps(array)
+    assert steps[:, 0].tolist() == [0, 102, 204]
+    assert steps[0, 1] == 0
+    assert steps[1, 1] == 102 + 39
+
+    assert segment_steps([]).shape == (0, 2)
+    assert segment_steps(np.full(10, 1.0)).tolist() == [[0, 10]]
+
+
+def test_segment_stats():
+    array = np.array([1.0, 2.0, 3.0, np.nan, 5.0, 6.0])
+    mean, std = segment_stats(array, [[0, 3], [2, 5], [3, 4]])
+    assert mean[:2] == pytest.approx([2.0, 4.0])
+    assert std[:2] == pytest.approx([np.std([1, 2, 3]), 1.0])
+    assert np.isnan(mean[2])
+
+
+def test_resample():
+    time_array = np.array([0.0, 1.0, 2.0, 6.0])
+    array = np.array([0.0, 10.0, np.nan, 50.0])
+    grid = np.arange(-1.0, 8.0)
+    assert np.allclose(resample(grid, time_array, array), [np.nan, 0, 10, 18, 26, 34, 42, 50, np.nan],
+                       equal_nan=True)
+    assert np.allclose(resample(grid, time_array, array, 'nearest'), [np.nan, 0, 10, 10, 10, 50, 50, 50, np.nan],
+                       equal_nan=True)
+    assert np.allclose(resample(grid, time_array, array, max_gap=2), [np.nan, 0, 10, np.nan, np.nan, np.nan, np.nan,
+                                                                      50, np.nan], equal_nan=True)
+    assert np.allclose(resample(grid, time_array, array, 'nearest', max_gap=1),
+                       [np.nan, 0, 10, 10, np.nan, np.nan, 50, 50, np.nan], equal_nan=True)
+
+    assert list(common_grid([np.array([0.3, 9.0]), np.array([1.0, 7.5])], 2.0)) == [2.0, 4.0, 6.0]
+
+    # T and P read one after the other are aligned onto the same times
+    np.random.seed(0)
+    time_t = np.arange(100) * 5.0 + np.random.random_sample(100)
+    time_p = time_t + 1.5
+    grid, channels = align_channels({'T': time_t, 'P': time_p, 'T2': time_t},
+                                    {'T': 2 * time_t, 'P': 3 * time_p, 'T2': np.full(100, np.nan)}, 5.0)
+    assert grid[0] == 5.0
+    assert np.allclose(channels['T'], 2 * grid)
+    assert np.allclose(channels['P'], 3 * grid)
+    assert np.all(np.isnan(channels['T2']))
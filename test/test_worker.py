@@ -0,0 +1,87 @@
+import time
+import threading
+import pytest
+from qtgassol.device import HuberThermostat
+from qtgassol.emulator import GeEmulator
+from qtgassol.rig import open_device, DetectionError
+from qtgassol.worker import ProcessDevice, ProcessThermostat
+
+
+def test_process_device():
+    thermo = open_device('thermostat', 'emulate', isolate=True)
+    assert isinstance(thermo, ProcessThermostat)
+    assert thermo.timeout == 3 * HuberThermostat.read_timeout
+    assert thermo.read() == 25.0
+    assert thermo.set(-10.5) == -10.5
+    assert thermo.preset('30')
+    assert thermo.get_preset() == 30
+    thermo.close()
+
+    with pytest.raises(DetectionError):
+        ProcessDevice('press', '/dev/nonexistent', open_timeout=10)
+
+
+def test_concurrent_calls():
+    thermo = open_device('thermostat', 'emulate', isolate=True)
+    results = {}
+
+    def work(k):
+        values = [k * 10 + i for i in range(5)]
+        results[k] = values, [thermo.set(val) for val in values]
+
+    threads = [threading.Thread(target=work, args=(k,)) for k in range(1, 3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # every request gets the reply to itself
+    for values, confirmed in results.values():
+        assert confirmed == values
+
+    t0 = time.time()
+    future = thermo.set_async(-10.5)
+    assert time.time() - t0 < 0.05
+    assert future.result(thermo.timeout) == -10.5
+    thermo.close()
+
+
+def test_watchdog():
+    with GeEmulator(962.43, latency=1.5) as emu:
+        press = ProcessDevice('press', emu.port, timeout=0.5, restart_interval=0)
+        t0 = time.time()
+        assert press.read() == -1
+        assert time.time() - t0 < 2
+        assert press.n_watchdog == 1
+
+        # the port is reopened in a new child process, while the requests return -1 at once
+        emu.latency = 0
+        values = []
+        while len(values) < 50 and 962.43 not in values:
+            values.append(press.read())
+            time.sleep(0.1)
+        assert values[-1] == 962.43
+        assert press.n_restart >= 1
+        press.close()
+
+
+def test_restart_interval():
+    with GeEmulator(962.43, latency=1.5) as emu:
+        press = ProcessDevice('press', emu.port, timeout=0.5, restart_interval=1.0)
+        assert press.read() == -1
+        assert press.n_watchdog == 1
+
+        # not restarted until restart_interval after the kill
+        emu.latency = 0
+        t0 = time.time()
+        while time.time() - t0 < 0.8:
+            assert press.read() == -1
+            time.sleep(0.1)
+        assert press.n_restart == 0
+
+        values = []
+        while len(values) < 50 and 962.43 not in values:
+            values.append(press.read())
+            time.sleep(0.1)
+        assert values[-1] == 962.43
+        assert press.n_restart == 1
+        press.close()